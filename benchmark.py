@@ -0,0 +1,268 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+import helper
+from database_repository import STOCK_DATA_SCHEMA, DatabaseRepository, to_epoch_seconds
+from data_handlers.historic_db_data_handler import HistoricDBDataHandler
+from events.event_bus import DequeEventBus
+from filters import StockFilter
+from loop import BacktestDependencies, backtest
+from main import consume_data_needed_for_filter, initialize_execution_handler
+from portfolio import NaivePortfolio
+from rollup_tables import create_rollup_tables, refresh_rollups
+from sweep import STRATEGIES
+
+
+STAGES = [
+    'iter_stock_data_records', 'prepare_bar_arrays',
+    'consume_data_needed_for_filter', 'backtest', 'summary_stats', 'charts_and_export',
+]
+
+
+def create_synthetic_database(db_path, num_symbols, start_date, end_date, seed, rollups=False):
+    """
+    Creates the stocks and stock_data_5m tables DatabaseRepository reads and fills them with a random walk
+    of 5 minute bars over the market hours of every weekday between start_date and end_date.
+    Bar times are stored in the integer epoch layout of migrate_stock_data.py the way the data handler
+    expects them, i.e. one hour early inside the DST window. With rollups the rollup tables are built as well.
+    """
+    rng = np.random.default_rng(seed)
+    db_conn = sqlite3.connect(db_path)
+    db_cursor = db_conn.cursor()
+    db_cursor.execute("""
+        CREATE TABLE stocks (id INTEGER PRIMARY KEY, symbol TEXT UNIQUE, name TEXT, stock_float REAL,
+                             is_blacklisted INTEGER DEFAULT 0, created_at TEXT, modified_at TEXT)""")
+    db_cursor.execute(STOCK_DATA_SCHEMA.format(table_name="stock_data_5m"))
+
+    market_open = datetime.strptime(helper.MKT_OPEN_TIME, '%H:%M:%S')
+    bars_per_day = helper.get_expected_number_of_bars_per_day(bar_granularity_in_seconds=300)
+    dst_start = datetime.strptime(config.dst_date_change_start, "%Y-%m-%d").date()
+    dst_end = datetime.strptime(config.dst_date_change_end, "%Y-%m-%d").date()
+
+    bar_times = []
+    day = start_date
+    while day < end_date:
+        if day.weekday() < 5:
+            first_bar = day.replace(hour=market_open.hour, minute=market_open.minute, second=0)
+            if dst_start <= day.date() <= dst_end:
+                first_bar -= timedelta(hours=1)
+            bar_times.extend(to_epoch_seconds(first_bar + timedelta(minutes=5 * i)) for i in range(bars_per_day))
+        day += timedelta(days=1)
+    num_bars = len(bar_times)
+
+    for stock_id in range(1, num_symbols + 1):
+        symbol = f"SYN{stock_id:04d}"
+        db_cursor.execute(
+            "INSERT INTO stocks VALUES (?, ?, ?, ?, 0, datetime('now'), datetime('now'))",
+            (stock_id, symbol, symbol, float(rng.uniform(1e6, 1e8)))
+        )
+
+        # log returns of the bars plus an opening gap on the first bar of every day, so the gap up filter has candidates
+        returns = rng.normal(0.0002, 0.008, num_bars)
+        gaps = np.zeros(num_bars)
+        gaps[::bars_per_day] = rng.normal(0.01, 0.03, len(gaps[::bars_per_day]))
+        log_closes = np.log(rng.uniform(5, 100)) + np.cumsum(returns + gaps)
+        closes = np.exp(log_closes)
+        opens = np.exp(log_closes - returns)
+        highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.004, num_bars))
+        lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.004, num_bars))
+        volumes = rng.integers(1000, 5000, num_bars)
+        volumes[::bars_per_day] *= rng.integers(1, 4, len(volumes[::bars_per_day]))  # busier opening bars
+
+        db_cursor.executemany(
+            "INSERT INTO stock_data_5m (stock_id, ts, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            zip([stock_id] * num_bars, bar_times, opens.round(4).tolist(), highs.round(4).tolist(),
+                lows.round(4).tolist(), closes.round(4).tolist(), volumes.tolist())
+        )
+
+    if rollups:
+        create_rollup_tables(db_conn)
+        refresh_rollups(db_conn)
+
+    db_conn.commit()
+    db_conn.close()
+
+
+def run_pipeline(db_path, strategy_name, backtest_end_date):
+    """
+    Runs one backtest on the synthetic database the way main() does, timing each stage separately.
+    Returns {stage: seconds} and the number of symbols and trades of the run.
+    """
+    timings = {}
+
+    def timed(stage, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        timings[stage] = time.perf_counter() - started
+        return result
+
+    bar_granularity = helper.convert_bar_granularity_to_seconds(config.bar_granularity)
+    cutoff_time = datetime.strptime(config.daily_cutoff_time_str or helper.DAILY_TRADING_END_TIME, "%H:%M")
+    backtest_start_date = helper.get_weekday_before(backtest_end_date, config.backtest_time_period)
+    last_timestamp_before_backtest = helper.get_weekday_before(backtest_start_date, 1).replace(hour=cutoff_time.hour, minute=cutoff_time.minute)
+    hist_data_start = helper.get_weekday_before(backtest_end_date, config.backtest_time_period + config.filter_long_sma)
+
+    database_repository = DatabaseRepository(db_path)
+    events = DequeEventBus()
+    data_handler = HistoricDBDataHandler(events, database_repository.get_stocks(), database_repository, bar_granularity)
+    portfolio = NaivePortfolio(data_handler, events, 'ema', filename="benchmark")
+    strategy = STRATEGIES[strategy_name](data_handler, events, portfolio, cutoff_time=60 - cutoff_time.minute)
+    portfolio.strategy_name = strategy.name
+    execution_handler = initialize_execution_handler(events, True, strategy, None)
+
+    data_handler.fetch_float_data()
+    stock_filter = None
+    if config.is_filter_enabled:
+        stock_filter = StockFilter(
+            data_handler, cutoff_time, sma_long_period=config.filter_long_sma, sma_short_period=config.filter_short_sma, bar_granularity=bar_granularity
+        )
+        data_handler.symbol_list = stock_filter.float_filter()
+        data_handler.symbol_list_active = data_handler.symbol_list
+
+    # the steps of fetch_historical_ohlcv_data one by one
+    data_handler.full_trading_days = helper.get_full_trading_days(hist_data_start, backtest_end_date)
+    # the records are streamed into the aggregation one symbol at a time there, here they are read in full to time both steps
+    symbol_records = timed('iter_stock_data_records', lambda: list(database_repository.iter_stock_data_records(hist_data_start, backtest_end_date, data_handler.symbol_list, bar_granularity=bar_granularity)))
+    bar_arrays = timed('prepare_bar_arrays', data_handler.prepare_bar_arrays, symbol_records, hist_data_start, backtest_end_date)
+    data_handler.load_bar_arrays(bar_arrays)
+    if len(data_handler.symbol_list) == 0:
+        raise Exception("No stocks available after initial data fetch.")
+    strategy.post_data_fetch_setup()
+
+    timed('consume_data_needed_for_filter', consume_data_needed_for_filter, data_handler, events, last_timestamp_before_backtest)
+
+    backtest_dependencies = BacktestDependencies(
+        events=events,
+        data=data_handler,
+        portfolio=portfolio,
+        strategy=strategy,
+        execution_handler=execution_handler,
+        stock_filter=stock_filter,
+        tickers=data_handler.symbol_list,
+        bar_size_in_sec=bar_granularity,
+        is_backtest=True,
+        generate_reports=False
+    )
+    timed('backtest', backtest, backtest_dependencies)
+    timed('summary_stats', portfolio.summary_stats, bar_granularity)
+
+    def charts_and_export():
+        strategy.strategy_performance()
+        strategy.plot()
+        if config.plot_performance_graph:
+            portfolio.plot_all()
+        strategy.plot_candlestick()
+
+    timed('charts_and_export', charts_and_export)
+
+    return timings, len(data_handler.symbol_list), len(strategy.trades)
+
+
+def run_benchmark(num_symbols, num_days, strategy_name='orb', repeat=1, seed=7, rollups=False):
+    """
+    Builds a throwaway database with num_symbols symbols covering num_days backtest days plus the filter history,
+    then runs the pipeline repeat times inside a temporary directory. Each stage reports its fastest run.
+    """
+    if not helper.IS_BACKTEST:
+        raise Exception("Benchmarks are only available for backtests.")
+
+    backtest_end_date = datetime.strptime(config.backtest_end_date_str, "%Y-%m-%d %H:%M:%S")
+    config.backtest_time_period = num_days
+    config.enable_bar_cache = False
+    data_start_date = helper.get_weekday_before(backtest_end_date, num_days + config.filter_long_sma + 5)
+
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="algotrading_benchmark_") as benchmark_dir:
+        db_path = os.path.join(benchmark_dir, "benchmark.db")
+        started = time.perf_counter()
+        create_synthetic_database(db_path, num_symbols, data_start_date, backtest_end_date, seed, rollups)
+        logging.warning(f"Created synthetic database with {num_symbols} symbols in {time.perf_counter() - started:.1f}s")
+
+        # reports and charts of the runs go to the temporary directory
+        os.chdir(benchmark_dir)
+        try:
+            runs = []
+            for _ in range(repeat):
+                runs.append(run_pipeline(db_path, strategy_name, backtest_end_date))
+        finally:
+            os.chdir(working_dir)
+
+    stages = {stage: min(timings[stage] for timings, _, _ in runs) for stage in STAGES}
+    _, symbols_traded, trades = runs[-1]
+    return {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'parameters': {
+            'symbols': num_symbols, 'days': num_days, 'strategy': strategy_name, 'repeat': repeat, 'seed': seed, 'rollups': rollups,
+            'bar_granularity': config.bar_granularity, 'backtest_engine': 'event', 'is_filter_enabled': config.is_filter_enabled,
+        },
+        'symbols_after_data_fetch': symbols_traded,
+        'trades': trades,
+        'stages': stages,
+        'total_sec': sum(stages.values()),
+    }
+
+
+def compare_with_baseline(results, baseline, tolerance_percentage):
+    """
+    Prints the change of every stage against the baseline and returns the stages that got slower
+    by more than tolerance_percentage.
+    """
+    if results['parameters'] != baseline['parameters']:
+        logging.warning(f"Benchmark parameters differ from the baseline: {baseline['parameters']}")
+
+    regressions = []
+    print(f"{'stage':<42}{'baseline (s)':>14}{'current (s)':>14}{'change':>10}")
+    for stage in STAGES + ['total_sec']:
+        current = results['stages'].get(stage) if stage != 'total_sec' else results['total_sec']
+        previous = baseline['stages'].get(stage) if stage != 'total_sec' else baseline['total_sec']
+        if current is None or previous is None:
+            continue
+        change = (current - previous) / previous * 100 if previous > 0 else 0
+        flag = ""
+        if change > tolerance_percentage and stage != 'total_sec':
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage:<42}{previous:>14.4f}{current:>14.4f}{change:>9.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each stage of a backtest on a synthetic database.")
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--days', type=int, default=10, help='backtest days, the filter history is added on top')
+    parser.add_argument('--strategy', choices=STRATEGIES.keys(), default='orb')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per stage, the fastest one is reported')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--rollups', action='store_true', help='build the rollup tables, so the bars are read from them')
+    parser.add_argument('--output', default="performance/benchmark_results.json", help='where the results are written, e.g. a new baseline file')
+    parser.add_argument('--baseline', default=None, help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=25, help='percentage a stage may get slower than the baseline')
+    args = parser.parse_args()
+
+    # per bar info logging would dominate the timings
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run_benchmark(args.symbols, args.days, args.strategy, args.repeat, args.seed, args.rollups)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results['stages'], indent=2))
+    print(f"Benchmark results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare_with_baseline(results, baseline, args.tolerance):
+            raise SystemExit(1)
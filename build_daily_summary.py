@@ -0,0 +1,52 @@
+import argparse
+import logging
+import sqlite3
+
+import config
+from daily_summary import DAILY_SUMMARY_TABLE, create_daily_summary_table, drop_daily_summary_table, refresh_daily_summary
+from database_repository import get_stock_data_time_column
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def build_daily_summary(engine_name, drop=False):
+    """
+    Creates stock_daily_summary and summarizes all 5 minute bars into it in one transaction, with the market
+    hours, DST dates and DAILY_SUMMARY_WINDOWS of the configuration, which are stored with the table.
+    database_population_ohlcv.py and fill_missing_bars.py keep the table up to date afterwards with them,
+    running this again rebuilds it. With drop the table is removed.
+    """
+    db_conn = sqlite3.connect(engine_name)
+    try:
+        if get_stock_data_time_column(db_conn) != 'ts':
+            logging.error(f"stock_data_5m in {engine_name} uses text dates, run migrate_stock_data.py first")
+            return
+
+        db_conn.execute("BEGIN")
+        drop_daily_summary_table(db_conn)
+        if not drop:
+            create_daily_summary_table(db_conn, config.mkt_open_time, config.mkt_close_time, config.dst_date_change_start,
+                                       config.dst_date_change_end, config.daily_summary_windows)
+            refresh_daily_summary(db_conn)
+        db_conn.commit()
+
+        if not drop:
+            rows = db_conn.execute(f"SELECT COUNT(*) FROM {DAILY_SUMMARY_TABLE}").fetchone()[0]
+            logging.info(f"{DAILY_SUMMARY_TABLE} in {engine_name} has {rows} rows for the windows {config.daily_summary_windows}")
+
+    except Exception as e:
+        db_conn.rollback()
+        logging.error("Error building the daily summary: %s", e)
+        raise
+
+    finally:
+        db_conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the stock_daily_summary table of the stock filters from stock_data_5m.")
+    parser.add_argument('database', nargs='?', default=None, help='defaults to DB_MANAGEMENT_ENGINE_NAME, then SQLITE_ENGINE_NAME')
+    parser.add_argument('--drop', action='store_true', help='remove the table instead')
+    args = parser.parse_args()
+
+    build_daily_summary(args.database or config.db_management_engine_name or config.engine_name, drop=args.drop)
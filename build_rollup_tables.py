@@ -0,0 +1,53 @@
+import argparse
+import logging
+import sqlite3
+
+import config
+from database_repository import get_stock_data_time_column
+from rollup_tables import ROLLUP_TABLES, create_rollup_tables, get_rollup_tables, refresh_rollups
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def build_rollup_tables(engine_name, drop=False):
+    """
+    Creates the rollup tables of stock_data_5m (stock_data_10m up to stock_data_1d) and aggregates all
+    5 minute bars into them in one transaction. database_population_ohlcv.py and fill_missing_bars.py keep
+    the tables up to date afterwards, running this again rebuilds them. With drop the tables are removed,
+    so DatabaseRepository reads stock_data_5m again.
+    """
+    db_conn = sqlite3.connect(engine_name)
+    try:
+        if get_stock_data_time_column(db_conn) != 'ts':
+            logging.error(f"stock_data_5m in {engine_name} uses text dates, run migrate_stock_data.py first")
+            return
+
+        db_conn.execute("BEGIN")
+        if drop:
+            for table_name in ROLLUP_TABLES.values():
+                db_conn.execute(f"DROP TABLE IF EXISTS {table_name}")
+        else:
+            create_rollup_tables(db_conn)
+            refresh_rollups(db_conn)
+        db_conn.commit()
+
+        for table_name in get_rollup_tables(db_conn).values():
+            rows = db_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+            logging.info(f"{table_name} in {engine_name} has {rows} rows")
+
+    except Exception as e:
+        db_conn.rollback()
+        logging.error("Error building rollup tables: %s", e)
+        raise
+
+    finally:
+        db_conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the 10m, 15m, 30m, 1h and daily rollup tables of stock_data_5m.")
+    parser.add_argument('database', nargs='?', default=None, help='defaults to DB_MANAGEMENT_ENGINE_NAME, then SQLITE_ENGINE_NAME')
+    parser.add_argument('--drop', action='store_true', help='remove the rollup tables instead')
+    args = parser.parse_args()
+
+    build_rollup_tables(args.database or config.db_management_engine_name or config.engine_name, drop=args.drop)
@@ -22,6 +22,12 @@ mkt_open_time = os.getenv('MKT_OPEN_TIME', '15:30:00')
 mkt_close_time = os.getenv('MKT_CLOSE_TIME', '22:00:00')
 daily_trading_end_time = os.getenv('DAILY_TRADING_END_TIME', '21:00')  ## should be included in the time steps of the chosen bar granularity
 is_backtest = os.getenv('IS_BACKTEST', '1') == '1' # '1' for True, '0' for False
+backtest_engine = os.getenv('BACKTEST_ENGINE', 'event')  # 'event', 'vectorized' or 'sharded'
+backtest_processes = int(os.getenv('BACKTEST_PROCESSES', '0'))  # worker processes of the sharded engine, 0 means one per core
+history_depth_bars = int(os.getenv('HISTORY_DEPTH_BARS', '10000'))  # bars kept per symbol by the live data handler
+enable_bar_cache = os.getenv('ENABLE_BAR_CACHE', '1') == '1'  # reuse fetched and aggregated backtest bars from disk
+bar_cache_dir = os.getenv('BAR_CACHE_DIR', 'cache')
+bar_file_dir = os.getenv('BAR_FILE_DIR', '')  # backtests read the 5 minute bars from this bar file store instead of the database if set
 
 
 filter_float_limit = int(os.getenv('FILTER_FLOAT_LIMIT', '100000'))
@@ -31,6 +37,8 @@ filter_sma_close_multiplier = float(os.getenv('FILTER_SMA_CLOSE_MULTIPLIER', '1.
 filter_daily_performance_criteria = os.getenv('FILTER_DAILY_PERFORMANCE_CRITERIA', 'Strong')
 enable_gap_up_filter = os.getenv('ENABLE_FILTER_GAP_UP', '0') == '1'
 filter_gap_up_percentage = float(os.getenv('FILTER_GAP_UP_PERCENTAGE', '10'))
+use_daily_summary = os.getenv('USE_DAILY_SUMMARY', '0') == '1'  # filters read their history from stock_daily_summary instead of intraday bars
+daily_summary_windows = [int(window) for window in os.getenv('DAILY_SUMMARY_WINDOWS', '5,10,15,30,60').split(',')]  # opening windows in minutes
 
 
 initial_capital = float(os.getenv('INITIAL_CAPITAL', '100000'))
@@ -54,4 +62,6 @@ reward_risk_ratio = float(os.getenv('REWARD_RISK_RATIO', '3.0'))
 opening_range_window_bars = int(os.getenv('OPENING_RANGE_WINDOW_BARS', '3'))
 enable_vwap_entry_condition = os.getenv('ENABLE_VWAP_ENTRY_CONDITION', '0') == '1'
 
-plot_performance_graph = os.getenv('PLOT_PERFORMANCE_GRAPH', '1') == '1'
\ No newline at end of file
+plot_performance_graph = os.getenv('PLOT_PERFORMANCE_GRAPH', '1') == '1'
+enable_event_loop_profiling = os.getenv('ENABLE_EVENT_LOOP_PROFILING', '1') == '1'  # per event type and stage timings of the event loop, written next to the performance files
+enable_plot_annotations = os.getenv('ENABLE_PLOT_ANNOTATIONS', '1') == '1'  # record chart values during the backtest for the candlestick charts and all_data files
\ No newline at end of file
@@ -0,0 +1,75 @@
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+
+# memory-mapped I/O of up to 1 GiB of the database file instead of read() calls into the page cache
+MMAP_SIZE = 1024 * 1024 * 1024
+# page cache of each connection in KiB (negative cache_size values are KiB instead of pages)
+CACHE_SIZE_KIB = 256 * 1024
+# prepared statements kept per connection, queries with the same SQL text are not compiled again
+CACHED_STATEMENTS = 256
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections of one database, one per thread (sqlite3 connections must not be
+    shared between threads) and reopened after a fork, so worker processes never use the parent's.
+
+    Connections are opened on first use with read-optimized pragmas: WAL journaling so readers do not
+    block the population scripts writing to the database, memory-mapped I/O, a large page cache and
+    temporary tables in memory. Each connection keeps its compiled statements for reuse and runs in
+    autocommit mode, so no transaction stays open between queries. With read_only the database file is
+    opened read-only (temporary tables still work).
+    """
+    def __init__(self, engine_name, mmap_size=MMAP_SIZE, cache_size_kib=CACHE_SIZE_KIB, read_only=False):
+        self.engine_name = engine_name
+        self.read_only = read_only
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        if self.pid != os.getpid():
+            # connections inherited through fork belong to the parent process
+            self.pid = os.getpid()
+            self.local = threading.local()
+            self.connections = []
+
+        db_conn = getattr(self.local, 'connection', None)
+        if db_conn is None:
+            db_conn = self._connect()
+            self.local.connection = db_conn
+            with self.lock:
+                self.connections.append(db_conn)
+        return db_conn
+
+    def _connect(self):
+        # check_same_thread=False only so close() can close the connections of all threads
+        if self.read_only:
+            db_conn = sqlite3.connect(pathlib.Path(self.engine_name).resolve().as_uri() + "?mode=ro", uri=True, isolation_level=None,
+                                      cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        else:
+            db_conn = sqlite3.connect(self.engine_name, isolation_level=None, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+            try:
+                # persistent setting of the database file, needs write access once
+                db_conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.Error as e:
+                logging.warning("Could not enable WAL journaling for %s: %s", self.engine_name, e)
+        db_conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        db_conn.execute(f"PRAGMA cache_size={-int(self.cache_size_kib)}")
+        db_conn.execute("PRAGMA temp_store=MEMORY")
+        return db_conn
+
+    def close(self):
+        # closes the connections of all threads of this process
+        with self.lock:
+            if self.pid == os.getpid():
+                for db_conn in self.connections:
+                    db_conn.close()
+            self.connections = []
+        self.local = threading.local()
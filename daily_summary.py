@@ -0,0 +1,183 @@
+import logging
+
+from database_repository import to_epoch_seconds
+
+DAILY_SUMMARY_TABLE = "stock_daily_summary"
+DAILY_SUMMARY_PARAMETERS_TABLE = "stock_daily_summary_parameters"
+
+# One row per stock, session day and opening window of window_minutes. open, high, low and close are those of the
+# session (the bars from MKT_OPEN_TIME up to MKT_CLOSE_TIME), window_volume, window_high and window_low those of the
+# bars of the first window_minutes of the session. bar_count counts the bars from market open up to and including
+# market close, the number the data handlers check against the expected bars of a day.
+# Bar times are DST adjusted the way the data handlers adjust them, so the table has to be rebuilt with
+# build_daily_summary.py when MKT_OPEN_TIME, MKT_CLOSE_TIME, the DST dates or DAILY_SUMMARY_WINDOWS change.
+# The values the table was built with are stored in DAILY_SUMMARY_PARAMETERS_SCHEMA, so the population
+# scripts refresh it the same way without the backtest configuration.
+DAILY_SUMMARY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table_name} (
+    stock_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    window_minutes INTEGER NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    bar_count INTEGER NOT NULL,
+    window_volume INTEGER NOT NULL,
+    window_high REAL,
+    window_low REAL,
+    PRIMARY KEY (stock_id, day, window_minutes)
+    ) WITHOUT ROWID;
+    """
+
+# single row, DST dates may be NULL and windows is a comma separated list of window minutes
+DAILY_SUMMARY_PARAMETERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table_name} (
+    market_open_time TEXT NOT NULL,
+    market_close_time TEXT NOT NULL,
+    dst_date_change_start TEXT,
+    dst_date_change_end TEXT,
+    windows TEXT NOT NULL
+    );
+    """
+
+
+def create_daily_summary_table(db_conn, market_open_time, market_close_time, dst_date_change_start, dst_date_change_end, window_minutes):
+    db_conn.execute(DAILY_SUMMARY_SCHEMA.format(table_name=DAILY_SUMMARY_TABLE))
+    db_conn.execute(DAILY_SUMMARY_PARAMETERS_SCHEMA.format(table_name=DAILY_SUMMARY_PARAMETERS_TABLE))
+    db_conn.execute(f"DELETE FROM {DAILY_SUMMARY_PARAMETERS_TABLE}")
+    db_conn.execute(
+        f"INSERT INTO {DAILY_SUMMARY_PARAMETERS_TABLE} (market_open_time, market_close_time, dst_date_change_start, dst_date_change_end, windows) VALUES (?, ?, ?, ?, ?)",
+        (market_open_time, market_close_time, dst_date_change_start or None, dst_date_change_end or None, ",".join(str(int(window)) for window in window_minutes))
+    )
+
+
+def drop_daily_summary_table(db_conn):
+    db_conn.execute(f"DROP TABLE IF EXISTS {DAILY_SUMMARY_TABLE}")
+    db_conn.execute(f"DROP TABLE IF EXISTS {DAILY_SUMMARY_PARAMETERS_TABLE}")
+
+
+def has_daily_summary_table(db_conn):
+    return db_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DAILY_SUMMARY_TABLE,)).fetchone() is not None
+
+
+def get_daily_summary_parameters(db_conn):
+    # (market open, market close, DST start, DST end, window minutes) the table was built with, None without them
+    if db_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (DAILY_SUMMARY_PARAMETERS_TABLE,)).fetchone() is None:
+        return None
+    row = db_conn.execute(f"SELECT market_open_time, market_close_time, dst_date_change_start, dst_date_change_end, windows FROM {DAILY_SUMMARY_PARAMETERS_TABLE}").fetchone()
+    if row is None:
+        return None
+    return row[0], row[1], row[2], row[3], [int(window) for window in row[4].split(',')]
+
+
+def get_seconds_of_day(time_string):
+    hours, minutes, seconds = (int(part) for part in time_string.split(':'))
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def refresh_daily_summary(db_conn, stock_id=None, start_ts=None, end_ts=None, source_table_name="stock_data_5m"):
+    """
+    Summarizes the 5 minute bars of the integer epoch layout into stock_daily_summary, if the database has the table,
+    with one INSERT ... SELECT over the bars of the session of every stock and day, using the market hours, DST dates
+    and windows stored by create_daily_summary_table.
+
+    Only the days of stock_id (all stocks if None) between start_ts and end_ts (epoch seconds, all days if None)
+    are deleted and summarized again, so the population scripts can keep the table up to date after inserting
+    new bars. Runs in the transaction of the caller, who commits.
+    """
+    if not has_daily_summary_table(db_conn):
+        return
+
+    summary_parameters = get_daily_summary_parameters(db_conn)
+    if summary_parameters is None:
+        logging.warning("%s has no stored parameters, rebuild it with build_daily_summary.py", DAILY_SUMMARY_TABLE)
+        return
+    market_open_time, market_close_time, dst_date_change_start, dst_date_change_end, window_minutes_list = summary_parameters
+
+    conditions = []
+    day_conditions = []
+    parameters = {
+        'market_open': get_seconds_of_day(market_open_time),
+        'market_close': get_seconds_of_day(market_close_time),
+        # stored bar times of the DST days, None (no DST adjustment) without DST dates
+        'dst_start_ts': to_epoch_seconds(f"{dst_date_change_start} 00:00:00") if dst_date_change_start else None,
+        'dst_end_ts': to_epoch_seconds(f"{dst_date_change_end} 23:59:59") if dst_date_change_end else None,
+    }
+    if stock_id is not None:
+        conditions.append("stock_id = :stock_id")
+        day_conditions.append("stock_id = :stock_id")
+        parameters['stock_id'] = stock_id
+    if start_ts is not None and end_ts is not None:
+        # whole days, also the bars of the first and last day outside the range
+        conditions.append("ts BETWEEN :start_ts AND :end_ts")
+        day_conditions.append("day BETWEEN date(:start_ts, 'unixepoch') AND date(:end_ts, 'unixepoch')")
+        parameters['start_ts'] = start_ts // 86400 * 86400
+        parameters['end_ts'] = end_ts // 86400 * 86400 + 86399
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    day_where = f"WHERE {' AND '.join(day_conditions)}" if day_conditions else ""
+    windows = ", ".join(f"({int(window_minutes)})" for window_minutes in window_minutes_list)
+
+    db_conn.execute(f"DELETE FROM {DAILY_SUMMARY_TABLE} {day_where}", parameters)
+    # the DST days of the data handlers are the days of the stored bar times, their bars move one hour later
+    db_conn.execute(f"""
+        WITH windows(window_minutes) AS (VALUES {windows}),
+        session_bars AS (
+            SELECT
+            stock_id,
+            ts,
+            ts / 86400 AS day,
+            (ts + CASE WHEN ts BETWEEN :dst_start_ts AND :dst_end_ts THEN 3600 ELSE 0 END) % 86400 AS second_of_day,
+            high,
+            low,
+            volume
+            FROM {source_table_name}
+            {where}
+        ),
+        days AS (
+            SELECT
+            stock_id,
+            day,
+            MIN(ts) FILTER (WHERE second_of_day < :market_close) AS first_ts,
+            MAX(ts) FILTER (WHERE second_of_day < :market_close) AS last_ts,
+            MAX(high) FILTER (WHERE second_of_day < :market_close) AS high,
+            MIN(low) FILTER (WHERE second_of_day < :market_close) AS low,
+            COUNT(*) AS bar_count
+            FROM session_bars
+            WHERE second_of_day BETWEEN :market_open AND :market_close
+            GROUP BY stock_id, day
+        ),
+        window_bars AS (
+            SELECT
+            b.stock_id,
+            b.day,
+            w.window_minutes,
+            SUM(b.volume) AS volume,
+            MAX(b.high) AS high,
+            MIN(b.low) AS low
+            FROM session_bars b
+            JOIN windows w
+            ON b.second_of_day < :market_open + w.window_minutes * 60
+            WHERE b.second_of_day >= :market_open
+            GROUP BY b.stock_id, b.day, w.window_minutes
+        )
+        INSERT INTO {DAILY_SUMMARY_TABLE} (stock_id, day, window_minutes, open, high, low, close, bar_count, window_volume, window_high, window_low)
+        SELECT
+        d.stock_id,
+        date(d.day * 86400, 'unixepoch'),
+        w.window_minutes,
+        (SELECT f.open FROM {source_table_name} f WHERE f.stock_id = d.stock_id AND f.ts = d.first_ts),
+        d.high,
+        d.low,
+        (SELECT l.close FROM {source_table_name} l WHERE l.stock_id = d.stock_id AND l.ts = d.last_ts),
+        d.bar_count,
+        COALESCE(wb.volume, 0),
+        wb.high,
+        wb.low
+        FROM days d
+        CROSS JOIN windows w
+        LEFT JOIN window_bars wb
+        ON wb.stock_id = d.stock_id AND wb.day = d.day AND wb.window_minutes = w.window_minutes
+        ORDER BY d.stock_id, d.day, w.window_minutes
+        """, parameters)
+    logging.debug("Refreshed %s for stock %s from %s to %s", DAILY_SUMMARY_TABLE, stock_id, start_ts, end_ts)
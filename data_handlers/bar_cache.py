@@ -0,0 +1,81 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from data_handlers.types.bar_arrays import BarArrays
+
+
+class BarCache:
+    """
+    On-disk cache of the fetched and aggregated bars of the historic DB data handler.
+
+    An entry is a directory named after the cache key. Each BarArrays field of all symbols is
+    concatenated into one .npy file, with the symbol order and the offset of every symbol stored
+    beside it, so a warm start memory-maps the files instead of querying and aggregating again.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+    def make_key(self, symbol_list, start_time, end_time, bar_granularity, dst_window, market_hours, db_fingerprint):
+        key = {
+            'version': self.FORMAT_VERSION,
+            'symbols': sorted(symbol_list),
+            'start_time': str(start_time),
+            'end_time': str(end_time),
+            'bar_granularity': bar_granularity,
+            'dst_window': [str(date) for date in dst_window],
+            'market_hours': list(market_hours),
+            'db_fingerprint': list(db_fingerprint),
+        }
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def load(self, key):
+        """
+        Returns the cached {symbol: BarArrays} of the key, memory-mapped read-only, or None on a miss.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        if not os.path.exists(os.path.join(entry_dir, 'symbols.json')):
+            return None
+
+        try:
+            with open(os.path.join(entry_dir, 'symbols.json')) as f:
+                symbols = json.load(f)
+            offsets = np.load(os.path.join(entry_dir, 'offsets.npy'))
+            columns = [np.load(os.path.join(entry_dir, field + '.npy'), mmap_mode='r') for field in BarArrays._fields]
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable bar cache entry {entry_dir}: {e}")
+            return None
+
+        return {
+            symbol: BarArrays(*[column[offsets[i]:offsets[i + 1]] for column in columns])
+            for i, symbol in enumerate(symbols)
+        }
+
+    def save(self, key, bar_arrays):
+        """
+        Stores {symbol: BarArrays} under the key. The entry is written to a temporary directory
+        first, so an interrupted run never leaves a partial entry behind.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        symbols = list(bar_arrays.keys())
+        offsets = np.cumsum([0] + [len(arrays.datetime) for arrays in bar_arrays.values()])
+
+        for field in BarArrays._fields:
+            column = np.concatenate([getattr(arrays, field) for arrays in bar_arrays.values()])
+            np.save(os.path.join(tmp_dir, field + '.npy'), column)
+        np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+        with open(os.path.join(tmp_dir, 'symbols.json'), 'w') as f:
+            json.dump(symbols, f)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+
+import numpy as np
+
+
+# One fixed-width record per bar, the datetime is the raw (not DST adjusted) bar time as stored in the database
+BAR_RECORD = np.dtype([
+    ('datetime', '<M8[s]'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+])
+
+
+class BarFileStore:
+    """
+    Binary bar store with one file of fixed-width BAR_RECORDs per symbol, sorted by time.
+
+    Beside every <symbol>.bars file a <symbol>.index file holds the offset of the first record of
+    each calendar day from the first stored day on, so the records of a date range are found with
+    two lookups instead of a scan. Files are memory-mapped when read, slicing them copies nothing.
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.meta = self._read_meta()
+        self.files = {}
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.directory, 'meta.json')
+        if not os.path.exists(meta_path):
+            return {'version': self.FORMAT_VERSION, 'symbols': {}}
+
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta['version'] != self.FORMAT_VERSION:
+            raise Exception(f"Unsupported bar file store version {meta['version']} in {self.directory}")
+        return meta
+
+    def write_meta(self):
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def get_symbols(self):
+        return list(self.meta['symbols'].keys())
+
+    def open_symbol(self, symbol):
+        """
+        Returns the memory-mapped records and day index of a symbol, or None if it is not in the store.
+        """
+        if symbol not in self.files:
+            if symbol not in self.meta['symbols'] or self.meta['symbols'][symbol]['records'] == 0:
+                return None
+            records = np.memmap(os.path.join(self.directory, symbol + '.bars'), dtype=BAR_RECORD, mode='r')
+            day_index = np.memmap(os.path.join(self.directory, symbol + '.index'), dtype='<i8', mode='r')
+            self.files[symbol] = (records, day_index)
+        return self.files[symbol]
+
+    def get_bars(self, symbol, start_time, end_time):
+        """
+        Returns the records of a symbol with start_time <= datetime <= end_time as a view into the
+        memory-mapped file, or None if the symbol is not in the store.
+        """
+        opened = self.open_symbol(symbol)
+        if opened is None:
+            return None
+        records, day_index = opened
+
+        first_day = self.meta['symbols'][symbol]['first_day']
+        start_day = int(np.datetime64(start_time, 'D').astype(np.int64)) - first_day
+        end_day = int(np.datetime64(end_time, 'D').astype(np.int64)) - first_day + 1
+        lo = day_index[min(max(start_day, 0), len(day_index) - 1)]
+        hi = day_index[min(max(end_day, 0), len(day_index) - 1)]
+
+        # only the first and last day of the range can hold records outside of it
+        times = records['datetime'][lo:hi]
+        first = np.searchsorted(times, np.datetime64(start_time, 's'), side='left')
+        last = np.searchsorted(times, np.datetime64(end_time, 's'), side='right')
+        return records[lo + first:lo + last]
+
+    def write_symbol(self, symbol, records):
+        """
+        Replaces the file of a symbol with the given BAR_RECORD array and rebuilds its day index.
+        The store only sees the new file once write_meta() was called.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.files.pop(symbol, None)
+
+        records = np.sort(np.asarray(records, dtype=BAR_RECORD), order='datetime', kind='stable')
+        records.tofile(os.path.join(self.directory, symbol + '.bars'))
+
+        if len(records) > 0:
+            days = records['datetime'].astype('datetime64[D]').astype(np.int64)
+            first_day = int(days[0])
+            # day_index[d] is the offset of the first record on or after first_day + d, the last entry ends the file
+            day_index = np.searchsorted(days, np.arange(first_day, int(days[-1]) + 2), side='left').astype('<i8')
+        else:
+            first_day = 0
+            day_index = np.zeros(1, dtype='<i8')
+        day_index.tofile(os.path.join(self.directory, symbol + '.index'))
+
+        self.meta['symbols'][symbol] = {'first_day': first_day, 'records': len(records)}
+
+    def export_from_database(self, database_repository, symbol_list):
+        """
+        Builds the store from the 5 minute bars of the given symbols in the database.
+        """
+        for symbol in symbol_list:
+            rows = database_repository.get_stock_data_for_symbol(symbol)
+            records = np.empty(len(rows), dtype=BAR_RECORD)
+            if len(rows) > 0:
+                dates, opens, highs, lows, closes, volumes = zip(*rows)
+                records['datetime'] = np.array(dates, dtype='datetime64[s]')
+                records['open'] = opens
+                records['high'] = highs
+                records['low'] = lows
+                records['close'] = closes
+                records['volume'] = np.array(volumes, dtype=np.float64).astype(np.int64)
+            self.write_symbol(symbol, records)
+            logging.info(f"Exported {len(records)} bars of {symbol} to {self.directory}")
+
+        self.write_meta()
@@ -0,0 +1,59 @@
+import threading
+from contextlib import nullcontext
+
+import numpy as np
+
+from data_handlers.types.bar_arrays import BarArrays
+from data_handlers.types.bar_window import BarWindow
+
+
+class BarHistory:
+    """
+    Fixed-capacity ring buffer holding the latest bars of one symbol in columnar form.
+
+    Every bar is written twice, at slot i and at slot i + capacity, so the last N bars are always
+    one contiguous slice of each field array. Appending is O(1) and bars older than capacity are dropped.
+
+    By default get_latest_bars returns a BarWindow that is a view onto the buffer, without copying or
+    locking, which reflects later appends and is only safe when the history is written and read by the same
+    thread. The live data handler appends the aggregated bars from the IB thread while the strategy reads
+    them, so it creates its histories with copy=True: appending and reading then hold a lock and
+    get_latest_bars returns a BarWindow over a copy of the bars.
+    """
+    def __init__(self, symbol, capacity, copy=False):
+        self.symbol = symbol
+        self.capacity = capacity
+        self.copy = copy
+        self.lock = threading.Lock() if copy else nullcontext()
+        self.arrays = BarArrays(
+            np.empty(2 * capacity, dtype='datetime64[ns]'), np.empty(2 * capacity), np.empty(2 * capacity),
+            np.empty(2 * capacity), np.empty(2 * capacity), np.zeros(2 * capacity, dtype=np.int64)
+        )
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, bar):
+        values = (np.datetime64(bar.datetime, 'ns'), bar.open, bar.high, bar.low, bar.close, bar.volume)
+        with self.lock:
+            mirror = self.position + self.capacity
+            for array, value in zip(self.arrays, values):
+                array[self.position] = value
+                array[mirror] = value
+
+            self.position = (self.position + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def get_latest_bars(self, N=1):
+        """
+        Returns the last N bars, all retained bars for N=0.
+        """
+        with self.lock:
+            size = self.count if N == 0 else min(N, self.count)
+            stop = self.position + self.capacity
+            if not self.copy:
+                return BarWindow(self.symbol, self.arrays, stop - size, stop)
+            arrays = BarArrays(*(array[stop - size:stop].copy() for array in self.arrays))
+        return BarWindow(self.symbol, arrays, 0, size)
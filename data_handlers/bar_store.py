@@ -0,0 +1,98 @@
+import numpy as np
+
+from data_handlers.types.bar_arrays import BarArrays
+from data_handlers.types.bar_window import BarWindow
+from data_handlers.types.market_batch import MarketBatch
+
+
+class BarStore:
+    """
+    Columnar store of the bar history of the historic data handlers.
+
+    Every field of a symbol is kept in one contiguous NumPy array. A cursor per symbol counts
+    the bars that have been pushed to the feed, so pushing a bar only advances the cursor and
+    reading the latest bars returns a BarWindow over the arrays.
+
+    When the symbols share the same bar times, their fields are also kept as (bar, symbol)
+    matrices, so the bars of all symbols at one time are a row of each matrix (see get_market_batch).
+    """
+    def __init__(self):
+        self.arrays = {}
+        self.cursors = {}
+        self.aligned_symbols = None
+        self.aligned_columns = None
+        self.aligned_arrays = None
+
+    def add_symbol(self, symbol, df):
+        """
+        Stores the bars of a DataFrame with date, open, high, low, close and volume columns.
+        """
+        self.add_symbol_arrays(symbol, BarArrays(
+            df['date'].to_numpy(copy=True), df['open'].to_numpy(copy=True), df['high'].to_numpy(copy=True),
+            df['low'].to_numpy(copy=True), df['close'].to_numpy(copy=True), df['volume'].to_numpy(copy=True)
+        ))
+
+    def add_symbol_arrays(self, symbol, arrays):
+        """
+        Stores the bars of BarArrays as they are, without copying, e.g. the memory-mapped arrays of the bar cache.
+        """
+        self.arrays[symbol] = arrays
+        self.cursors[symbol] = 0
+        self.aligned_symbols = None
+        self.aligned_columns = None
+        self.aligned_arrays = None
+
+    def advance(self, symbol):
+        """
+        Pushes the next bar of the symbol. Returns False if there are no bars left.
+        """
+        if self.cursors[symbol] >= len(self.arrays[symbol].datetime):
+            return False
+        self.cursors[symbol] += 1
+        return True
+
+    def seek(self, symbol, index):
+        self.cursors[symbol] = min(index, len(self.arrays[symbol].datetime))
+
+    def get_latest_bars(self, symbol, N=1):
+        """
+        Returns the last N pushed bars of the symbol, all of them for N=0.
+        """
+        stop = self.cursors[symbol]
+        start = 0 if N == 0 else max(0, stop - N)
+        return BarWindow(symbol, self.arrays[symbol], start, stop)
+
+    def get_all_bars(self, symbol):
+        return BarWindow(symbol, self.arrays[symbol], 0, len(self.arrays[symbol].datetime))
+
+    def get_aligned_arrays(self, symbols):
+        """
+        Returns BarArrays with the bar times of the symbols and one (bar, symbol) matrix per field,
+        or None if the symbols do not have the same bar times.
+        """
+        symbols = tuple(symbols)
+        if symbols != self.aligned_symbols:
+            self.aligned_symbols = symbols
+            self.aligned_columns = {symbol: column for column, symbol in enumerate(symbols)}
+            self.aligned_arrays = None
+            if len(symbols) > 0:
+                datetimes = self.arrays[symbols[0]].datetime
+                if all(np.array_equal(self.arrays[symbol].datetime, datetimes) for symbol in symbols):
+                    self.aligned_arrays = BarArrays(datetimes, *(
+                        np.stack([self.arrays[symbol][field] for symbol in symbols], axis=1) for field in range(1, 6)
+                    ))
+        return self.aligned_arrays
+
+    def get_market_batch(self, symbols):
+        """
+        Returns the latest pushed bars of all symbols as one MarketBatch, or None if
+        their bar times are not aligned or no bar has been pushed yet.
+        """
+        aligned_arrays = self.get_aligned_arrays(symbols)
+        if aligned_arrays is None:
+            return None
+
+        index = self.cursors[symbols[0]] - 1
+        if index < 0:
+            return None
+        return MarketBatch(self.aligned_symbols, self.aligned_columns, aligned_arrays, index)
@@ -4,4 +4,5 @@ class DataSource(Enum):
     CSV = 1
     IB_HIST = 2
     DB = 3
-    IB_LIVE = 4
\ No newline at end of file
+    IB_LIVE = 4
+    BAR_FILES = 5
\ No newline at end of file
@@ -0,0 +1,34 @@
+import helper
+from data_handlers.historic_db_data_handler import HistoricDBDataHandler
+
+
+class HistoricBarFileDataHandler(HistoricDBDataHandler):
+    def __init__(self, events, symbol_list, database_repository, bar_file_store, bar_granularity=300):
+        """
+                Historic data handler that reads the 5 minute bars from a BarFileStore
+                instead of the stock_data_5m table. The database is still used for the
+                stock float data.
+
+                The records are filtered, DST adjusted and aggregated by prepare_bar_arrays
+                straight from the memory-mapped files and give the same bars as HistoricDBDataHandler.
+
+                Parameters:
+                events - The Event Queue.
+                symbol_list - A list of symbol strings.
+                database_repository - Repository of the sql db with the stock float data.
+                bar_file_store - BarFileStore holding the 5 minute bars of the symbols.
+                bar_granularity - Bar size in seconds to aggregate the 5 minute bars to.
+                """
+        super().__init__(events, symbol_list, database_repository, bar_granularity)
+        self.bar_file_store = bar_file_store
+
+    def fetch_historical_ohlcv_data(self, start_time, end_time):
+        self.full_trading_days = helper.get_full_trading_days(start_time, end_time)
+        self.load_bar_arrays(self.prepare_bar_arrays(self.iter_symbol_records(start_time, end_time), start_time, end_time))
+
+    def iter_symbol_records(self, start_time, end_time):
+        # same order as the ORDER BY s.symbol of the database query
+        for symbol in sorted(self.symbol_list):
+            records = self.bar_file_store.get_bars(symbol, start_time, end_time)
+            if records is not None:
+                yield symbol, records
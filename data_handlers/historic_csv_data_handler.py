@@ -1,11 +1,11 @@
 import pandas as pd
 import os.path
 
+from data_handlers.bar_store import BarStore
 from data_handlers.data_handler import DataHandler
 from data_handlers.enums.data_format import DataFormat
-from data_handlers.types.bar import Bar
 import helper
-from events.market_event import MarketEvent
+from events.market_event import MARKET_EVENT
 
 class HistoricCSVDataHandler(DataHandler):
     """
@@ -32,8 +32,7 @@ class HistoricCSVDataHandler(DataHandler):
         self.symbol_list = symbol_list
 
         self.symbol_data = {}
-        self.symbol_dataframe = {}
-        self.latest_symbol_data = {}
+        self.bar_store = BarStore()
         self.all_data = {}
         self.continue_backtest = True
 
@@ -60,49 +59,33 @@ class HistoricCSVDataHandler(DataHandler):
             else:
                 combined_index.union(self.symbol_data[symbol].index)
 
-            self.latest_symbol_data[symbol] = []
-
         #In case there are symbols with not the same time index due to missing dates etc, then reindexing shall be performed
         for symbol in self.symbol_list:
-            self.symbol_dataframe[symbol] = self.symbol_data[symbol].reindex(index=combined_index, method='pad')
-            self.all_data[symbol] = self.symbol_dataframe[symbol].copy()
-            self.symbol_data[symbol] = self.symbol_dataframe[symbol].iterrows()
-
-    #generator
-    def _get_new_data(self, symbol):
-        """
-                Returns the latest bar from the data feed as a tuple of
-                (sybmbol, datetime, open, low, high, close, volume).
-                """
-        for _, row in self.symbol_data[symbol]:
-            yield Bar(symbol, row["date"], row["open"], row["high"], row["low"], row["close"], row["volume"])
+            self.all_data[symbol] = self.symbol_data[symbol].reindex(index=combined_index, method='pad')
+            self.bar_store.add_symbol(symbol, self.all_data[symbol])
+        # the parsed files are not needed once the bars are in the store
+        self.symbol_data = {}
 
     def get_latest_data(self, symbol, N=1):
         #This function gets the latest data for the symbol being considered, for the purppse of fill calculations or
         try:
-            return self.latest_symbol_data[symbol][-N:]
+            return self.bar_store.get_latest_bars(symbol, N)
         except KeyError:
             print("{symbol} is not a valid symbol.").format(symbol=symbol)
 
     def update_latest_data(self):
         #This function updates the data feed and creates a market event
         for symbol in self.symbol_list:
-            data = None
-            try:
-                data = next(self._get_new_data(symbol))
-            except StopIteration:
+            if not self.bar_store.advance(symbol):
                 self.continue_backtest = False
-            if data is not None:
-                self.latest_symbol_data[symbol].append(data)
-                #test123
 
-        self.events.put(MarketEvent())
+        self.events.put(MARKET_EVENT)
 
     def create_baseline_dataframe(self):
         #this creates a dataframe for a symbol and plots the percentage change in the symbol over the time period considered
         dataframe = None
         for symbol in self.symbol_list:
-            df = self.symbol_dataframe[symbol]
+            df = self.bar_store.get_all_bars(symbol).to_dataframe()
             if dataframe == None:
                 dataframe = pd.DataFrame(df['close'])
                 dataframe.columns = [symbol]
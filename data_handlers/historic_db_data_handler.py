@@ -1,14 +1,16 @@
+import numpy as np
 import pandas as pd
 
 import config
-from data_handlers.types.bar import Bar
+from data_handlers.bar_cache import BarCache
+from data_handlers.bar_store import BarStore
+from data_handlers.types.bar_arrays import BarArrays
 from database_repository import DatabaseRepository
 import helper
-from ibapi.common import RealTimeBar
+from rollup_tables import BASE_GRANULARITY, SLOT_MASK_BITS
 
-from bar_aggregator import BarAggregator
-from events.market_event import MarketEvent
-from datetime import datetime, timedelta
+from events.market_event import MARKET_EVENT, MarketEvent
+from datetime import datetime
 
 import logging
 
@@ -27,16 +29,14 @@ class HistoricDBDataHandler(object):
         self.events = events
         self.symbol_list = symbol_list
         self.symbol_list_active = symbol_list
-        self.symbol_data = {}
-        self.symbol_dataframe = {}
-        self.latest_symbol_data = {}
+        self.bar_store = BarStore()
+        self.bar_cache = BarCache(config.bar_cache_dir)
         self.all_data = {}
 
         self.bar_granularity = bar_granularity
         self.continue_backtest = True
         self.database_repository: DatabaseRepository = database_repository
         self.fundamental_data = {}
-        self.aggregated_symbol_records = {}
         self.time_col = 1
         self.price_col = 2
         self.dst_date_change_start = datetime.strptime(config.dst_date_change_start, "%Y-%m-%d")
@@ -45,146 +45,193 @@ class HistoricDBDataHandler(object):
 
 
     def fetch_historical_ohlcv_data(self, start_time, end_time):
-        symbol_records = {}
-        self.full_trading_days = helper.get_full_trading_days(start_time, end_time)
-        rows = self.database_repository.get_stock_data(start_time, end_time, self.symbol_list)
-        for row in rows:
-            bar = list(row)
-            date = datetime.strptime(bar[1], "%Y-%m-%d %H:%M:%S")
-
-            # Skip day from backtesting if not a full trading day (exclude early market closes)
-            if date.date() not in self.full_trading_days:
-                continue
-
-            date = self.adjust_for_dst(date)
-            bar[1] = date
-            stock_symbol = bar[0]
-            if stock_symbol not in symbol_records:
-                symbol_records[stock_symbol] = []
-            symbol_records[stock_symbol].append(bar[1:])
-
-        symbol_records = self.filter_out_stocks_with_missing_records(symbol_records, start_time, end_time)
-        symbol_records = self.aggregate_bars(symbol_records, self.bar_granularity)
+        cache_key = self.get_bar_cache_key(start_time, end_time)
+        if cache_key is not None:
+            cached_bar_arrays = self.bar_cache.load(cache_key)
+            if cached_bar_arrays is not None:
+                logging.info(f"Loaded aggregated bars of {len(cached_bar_arrays)} stocks from bar cache {cache_key}")
+                self.load_bar_arrays(cached_bar_arrays)
+                return
 
-        self.symbol_list = list(symbol_records.keys())
-        self.symbol_list_active = self.symbol_list
-
-        self.symbol_dataframe = {k: pd.DataFrame(v, columns=['date', 'open', 'high', 'low','close','volume']) for k, v in symbol_records.items()}
-        for symbol in self.symbol_dataframe.keys():
-            self.all_data[symbol] = self.symbol_dataframe[symbol].copy()
-            self.symbol_data[symbol] = self.symbol_dataframe[symbol].iterrows()
-            self.latest_symbol_data[symbol] = []
-
-    def adjust_for_dst(self, date):
-        if date.date() <= self.dst_date_change_end.date() and date.date() >= self.dst_date_change_start.date():
-            date = date + timedelta(hours=1)
-        return date
-
-    def fetch_float_data(self):
-        rows = self.database_repository.get_stock_float(self.symbol_list)
-
-        for row in rows:
-            self.fundamental_data[row[0]] = {"float": row[1]}
-
-    def on_aggregate_completion(self, symbol, completed_bar):
-        if symbol not in self.aggregated_symbol_records:
-            self.aggregated_symbol_records[symbol] = []
-        self.aggregated_symbol_records[symbol].append(completed_bar)
-
-
-    def aggregate_bars(self, symbol_records, bar_granularity):
-        for symbol, records in symbol_records.items():
-            bar_aggregator = BarAggregator(symbol, self.on_aggregate_completion, source_granularity=300, target_granularity=bar_granularity) #for incoming 5min(300s) bar
-
-            for record in records:
-                bar = RealTimeBar(time=record[0].timestamp(), open_=record[1], high=record[2], low=record[3], close=record[4], volume=record[5])
-                bar_aggregator.process_bar_for_aggregation(bar)
-            bar_aggregator._finalize_aggregated_bar()
-        return self.aggregated_symbol_records
-
-    def filter_out_stocks_with_missing_records(self, symbol_records, start_time, end_time):
-
-        start_date = start_time.strftime("%Y-%m-%d")
-        end_date = end_time.strftime("%Y-%m-%d")
+        self.full_trading_days = helper.get_full_trading_days(start_time, end_time)
+        symbol_records = self.database_repository.iter_stock_data_records(start_time, end_time, self.symbol_list,
+                                                                         bar_granularity=self.bar_granularity)
+        self.load_bar_arrays(self.prepare_bar_arrays(symbol_records, start_time, end_time))
 
-        #expected_bars_per_day = len(helper.expected_times_for_day(trading_days_without_early_closes[0])) - 1
-        expected_bars_per_day = helper.get_expected_number_of_bars_per_day(bar_granularity_in_seconds=300) # 5-minute bars stored in database
+        if cache_key is not None and len(self.symbol_list) > 0:
+            self.bar_cache.save(cache_key, self.get_bar_arrays())
 
-        symbols_to_delete = []
+    def prepare_bar_arrays(self, symbol_records, start_time, end_time):
+        """
+        Turns the raw 5 minute records of each symbol, (symbol, records) pairs in symbol order with the
+        fields of STOCK_DATA_RECORD (or BAR_RECORD), into {symbol: BarArrays} of the aggregated bars.
+        Records of a rollup table (ROLLUP_RECORD) are aggregated further, their completeness is checked
+        on the 5 minute bar times of their slot masks.
+
+        The records of one symbol are filtered to the full trading days, DST adjusted and aggregated
+        as arrays, symbols without records or with missing bars on any full trading day are dropped and
+        logged as missing data. Aggregated bar times are aligned in UTC, which matches the local time
+        alignment of BarAggregator as long as the UTC offset of the machine is a multiple of the bar
+        granularity (e.g. CET with 5 M up to 1 H bars).
+        """
+        full_trading_days = np.array(self.full_trading_days, dtype='datetime64[D]')
+        dst_date_change_start = np.datetime64(self.dst_date_change_start.date())
+        dst_date_change_end = np.datetime64(self.dst_date_change_end.date())
+
+        bar_arrays = {}
+        missing_symbols = []
+        for symbol, records in symbol_records:
+            # Skip days from backtesting if not a full trading day (exclude early market closes)
+            datetimes = records['datetime'].astype('datetime64[s]')
+            is_full_trading_day = np.isin(datetimes.astype('datetime64[D]'), full_trading_days)
+            records = records[is_full_trading_day]
+            if len(records) == 0:
+                missing_symbols.append(symbol)
+                continue
 
-        market_open_time = datetime.strptime(helper.MKT_OPEN_TIME, '%H:%M:%S').time()
-        market_close_time = datetime.strptime(helper.MKT_CLOSE_TIME, '%H:%M:%S').time()
+            datetimes = datetimes[is_full_trading_day]
+            bar_datetimes = datetimes
+            if 'slot_mask' in records.dtype.names:
+                bar_datetimes = self.get_slot_datetimes(datetimes, records['slot_mask'])
+            datetimes = self.adjust_for_dst(datetimes, dst_date_change_start, dst_date_change_end)
+            bar_datetimes = self.adjust_for_dst(bar_datetimes, dst_date_change_start, dst_date_change_end)
 
-        for symbol, records in symbol_records.items():
-            if not records:
-                symbols_to_delete.append(symbol)
+            if not self.has_complete_trading_days(bar_datetimes, full_trading_days):
+                missing_symbols.append(symbol)
                 continue
 
-            df = pd.DataFrame(records, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df['date'] = df['timestamp'].dt.date
-            df['time'] = df['timestamp'].dt.time
-
-            # Filter to market hours only
-            # and only full trading days
-            df = df[
-                df['date'].isin(self.full_trading_days) &
-                (df['time'] >= market_open_time) &
-                (df['time'] <= market_close_time)
-            ]
+            bar_arrays[symbol] = self.aggregate_bar_records(datetimes, records, self.bar_granularity)
+
+        # symbols without any records in the time range are not in symbol_records at all
+        dropped_symbols = set(missing_symbols)
+        missing_symbols += [symbol for symbol in self.symbol_list if symbol not in bar_arrays and symbol not in dropped_symbols]
+        for symbol in missing_symbols:
+            logging.info("Missing data for symbol: %s for time period %s and %s", symbol, start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d"))
+        logging.info(f"✅ Filtered dictionary now contains only complete symbols - Count({len(bar_arrays.keys())}):")
+        logging.info(list(bar_arrays.keys()))
+        return bar_arrays
+
+    def adjust_for_dst(self, datetimes, dst_date_change_start, dst_date_change_end):
+        days = datetimes.astype('datetime64[D]')
+        is_dst = (days >= dst_date_change_start) & (days <= dst_date_change_end)
+        return datetimes + is_dst * np.timedelta64(1, 'h')
+
+    def get_slot_datetimes(self, datetimes, slot_masks):
+        # the times of the 5 minute bars of rollup buckets, bit i of the slot mask is the bar i * 5 minutes after the bucket start
+        slots = np.arange(SLOT_MASK_BITS)
+        has_bar = (slot_masks[:, None] >> slots) & 1 == 1
+        return (datetimes[:, None] + slots * np.timedelta64(BASE_GRANULARITY, 's'))[has_bar]
+
+    def has_complete_trading_days(self, datetimes, full_trading_days):
+        # True if the symbol has every 5 minute bar of the market hours on each full trading day
+        expected_bars_per_day = helper.get_expected_number_of_bars_per_day(bar_granularity_in_seconds=300) # 5-minute bars stored in database
+        market_open = helper.time_string_to_seconds(helper.MKT_OPEN_TIME, '%H:%M:%S')
+        market_close = helper.time_string_to_seconds(helper.MKT_CLOSE_TIME, '%H:%M:%S')
+
+        seconds_of_day = helper.get_seconds_of_day(datetimes)
+        market_hours = np.unique(datetimes[(seconds_of_day >= market_open) & (seconds_of_day <= market_close)])
+        days, counts = np.unique(market_hours.astype('datetime64[D]'), return_counts=True)
+
+        daily_counts = counts[np.isin(days, full_trading_days)]
+        return len(daily_counts) == len(full_trading_days) and bool(np.all(daily_counts == expected_bars_per_day))
+
+    def aggregate_bar_records(self, datetimes, records, bar_granularity):
+        # Array version of BarAggregator for sorted 5 minute bars (or rollup buckets of a granularity dividing bar_granularity)
+        seconds = datetimes.astype(np.int64)
+        bar_times = seconds // bar_granularity * bar_granularity
+        starts = np.flatnonzero(np.r_[True, bar_times[1:] != bar_times[:-1]])
+        ends = np.r_[starts[1:], len(bar_times)] - 1
+
+        return BarArrays(
+            bar_times[starts].astype('datetime64[s]').astype('datetime64[ns]'),
+            records['open'][starts],
+            np.maximum.reduceat(records['high'], starts),
+            np.minimum.reduceat(records['low'], starts),
+            records['close'][ends],
+            np.add.reduceat(records['volume'], starts),
+        )
+
+    def get_bar_cache_key(self, start_time, end_time):
+        """
+        Returns the bar cache key of a fetch, or None if the cache is disabled or the database can not be fingerprinted.
+        """
+        if not config.enable_bar_cache:
+            return None
 
-            # Count bars per trading day
-            daily_counts = df.groupby('date')['timestamp'].nunique()
+        db_fingerprint = self.database_repository.get_stock_data_fingerprint(start_time, end_time, self.symbol_list)
+        if db_fingerprint is None:
+            return None
 
-            # Check for completeness
-            if any(daily_counts.get(date, 0) != expected_bars_per_day for date in self.full_trading_days):
-                symbols_to_delete.append(symbol)
+        return self.bar_cache.make_key(
+            self.symbol_list, start_time, end_time, self.bar_granularity,
+            (self.dst_date_change_start, self.dst_date_change_end),
+            (helper.MKT_OPEN_TIME, helper.MKT_CLOSE_TIME),
+            db_fingerprint
+        )
 
-        # Drop symbols with incomplete data
-        for symbol in symbols_to_delete:
-            logging.info("Missing data for symbol: %s for time period %s and %s", symbol, start_date, end_date)
-            del symbol_records[symbol]
+    def load_bar_arrays(self, bar_arrays):
+        """
+        Uses bars that were already fetched and aggregated, e.g. by the parameter sweep,
+        instead of querying the database.
 
-        logging.info(f"✅ Filtered dictionary now contains only complete symbols - Count({len(symbol_records.keys())}):")
-        logging.info(list(symbol_records.keys()))
-        return symbol_records
+        The bar store and the all_data frames share the arrays without copying them, so the
+        memory-mapped arrays of a bar cache entry are only read from disk as the backtest touches them.
+        """
+        self.symbol_list = list(bar_arrays.keys())
+        self.symbol_list_active = self.symbol_list
 
+        for symbol, arrays in bar_arrays.items():
+            self.all_data[symbol] = pd.DataFrame({
+                'date': arrays.datetime, 'open': arrays.open, 'high': arrays.high,
+                'low': arrays.low, 'close': arrays.close, 'volume': arrays.volume
+            }, copy=False)
+            self.bar_store.add_symbol_arrays(symbol, arrays)
 
-    def _get_new_data(self, symbol):
-        """
-                Returns the latest bar from the data feed as a tuple of
-                (sybmbol, datetime, open, low, high, close, volume).
-                """
+    def fetch_float_data(self):
+        rows = self.database_repository.get_stock_float(self.symbol_list)
 
-        for _, row in self.symbol_data[symbol]:
-            yield Bar(symbol, row["date"], row["open"], row["high"], row["low"], row["close"], row["volume"])
+        for row in rows:
+            self.fundamental_data[row[0]] = {"float": row[1]}
 
     def get_latest_data(self, symbol, N=1):
         # This function gets the latest data for the symbol being considered, for the purppse of fill calculations or
         try:
-            return self.latest_symbol_data[symbol][-N:]
+            return self.bar_store.get_latest_bars(symbol, N)
         except KeyError:
             print("{symbol} is not a valid symbol.".format(symbol=symbol))
 
     def update_latest_data(self):
         # This function updates the data feed and creates a market event
         for symbol in self.symbol_list:
-            data = None
-            try:
-                data = next(self._get_new_data(symbol))
-            except StopIteration:
+            if not self.bar_store.advance(symbol):
                 self.continue_backtest = False
-            if data is not None:
-                self.latest_symbol_data[symbol].append(data)
-                # test123
 
-        self.events.put(MarketEvent())
+        # the bars of all symbols at this time travel with the event when the symbols share their bar times
+        bars = self.bar_store.get_market_batch(self.symbol_list)
+        self.events.put(MARKET_EVENT if bars is None else MarketEvent(bars))
+
+    def get_bar_arrays(self):
+        """
+        Returns the full bar history of every symbol as BarArrays, used by the
+        vectorized backtest instead of stepping through the feed bar by bar.
+        """
+        return self.bar_store.arrays
+
+    def get_current_bar_index(self):
+        # number of bars already pushed through the feed, i.e. the index of the next bar
+        return self.bar_store.cursors[self.symbol_list[0]]
+
+    def set_current_bar_index(self, index):
+        # Moves the feed of every symbol to index without pushing the bars in between
+        for symbol in self.symbol_list:
+            self.bar_store.seek(symbol, index)
+
     def create_baseline_dataframe(self):
 
         #this creates a dataframe for a symbol and plots the percentage change in the symbol over the time period considered
         dataframe = None
         for symbol in self.symbol_list:
-            df = self.symbol_dataframe[symbol]
+            df = self.bar_store.get_all_bars(symbol).to_dataframe()
             if dataframe is None:
                 dataframe = pd.DataFrame(df['close'])
                 dataframe.columns = [symbol]
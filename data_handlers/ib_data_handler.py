@@ -2,9 +2,9 @@ from data_handlers.data_handler import DataHandler
 import time
 import pandas as pd
 import helper
-from data_handlers.types.bar import Bar
+from data_handlers.bar_store import BarStore
 
-from events.market_event import MarketEvent
+from events.market_event import MARKET_EVENT
 from datetime import datetime
 from ibapi.contract import Contract
 
@@ -19,9 +19,7 @@ class IBDataHandler(DataHandler):
         self.ib_client = IBClient('127.0.0.1', 7497, 4)
         self.fundamental_data = {}
 
-        self.symbol_data = {}
-        self.symbol_dataframe = {}
-        self.latest_symbol_data = {}
+        self.bar_store = BarStore()
         self.all_data = {}
         self.continue_backtest = True
 
@@ -46,7 +44,6 @@ class IBDataHandler(DataHandler):
             )
 
             req_id += 1
-            self.latest_symbol_data[symbol] = []
 
             time.sleep(1)
 
@@ -73,45 +70,29 @@ class IBDataHandler(DataHandler):
 
     def historical_data_end(self, req_id):
         symbol = self.symbol_list[req_id]
-        self.symbol_dataframe[symbol] = pd.DataFrame(self.bars)
-        self.all_data[symbol] = self.symbol_dataframe[symbol].copy()
-        self.symbol_data[symbol] = self.symbol_dataframe[symbol].iterrows()
+        self.all_data[symbol] = pd.DataFrame(self.bars)
+        self.bar_store.add_symbol(symbol, self.all_data[symbol])
         self.bars = []
 
-    def _get_new_data(self, symbol):
-        """
-                Returns the latest bar from the data feed as a tuple of
-                (sybmbol, datetime, open, low, high, close, volume).
-                """
-
-        for _, row in self.symbol_data[symbol]:
-            yield Bar(symbol, row["date"], row["open"], row["high"], row["low"], row["close"], row["volume"])
-
     def get_latest_data(self, symbol, N=1):
         # This function gets the latest data for the symbol being considered, for the purppse of fill calculations or
         try:
-            return self.latest_symbol_data[symbol][-N:]
+            return self.bar_store.get_latest_bars(symbol, N)
         except KeyError:
             print("{symbol} is not a valid symbol.").format(symbol=symbol)
 
     def update_latest_data(self):
         # This function updates the data feed and creates a market event
         for symbol in self.symbol_list:
-            data = None
-            try:
-                data = next(self._get_new_data(symbol))
-            except StopIteration:
+            if not self.bar_store.advance(symbol):
                 self.continue_backtest = False
-            if data is not None:
-                self.latest_symbol_data[symbol].append(data)
-                # test123
 
-        self.events.put(MarketEvent())
+        self.events.put(MARKET_EVENT)
 
     def create_baseline_dataframe(self):
         dataframe = None
         for symbol in self.symbol_list:
-            df = self.symbol_dataframe[symbol]
+            df = self.bar_store.get_all_bars(symbol).to_dataframe()
             if dataframe is None:
                 dataframe = pd.DataFrame(df['close'])
                 dataframe.columns = [symbol]
@@ -1,14 +1,16 @@
 import pandas as pd
 import queue
 
+import config
 from database_repository import DatabaseRepository
 import helper
 from ibapi.common import RealTimeBar
 
 from bar_aggregator import BarAggregator
+from data_handlers.bar_history import BarHistory
 from data_handlers.data_handler import DataHandler
 from data_handlers.types.bar import Bar
-from events.market_event import MarketEvent
+from events.market_event import MARKET_EVENT
 from datetime import datetime
 from ibapi.contract import Contract
 
@@ -31,6 +33,8 @@ class LiveDataHandler(DataHandler):
         self.latest_symbol_data_aggregated = {}
         self.aggregated_symbol_records = {}
         self.all_data = {}
+        # called with the symbol whenever all_data of a symbol is replaced, see add_all_data_listener
+        self.all_data_listeners = []
 
         self.continue_backtest = True
 
@@ -42,15 +46,29 @@ class LiveDataHandler(DataHandler):
         self.bars = []
 
 
+        history_depth = self.get_history_depth()
         self.bar_aggregators = {}
         for symbol in self.symbol_list:
             self.all_data[symbol] = None
-            self.latest_symbol_data[symbol] = []
-            self.latest_symbol_data_aggregated[symbol] = []
+            # appended from the IB thread while the strategy reads them, so the histories return copies
+            self.latest_symbol_data[symbol] = BarHistory(symbol, history_depth, copy=True)
+            self.latest_symbol_data_aggregated[symbol] = BarHistory(symbol, history_depth, copy=True)
             self.symbol_data[symbol] = queue.Queue()
             self.bar_aggregators[symbol] = BarAggregator(symbol, self.store_aggregated_bar, source_granularity=5, target_granularity=self.bar_granularity) #for incoming 5sec bar
 
 
+    def get_history_depth(self):
+        # the filters read the whole history fetched for them and the strategies need their indicator periods,
+        # a smaller HISTORY_DEPTH_BARS would silently drop the oldest of those bars
+        history_days = config.backtest_time_period + max(config.filter_long_sma, config.filter_volume_days) + 1
+        required_depth = max(history_days * (helper.get_expected_number_of_bars_per_day(self.bar_granularity) + 1),
+                             config.ema_long_period, config.rsi_period + 1, config.opening_range_window_bars)
+        if config.history_depth_bars < required_depth:
+            logging.warning("HISTORY_DEPTH_BARS=%s is below the %s bars of the filter history and indicator periods, keeping %s bars per symbol",
+                            config.history_depth_bars, required_depth, required_depth)
+            return required_depth
+        return config.history_depth_bars
+
     def capture_historical_data(self, bar, req_id):
         # t = datetime.fromtimestamp(int(bar.date))
 
@@ -229,6 +247,10 @@ class LiveDataHandler(DataHandler):
         end_date = end_date_obj.strftime('%Y%m%d %H:%M:%S')
         return end_date
 
+    def add_all_data_listener(self, listener):
+        # e.g. the plot annotations, whose bar times of the symbol are out of date with the new frame
+        self.all_data_listeners.append(listener)
+
     def store_aggregated_bar(self, symbol, bar):
         bar = Bar(symbol, bar["date"], bar["open"], bar["high"], bar["low"], bar["close"], bar["volume"])
         self.latest_symbol_data_aggregated[symbol].append(bar)
@@ -257,6 +279,8 @@ class LiveDataHandler(DataHandler):
             self.symbol_dataframe[symbol] = pd.concat([self.symbol_dataframe[symbol], new_bar], ignore_index=True)
 
         self.all_data[symbol] = self.symbol_dataframe[symbol].copy()
+        for listener in self.all_data_listeners:
+            listener(symbol)
         self.symbol_data[symbol].put(data)
 
 
@@ -265,14 +289,14 @@ class LiveDataHandler(DataHandler):
     def get_latest_data(self, symbol, N=1):
         # This function gets the latest data for the symbol being considered, for the purppse of fill calculations or
         try:
-            return self.latest_symbol_data[symbol][-N:]
+            return self.latest_symbol_data[symbol].get_latest_bars(N)
         except KeyError:
             print("{symbol} is not a valid symbol.").format(symbol=symbol)
 
     def get_latest_data_aggregated(self, symbol, N=1):
         #This function gets the latest data for the symbol being considered, for the purppse of fill calculations or
         try:
-            return self.latest_symbol_data_aggregated[symbol][-N:]
+            return self.latest_symbol_data_aggregated[symbol].get_latest_bars(N)
         except KeyError:
             print("{symbol} is not a valid symbol.").format(symbol=symbol)
 
@@ -296,7 +320,7 @@ class LiveDataHandler(DataHandler):
                 self.latest_symbol_data[symbol].append(data)
                 # test123
 
-        self.events.put(MarketEvent())
+        self.events.put(MARKET_EVENT)
 
     def create_baseline_dataframe(self):
         dataframe = None
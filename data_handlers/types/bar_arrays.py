@@ -0,0 +1,4 @@
+from collections import namedtuple
+
+# Full bar history of one symbol, one NumPy array per field
+BarArrays = namedtuple('BarArrays', ['datetime', 'open', 'high', 'low', 'close', 'volume'])
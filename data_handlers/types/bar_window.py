@@ -0,0 +1,79 @@
+from collections.abc import Sequence
+
+import pandas as pd
+
+from data_handlers.types.bar import Bar
+
+
+class BarWindow(Sequence):
+    """
+    Read-only view of the bars [start, stop) of one symbol's BarArrays.
+
+    Indexing and iterating return Bar tuples like the lists the data handlers used to hand out,
+    while the field arrays of the window (window.close, window.volume, ...) are NumPy views
+    that can be used without copying.
+    """
+    __slots__ = ('symbol', 'arrays', 'start', 'stop')
+
+    def __init__(self, symbol, arrays, start, stop):
+        self.symbol = symbol
+        self.arrays = arrays
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return BarWindow(self.symbol, self.arrays, self.start + start, self.start + max(start, stop))
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("bar index out of range")
+
+        i = self.start + index
+        arrays = self.arrays
+        return Bar(self.symbol, pd.Timestamp(arrays.datetime[i]), arrays.open[i].item(), arrays.high[i].item(),
+                   arrays.low[i].item(), arrays.close[i].item(), arrays.volume[i].item())
+
+    def __iter__(self):
+        window = slice(self.start, self.stop)
+        arrays = self.arrays
+        for values in zip(pd.to_datetime(arrays.datetime[window]), arrays.open[window].tolist(), arrays.high[window].tolist(),
+                          arrays.low[window].tolist(), arrays.close[window].tolist(), arrays.volume[window].tolist()):
+            yield Bar(self.symbol, *values)
+
+    @property
+    def datetime(self):
+        return self.arrays.datetime[self.start:self.stop]
+
+    @property
+    def open(self):
+        return self.arrays.open[self.start:self.stop]
+
+    @property
+    def high(self):
+        return self.arrays.high[self.start:self.stop]
+
+    @property
+    def low(self):
+        return self.arrays.low[self.start:self.stop]
+
+    @property
+    def close(self):
+        return self.arrays.close[self.start:self.stop]
+
+    @property
+    def volume(self):
+        return self.arrays.volume[self.start:self.stop]
+
+    def to_dataframe(self):
+        return pd.DataFrame({
+            'date': self.datetime, 'open': self.open, 'high': self.high,
+            'low': self.low, 'close': self.close, 'volume': self.volume
+        })
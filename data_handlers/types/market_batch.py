@@ -0,0 +1,34 @@
+import pandas as pd
+
+from data_handlers.types.bar import Bar
+
+
+class MarketBatch:
+    """
+    Bars of all symbols of the feed at one bar time, carried by the MarketEvent.
+
+    open, high, low, close and volume are NumPy arrays aligned with symbols (rows of the
+    BarStore's aligned matrices, so no data is copied) and columns maps a symbol to its
+    position in them. index is the position of the bar in the bar arrays of the symbols.
+    """
+    __slots__ = ('symbols', 'columns', 'index', 'datetimes', 'datetime', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, symbols, columns, aligned_arrays, index):
+        self.symbols = symbols
+        self.columns = columns
+        self.index = index
+        self.datetimes = aligned_arrays.datetime
+        self.datetime = pd.Timestamp(aligned_arrays.datetime[index])
+        self.open = aligned_arrays.open[index]
+        self.high = aligned_arrays.high[index]
+        self.low = aligned_arrays.low[index]
+        self.close = aligned_arrays.close[index]
+        self.volume = aligned_arrays.volume[index]
+
+    def get_bar(self, symbol):
+        """
+        Returns the bar of the symbol as the Bar get_latest_data(symbol)[0] would return.
+        """
+        column = self.columns[symbol]
+        return Bar(symbol, self.datetime, self.open[column].item(), self.high[column].item(),
+                   self.low[column].item(), self.close[column].item(), self.volume[column].item())
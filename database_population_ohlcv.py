@@ -9,6 +9,11 @@ from ibapi.contract import Contract
 from ibapi.wrapper import EWrapper
 from threading import Thread
 
+from database_repository import get_stock_data_time_column, to_epoch_seconds
+from daily_summary import refresh_daily_summary
+from download_scheduler import BLACKLISTED, DONE, FAILED, PENDING, DownloadJob, DownloadScheduler, TokenBucket, get_pacing_limit
+from rollup_tables import refresh_rollups
+
 
 engine_name = ''
 
@@ -59,13 +64,13 @@ class IBClient(EClient, EWrapper):
         self.order_id = 0
         self.bars = {}
         self.symbol_list = symbol_list
+        self.symbols_by_id = dict(symbol_list)
         self.insert_to_db = insert_to_db
-        self.last_update = time.monotonic()
-        self.completion_status = {} #to track completion status of each stock request(marked complete either on data received or error)
+        self.scheduler = None #DownloadScheduler of fetch_historical_data, tracks the open requests and the status of every stock
+        self.end_date = None
+        self.time_period = None
+        self.bar_size = None
         self.connect(host, port, client_id)
-        self.symbols_to_blacklist = [] #for storing symbols which need to be blacklisted (200, definition not found)
-        self.failed_to_insert_symbols = [] #for storing symbols which failed to insert into DB
-        self.erroneous_symbols = [] #for storing symbols which had errors during data fetching to review later
         thread = Thread(target=self.run)
         thread.start()
         time.sleep(1)
@@ -85,34 +90,17 @@ class IBClient(EClient, EWrapper):
             logging.warn("ReqID: %s, Error Code: %s, Message: %s", req_id, code, msg)
         else:
             logging.error("ReqID: %s - Error Code: %s, Message: %s", req_id, code, msg)
-            # errors:
-            # 200: definition not found (stock doesnt exist anymore) -> blacklist, mark request complete
-            # 162?
-            # all other errors?
-
-            if code in [162, 200]: #definition not found (stock doesnt exist anymore) -> blacklist and mark request complete
-                self.mark_stocks_for_blacklisting([req_id])
-            else:
-                self.mark_stock_as_erroneous(code, msg, req_id) # all other errors -> flag as erroneous for review and mark request complete
-
-            self.mark_request_completion(req_id)
-
-
-    def mark_stock_as_erroneous(self, code, msg, req_id):
-        if self.completion_status.get(req_id, None) is not None:
-            self.erroneous_symbols.append((req_id, code, msg))
-
-    def mark_stocks_for_blacklisting(self, stock_ids):
-        self.symbols_to_blacklist.extend(stock_ids)
-
-    def reset_timeout_timer(self):
-        self.last_update = time.monotonic()
-
-    def mark_request_completion(self, req_id):
-        if self.completion_status.get(req_id, None) is not None:
-            self.completion_status[req_id] = True
-            self.reset_timeout_timer()
+            # errors of open requests (see download_scheduler.classify_error):
+            # pacing violations and transient errors -> retried with backoff
+            # 162 no data, 200 definition not found (stock doesnt exist anymore) -> blacklisted at the end of the run
+            # all other errors -> flagged as failed for review
 
+            if self.scheduler is not None:
+                stock_id = self.scheduler.get_stock_id(req_id)
+                outcome = self.scheduler.request_error(req_id, code, msg)
+                if outcome is not None:
+                    logging.info("ReqID: %s - Stock %s: %s", req_id, stock_id, outcome)
+                    self.bars.pop(req_id, None)
 
 
     def historicalData(self, req_id: int, bar: BarData):
@@ -131,7 +119,9 @@ class IBClient(EClient, EWrapper):
             logging.error("ReqID: %s - Data validation error - Timestamp %s: %s", req_id, bar.date, str(ve))
             return
 
-        self.bars[req_id].append(data)
+        # bars of requests that were cancelled after a timeout are dropped
+        if req_id in self.bars:
+            self.bars[req_id].append(data)
 
     @staticmethod
     def validate_bar_data(data):
@@ -149,54 +139,76 @@ class IBClient(EClient, EWrapper):
     def historicalDataEnd(self, req_id: int, start: str, end: str):
         logging.info(f"End of data - ReqID: %s. Start: %s. End: %s", req_id, start, end)
 
-        if len(self.bars[req_id]) == 0:
+        stock_id = self.scheduler.get_stock_id(req_id)
+        bars = self.bars.pop(req_id, None)
+        if stock_id is None or bars is None:
+            logging.warning("ReqID: %s. Request is not open anymore, ignoring its data.", req_id)
+            return
+
+        if len(bars) == 0:
             logging.warning("ReqID: %s. No valid data received for writing to database.", req_id)
 
-        if self.insert_to_db and len(self.bars[req_id]) > 0:
+        insert_error = None
+        if self.insert_to_db and len(bars) > 0:
             conn = sqlite3.connect(engine_name)
             cursor = conn.cursor()
 
-            stock_id = req_id
-
+            # bar times are stored as epoch seconds in databases migrated by migrate_stock_data.py
+            time_column = get_stock_data_time_column(conn)
             data_to_insert = [
-                (stock_id, row['date'], row['open'], row['high'], row['low'], row['close'], row['volume'])
-                for row in self.bars[req_id]
+                (stock_id, to_epoch_seconds(row['date']) if time_column == 'ts' else row['date'], row['open'], row['high'], row['low'], row['close'], row['volume'])
+                for row in bars
             ]
 
             try:
                 cursor.execute("BEGIN")
                 cursor.executemany(
-                    "INSERT OR IGNORE INTO stock_data_5m (stock_id, date, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    f"INSERT OR IGNORE INTO stock_data_5m (stock_id, {time_column}, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?)",
                     data_to_insert
                 )
+                if time_column == 'ts':
+                    # aggregate the new bars into the rollup tables and the daily summary of the build scripts, if any
+                    bar_times = [row[1] for row in data_to_insert]
+                    refresh_rollups(conn, stock_id, min(bar_times), max(bar_times))
+                    refresh_daily_summary(conn, stock_id, min(bar_times), max(bar_times))
                 conn.commit()
-                logging.info("ReqID: %s. Data inserted successfully.", req_id)
+                logging.info("ReqID: %s. Stock %s. Data inserted successfully.", req_id, stock_id)
             except Exception as e:
                 logging.error("Error inserting data: %s", e)
                 conn.rollback()
-                self.failed_to_insert_symbols.append(stock_id)
+                insert_error = f"insert failed: {e}"
 
             conn.close()
 
-        self.bars[req_id].clear()
-        self.mark_request_completion(req_id)
+        self.scheduler.finish_request(req_id, insert_error)
+
+
+    def request_historical_data(self, req_id, stock_id):
+        contract = Contract()
+        contract.symbol = self.symbols_by_id[stock_id]
+        contract.secType = 'STK'
+        contract.exchange = 'SMART'
+        contract.currency = 'USD'
+        what_to_show = 'TRADES'
 
+        self.bars[req_id] = []
+        self.reqHistoricalData(
+            req_id, contract, self.end_date, self.time_period, self.bar_size, what_to_show, True, 1, False, []
+        )
 
-    def fetch_historical_data(self, end_date, time_period, bar_size):
-        end_date = convert_date_to_ib_format(end_date)
-        for id, symbol in self.symbol_list:
-            self.completion_status[id] = False
-            contract = Contract()
-            contract.symbol = symbol
-            contract.secType = 'STK'
-            contract.exchange = 'SMART'
-            contract.currency = 'USD'
-            what_to_show = 'TRADES'
+    def cancel_historical_data(self, req_id):
+        self.bars.pop(req_id, None)
+        self.cancelHistoricalData(req_id)
 
-            self.bars[id] = []
-            self.reqHistoricalData(
-                id, contract, end_date, time_period, bar_size, what_to_show, True, 1, False, []
-            )
+    def fetch_historical_data(self, end_date, time_period, bar_size, scheduler):
+        # requests the stocks that are still pending in the job of the scheduler, returns once all are finished
+        self.end_date = convert_date_to_ib_format(end_date)
+        self.time_period = time_period
+        self.bar_size = bar_size
+        self.scheduler = scheduler
+        stock_ids = [id for id, symbol in self.symbol_list if scheduler.job.get_status(id) == PENDING]
+        logging.info("Requesting %s of %s stocks, the others are finished in the job state", len(stock_ids), len(self.symbol_list))
+        scheduler.run(stock_ids, self.isConnected)
 
 
 def get_symbols_from_db(is_blacklisted=0, new_stocks_only=None):
@@ -280,9 +292,29 @@ new_stocks_only = False
 ## Set to False if you just want to test fetching data without writing to DB (did this for debugging purposes)
 write_to_db = True
 
-## Timeout duration in seconds. Time to wait after last data received before marking remaining stocks as failed
-## Resets every time data is received for any stock (or an error occurs)
-timeout_duration = 60 * 30  # 30 minutes timeout
+## Connection to TWS / IB Gateway (or fake_ib_gateway.py for trying the download without IB)
+ib_host = '127.0.0.1'
+ib_port = 7497
+ib_client_id = 5
+
+## Download scheduling (see download_scheduler.py)
+## Requests that are sent but not answered yet. IB allows at most 50
+max_in_flight_requests = 10
+## IB's hard pacing limit (60 requests in 10 minutes) applies to bars of 30 seconds or less. Larger bars are only
+## soft throttled by IB, they are requested at soft_pacing_limit (requests, period in seconds) instead
+soft_pacing_limit = (60, 60)
+## Requests sent at once before the pacing rate applies
+pacing_burst = 6
+## Requests per stock before it is marked failed, retries wait retry_backoff seconds, doubled on every attempt
+max_attempts = 5
+retry_backoff = 15
+max_retry_backoff = 60 * 10
+## Timeout duration in seconds. Requests without an answer after it are cancelled and retried
+request_timeout = 60 * 10  # 10 minutes timeout
+
+## Status of every stock of the download. A killed run started again with the same parameters only requests
+## the stocks that are not finished yet. Delete the file to download everything again
+job_state_file = 'logs/db_population_job.json'
 
 #Parameters for date, duration, bar granularity
 end_date_str = '2025-12-02 23:00:00'
@@ -313,29 +345,34 @@ symbols = get_symbols_from_db_by_id(symbols_to_get=[1674, 1704, 1760, 1791, 1799
 #symbols = symbols[0:5]   #choose how many stocks you want to get data for. useful for creating smaller batches
 
 
-ib_client = IBClient('127.0.0.1', 7497, 5, symbols, insert_to_db=write_to_db)
+job = DownloadJob(job_state_file, {'engine_name': engine_name, 'end_date': end_date_str, 'time_period': time_period, 'bar_size': bar_size})
+if job.load():
+    logging.info("Resuming the job of %s: %s stocks done, %s blacklisted, %s failed", job_state_file,
+                 len(job.get_stock_ids(DONE)), len(job.get_stock_ids(BLACKLISTED)), len(job.get_stock_ids(FAILED)))
+job.add_symbols(symbols)
+
+pacing_limit = get_pacing_limit(bar_size) or soft_pacing_limit
+token_bucket = TokenBucket.for_limit(*pacing_limit, burst=pacing_burst)
+
+ib_client = IBClient(ib_host, ib_port, ib_client_id, symbols, insert_to_db=write_to_db)
+scheduler = DownloadScheduler(job, ib_client.request_historical_data, ib_client.cancel_historical_data, token_bucket,
+                              max_in_flight=max_in_flight_requests, max_attempts=max_attempts, backoff_base=retry_backoff,
+                              backoff_max=max_retry_backoff, request_timeout=request_timeout)
 
 logging.info("Populating database for %s stocks. Symbols: %s", len(symbols), symbols)
-logging.info("Started")
+logging.info("Started. Pacing limit: %s requests in %s seconds, at most %s requests in flight", *pacing_limit, scheduler.max_in_flight)
 
 try:
-    ib_client.fetch_historical_data(end_date_str, time_period, bar_size)
+    ib_client.fetch_historical_data(end_date_str, time_period, bar_size, scheduler)
 
-    while not all(ib_client.completion_status.values()):
-        time.sleep(1)
-        # Check for timeout
-        if time.monotonic() - ib_client.last_update > timeout_duration:
-            logging.error("Timeout occurred while fetching data.")
-            missing_stocks = [stock_id for stock_id, completed in ib_client.completion_status.items() if not completed]
-            logging.info("Missing stocks after timeout: %s", missing_stocks)
-            #ib_client.mark_stocks_for_blacklisting(missing_stocks)
-            break
-        continue
-
-    blacklist_stocks(ib_client.symbols_to_blacklist, symbols, write_to_db=write_to_db)
-    logging.info("Fetched data but failed to insert into database for %s stocks: %s", len(ib_client.failed_to_insert_symbols), ib_client.failed_to_insert_symbols)
-    logging.info("Received errors for %s stocks. Review for retry or blacklist: %s", len(ib_client.erroneous_symbols), [error[0] for error in ib_client.erroneous_symbols])
-    logging.info("Details of erroneous stocks: %s", ib_client.erroneous_symbols)
+    pending_stocks = [stock_id for stock_id, _ in symbols if job.get_status(stock_id) == PENDING]
+    if pending_stocks:
+        logging.info("Missing stocks, run again to resume: %s", pending_stocks)
+
+    blacklist_stocks(job.get_stock_ids(BLACKLISTED), symbols, write_to_db=write_to_db)
+    failed_stocks = job.get_errors(FAILED)
+    logging.info("Failed for %s stocks. Review for retry or blacklist: %s", len(failed_stocks), [stock_id for stock_id, _ in failed_stocks])
+    logging.info("Details of failed stocks: %s", failed_stocks)
 
 except Exception as e:
     logging.error("Error fetching data: %s", e)
@@ -343,5 +380,3 @@ except Exception as e:
 finally:
     logging.info("Finished")
     ib_client.disconnect()
-
-
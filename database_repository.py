@@ -1,6 +1,82 @@
 
+import calendar
+import itertools
+import logging
+import os
 import random
 import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from connection_pool import ConnectionPool
+from rollup_tables import get_rollup_tables
+
+# rows fetched from the cursor at a time by iter_stock_data_records
+STOCK_DATA_CHUNK_SIZE = 100000
+# symbols per query of iter_stock_data_records, larger requests are read in chunks of symbols on READ_THREADS threads
+SYMBOLS_PER_READ = 64
+READ_THREADS = min(4, os.cpu_count() or 1)
+
+# One record per 5 minute bar, datetime is the stored (naive) bar time as int64 epoch seconds
+STOCK_DATA_RECORD = np.dtype([
+    ('datetime', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+])
+
+# One record per bucket of a rollup table, datetime is the bucket start and slot_mask marks its 5 minute bars
+ROLLUP_RECORD = np.dtype(STOCK_DATA_RECORD.descr + [('slot_mask', '<i8')])
+
+# One record per session day of stock_daily_summary for one opening window, see daily_summary.py
+DAILY_SUMMARY_RECORD = np.dtype([
+    ('day', '<M8[D]'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('bar_count', '<i8'),
+    ('window_volume', '<i8'),
+    ('window_high', '<f8'),
+    ('window_low', '<f8'),
+])
+
+
+# Layout of stock_data_5m written by migrate_stock_data.py: bar times as int64 epoch seconds in ts,
+# stored clustered by (stock_id, ts) so the bars of one stock over a time range are one contiguous range scan.
+# Databases with the old text date column are still read and written, see get_stock_data_time_column.
+STOCK_DATA_SCHEMA = """
+    CREATE TABLE {table_name} (
+    stock_id INTEGER NOT NULL, 
+    ts INTEGER NOT NULL, 
+    open REAL, 
+    high REAL, 
+    low REAL, 
+    close REAL, 
+    volume INTEGER, 
+    is_synthetic INTEGER DEFAULT 0, 
+    PRIMARY KEY (stock_id, ts)
+    ) WITHOUT ROWID;
+    """
+
+
+def to_epoch_seconds(date_time):
+    # naive bar time (datetime or 'YYYY-MM-DD HH:MM:SS' string) to the epoch seconds of the ts column,
+    # the bar time is read as UTC so the stored value keeps the wall clock time of the text dates
+    if isinstance(date_time, str):
+        date_time = datetime.strptime(date_time, "%Y-%m-%d %H:%M:%S")
+    return calendar.timegm(date_time.timetuple())
+
+
+def get_stock_data_time_column(db_conn, table_name="stock_data_5m"):
+    # 'ts' for the integer epoch layout, 'date' for databases that were not migrated yet
+    columns = [row[1] for row in db_conn.execute(f"PRAGMA table_info({table_name})")]
+    return 'ts' if 'ts' in columns else 'date'
 
 
 class DatabaseRepository:
@@ -8,6 +84,69 @@ class DatabaseRepository:
         self.engine_name = engine_name
         self.stocks_table_name = "stocks"
         self.stock_data_table_name = "stock_data_5m"
+        self.daily_summary_table_name = "stock_daily_summary"
+        self.connection_pool = ConnectionPool(engine_name)
+        # read-only connections of the threads reading symbol chunks in parallel
+        self.read_connection_pool = ConnectionPool(engine_name, read_only=True)
+        self.read_executor = None
+        self.read_executor_pid = None
+        self.symbol_table_ids = itertools.count()
+        # names of the temporary symbol tables of each connection (by id) that no query is using,
+        # see create_symbol_table
+        self.free_symbol_tables = {}
+
+    # SQL of the bar time as 'YYYY-MM-DD HH:MM:SS' text, the bar time as stored and the condition of a
+    # time range with its parameters, for the layout of the stock data table of the connection
+    def get_stock_data_time_sql(self, db_conn, start_time=None, end_time=None):
+        if get_stock_data_time_column(db_conn, self.stock_data_table_name) == 'ts':
+            return ("strftime('%Y-%m-%d %H:%M:%S', sd.ts, 'unixepoch')", "sd.ts", "sd.ts BETWEEN ? AND ?",
+                    [to_epoch_seconds(start_time), to_epoch_seconds(end_time)] if start_time is not None else [])
+        return "sd.date", "sd.date", "sd.date BETWEEN ? AND ?", [str(start_time), str(end_time)] if start_time is not None else []
+
+    # the table iter_stock_data_records reads bars of bar_granularity seconds from: the coarsest rollup table
+    # whose granularity divides bar_granularity, stock_data_5m if there is none or bar_granularity is None
+    def get_stock_data_table_name(self, db_conn, bar_granularity=None):
+        if bar_granularity is None or get_stock_data_time_column(db_conn, self.stock_data_table_name) != 'ts':
+            return self.stock_data_table_name
+
+        rollup_tables = get_rollup_tables(db_conn)
+        granularities = [granularity for granularity in rollup_tables if bar_granularity % granularity == 0]
+        return rollup_tables[max(granularities)] if granularities else self.stock_data_table_name
+
+    # load the symbols into an indexed temporary table that the queries join instead of one IN placeholder
+    # per symbol, which stays below SQLite's variable limit and lets the join walk the symbols in order
+    # the tables are kept and refilled, so each connection only sees a few table names and its cached
+    # statements of the queries are reused; a query started while another one of the connection still
+    # reads its table (e.g. a streamed query) gets a second name
+    # return the table name, hand it back with release_symbol_table once the query is done
+    def create_symbol_table(self, db_conn, symbol_list):
+        free_tables = self.free_symbol_tables.setdefault(id(db_conn), [])
+        table_name = free_tables.pop() if free_tables else f"requested_symbols_{next(self.symbol_table_ids)}"
+        db_conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table_name} (symbol TEXT PRIMARY KEY) WITHOUT ROWID")
+        db_conn.execute("BEGIN")
+        db_conn.execute(f"DELETE FROM temp.{table_name}")
+        db_conn.executemany(f"INSERT OR IGNORE INTO temp.{table_name} (symbol) VALUES (?)", ((symbol,) for symbol in symbol_list))
+        db_conn.execute("COMMIT")
+        return table_name
+
+    def release_symbol_table(self, db_conn, table_name):
+        self.free_symbol_tables.setdefault(id(db_conn), []).append(table_name)
+
+    # thread pool of iter_stock_data_records, created again in a forked process whose threads are gone
+    def get_read_executor(self):
+        if self.read_executor is None or self.read_executor_pid != os.getpid():
+            self.read_executor = ThreadPoolExecutor(READ_THREADS, thread_name_prefix="stock-data-read")
+            self.read_executor_pid = os.getpid()
+        return self.read_executor
+
+    # close the pooled connections and read threads, the repository reconnects on its next query
+    def close(self):
+        if self.read_executor is not None and self.read_executor_pid == os.getpid():
+            self.read_executor.shutdown()
+        self.read_executor = None
+        self.connection_pool.close()
+        self.read_connection_pool.close()
+        self.free_symbol_tables = {}
 
     # get all non-blacklisted stocks from our "stocks" table
     # if count is -1, get all stocks, else get random sample of count stocks
@@ -15,15 +154,15 @@ class DatabaseRepository:
     def get_stocks(self, count=-1, is_blacklisted=0):
         try:
             symbols = []
-            db_conn = sqlite3.connect(self.engine_name)
+            db_conn = self.connection_pool.get_connection()
             db_cursor = db_conn.cursor()
-            query = f"select symbol FROM {self.stocks_table_name} where is_blacklisted = {is_blacklisted}"
-            db_cursor.execute(query)
+            query = f"select symbol FROM {self.stocks_table_name} where is_blacklisted = ?"
+            db_cursor.execute(query, (is_blacklisted,))
 
             for row in db_cursor.fetchall():
                 symbols.append(row[0])
 
-            db_conn.close()
+            db_cursor.close()
 
             if count == -1 or count > len(symbols):
                 return symbols
@@ -40,20 +179,24 @@ class DatabaseRepository:
     def get_stocks_by_name(self, symbols_to_get):
         try:
             symbols = []
-            db_conn = sqlite3.connect(self.engine_name)
-            db_cursor = db_conn.cursor()
+            db_conn = self.connection_pool.get_connection()
+            symbol_table = self.create_symbol_table(db_conn, symbols_to_get)
+            try:
+                db_cursor = db_conn.cursor()
 
-            query = f"""
-            SELECT id, symbol FROM stocks
-            where is_blacklisted = 0
-            and symbol in ({','.join(['?']*len(symbols_to_get))}) """
+                query = f"""
+                SELECT s.id, s.symbol FROM temp.{symbol_table} r
+                CROSS JOIN stocks s ON s.symbol = r.symbol
+                where s.is_blacklisted = 0 """
 
-            db_cursor.execute(query, symbols_to_get)
+                db_cursor.execute(query)
 
-            for row in db_cursor.fetchall():
-                symbols.append((row[0], row[1]))
+                for row in db_cursor.fetchall():
+                    symbols.append((row[0], row[1]))
 
-            db_conn.close()
+                db_cursor.close()
+            finally:
+                self.release_symbol_table(db_conn, symbol_table)
             return symbols
 
         except Exception as e:
@@ -65,15 +208,159 @@ class DatabaseRepository:
     # symbol_list is a list of symbol strings
     # start_time and end_time are strings in format 'YYYY-MM-DD HH:MM:SS'
     # return list of tuples (symbol, date, open, high, low, close, volume)
-    # ordered by symbol and date
+    # ordered by symbol and date, dates are 'YYYY-MM-DD HH:MM:SS' strings for both table layouts
     def get_stock_data(self, start_time, end_time, symbol_list):
         try:
-            db_conn = sqlite3.connect(self.engine_name)
+            db_conn = self.connection_pool.get_connection()
+            symbol_table = self.create_symbol_table(db_conn, symbol_list)
+            try:
+                db_cursor = db_conn.cursor()
+                date_column, time_column, time_condition, time_parameters = self.get_stock_data_time_sql(db_conn, start_time, end_time)
+                query = self.get_stock_data_query(symbol_table, date_column, time_column, time_condition)
+
+                print("Query:" + query)
+
+                db_cursor.execute(query, time_parameters)
+
+                rows = db_cursor.fetchall()
+                db_cursor.close()
+            finally:
+                self.release_symbol_table(db_conn, symbol_table)
+            return rows
+
+        except Exception as e:
+            print("Error fetching stock data: %s", e)
+            return []
+    
+    # SQL of the bars of the symbols of a symbol table, joined in symbol order so that each stock's
+    # bars come straight from the (stock_id, date) key in time order without sorting
+    # stock_data_table_name is a rollup table or stock_data_5m (the default), extra_columns more SQL columns of it
+    def get_stock_data_query(self, symbol_table, date_column, time_column, time_condition, stock_data_table_name=None, extra_columns=()):
+        return f"""
+                SELECT 
+                s.symbol, 
+                {date_column}, 
+                sd.open, 
+                sd.high, 
+                sd.low, 
+                sd.close, 
+                sd.volume{''.join(f', {column}' for column in extra_columns)}
+                FROM 
+                temp.{symbol_table} r
+                CROSS JOIN 
+                {self.stocks_table_name} s
+                ON 
+                s.symbol = r.symbol
+                CROSS JOIN 
+                {stock_data_table_name or self.stock_data_table_name} sd
+                ON 
+                sd.stock_id = s.id
+                WHERE 
+                {time_condition}
+                ORDER BY 
+                r.symbol, 
+                {time_column};
+                """
+
+    # stream the stock data of get_stock_data as NumPy records, one symbol at a time
+    # the cursor is read chunk_size rows at a time, so only one chunk and the records of the current symbol are held
+    # requests of more than SYMBOLS_PER_READ symbols are split into chunks of symbols, read concurrently on the
+    # read threads (at most READ_THREADS chunks ahead of the one being yielded) and merged in symbol order
+    # with bar_granularity (seconds) the buckets of the coarsest matching rollup table are read instead of the 5 minute
+    # bars, as ROLLUP_RECORD arrays of the buckets that start between start_time and end_time
+    # yield tuples (symbol, STOCK_DATA_RECORD array ordered by date) in symbol order
+    def iter_stock_data_records(self, start_time, end_time, symbol_list, chunk_size=STOCK_DATA_CHUNK_SIZE, bar_granularity=None):
+        stock_data_table_name = self.get_stock_data_table_name(self.connection_pool.get_connection(), bar_granularity)
+        if stock_data_table_name != self.stock_data_table_name:
+            logging.info(f"Reading {bar_granularity} second bars from {stock_data_table_name}")
+
+        if len(symbol_list) <= SYMBOLS_PER_READ:
+            yield from self.read_stock_data_records(self.connection_pool, start_time, end_time, symbol_list, chunk_size, stock_data_table_name)
+            return
+
+        symbol_list = sorted(set(symbol_list))
+        read_executor = self.get_read_executor()
+        pending_reads = deque()
+        for first in range(0, len(symbol_list), SYMBOLS_PER_READ):
+            symbols = symbol_list[first:first + SYMBOLS_PER_READ]
+            pending_reads.append(read_executor.submit(
+                lambda symbols=symbols: list(self.read_stock_data_records(self.read_connection_pool, start_time, end_time, symbols, chunk_size, stock_data_table_name))
+            ))
+            if len(pending_reads) > READ_THREADS:
+                yield from pending_reads.popleft().result()
+
+        while pending_reads:
+            yield from pending_reads.popleft().result()
+
+    # iter_stock_data_records of one query on the connection of the calling thread in connection_pool
+    def read_stock_data_records(self, connection_pool, start_time, end_time, symbol_list, chunk_size=STOCK_DATA_CHUNK_SIZE, stock_data_table_name=None):
+        db_conn = None
+        db_cursor = None
+        symbol_table = None
+        try:
+            db_conn = connection_pool.get_connection()
+            symbol_table = self.create_symbol_table(db_conn, symbol_list)
             db_cursor = db_conn.cursor()
+            _, time_column, time_condition, time_parameters = self.get_stock_data_time_sql(db_conn, start_time, end_time)
+            is_rollup = stock_data_table_name not in (None, self.stock_data_table_name)
+            record_dtype = ROLLUP_RECORD if is_rollup else STOCK_DATA_RECORD
+            query = self.get_stock_data_query(symbol_table, time_column, time_column, time_condition, stock_data_table_name,
+                                              ['COALESCE(sd.slot_mask, 0)'] if is_rollup else [])
+
+            db_cursor.execute(query, time_parameters)
+            # bar times of the integer epoch layout are used as they are, text dates are parsed per chunk
+            is_epoch_layout = time_column == "sd.ts"
+            epoch_row_dtype = np.dtype([('symbol', object)] + record_dtype.descr)
+            text_row_dtype = np.dtype([('symbol', object), ('datetime', object)] + record_dtype.descr[1:])
+
+            symbol = None
+            symbol_chunks = []
+            while True:
+                rows = db_cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                # one pass over the row tuples, the fields are then copied into the records as arrays
+                row_array = np.array(rows, dtype=epoch_row_dtype if is_epoch_layout else text_row_dtype)
+                records = np.empty(len(rows), dtype=record_dtype)
+                records['datetime'] = row_array['datetime'] if is_epoch_layout else row_array['datetime'].astype('datetime64[s]').astype(np.int64)
+                for name in record_dtype.names[1:]:
+                    records[name] = row_array[name]
+
+                symbols = row_array['symbol']
+                starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+                for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+                    if symbols[start] != symbol:
+                        if symbol_chunks:
+                            yield symbol, np.concatenate(symbol_chunks)
+                        symbol = str(symbols[start])
+                        symbol_chunks = []
+                    symbol_chunks.append(records[start:end])
+
+            if symbol_chunks:
+                yield symbol, np.concatenate(symbol_chunks)
+
+        except Exception as e:
+            # re-raised, a stream that ended early would look like symbols without data
+            logging.error("Error streaming stock data: %s", e)
+            raise
+
+        finally:
+            if db_cursor is not None:
+                db_cursor.close()
+            if symbol_table is not None:
+                self.release_symbol_table(db_conn, symbol_table)
+
+    # get all stock data of one symbol
+    # return list of tuples (date, open, high, low, close, volume) ordered by date
+    def get_stock_data_for_symbol(self, symbol):
+        try:
+            db_conn = self.connection_pool.get_connection()
+            db_cursor = db_conn.cursor()
+            date_column, time_column, _, _ = self.get_stock_data_time_sql(db_conn)
             query = f"""
                 SELECT 
-                s.symbol, 
-                sd.date, 
+                {date_column}, 
                 sd.open, 
                 sd.high, 
                 sd.low, 
@@ -86,42 +373,146 @@ class DatabaseRepository:
                 ON 
                 sd.stock_id = s.id
                 WHERE 
-                s.symbol IN ({','.join(['?'] * len(symbol_list))})
-                AND sd.date BETWEEN '{start_time}' AND '{end_time}'
+                s.symbol = ?
                 ORDER BY 
-                s.symbol, 
-                sd.date;
+                {time_column};
                 """
 
-            print("Query:" + query)
-
-            db_cursor.execute(query, symbol_list)
-
+            db_cursor.execute(query, (symbol,))
             rows = db_cursor.fetchall()
-            db_conn.close()
+            db_cursor.close()
             return rows
 
         except Exception as e:
             print("Error fetching stock data: %s", e)
             return []
-    
+
+    # get a fingerprint of the stock data returned by get_stock_data for the same arguments
+    # used to notice changed data without fetching it
+    # return tuple (row count, min date, max date, sum of prices, sum of volumes)
+    def get_stock_data_fingerprint(self, start_time, end_time, symbol_list):
+        try:
+            db_conn = self.connection_pool.get_connection()
+            symbol_table = self.create_symbol_table(db_conn, symbol_list)
+            try:
+                db_cursor = db_conn.cursor()
+                _, time_column, time_condition, time_parameters = self.get_stock_data_time_sql(db_conn, start_time, end_time)
+                query = f"""
+                    SELECT 
+                    COUNT(*), 
+                    MIN({time_column}), 
+                    MAX({time_column}), 
+                    TOTAL(sd.open + sd.high + sd.low + sd.close), 
+                    TOTAL(sd.volume)
+                    FROM 
+                    temp.{symbol_table} r
+                    CROSS JOIN 
+                    {self.stocks_table_name} s
+                    ON 
+                    s.symbol = r.symbol
+                    CROSS JOIN 
+                    {self.stock_data_table_name} sd
+                    ON 
+                    sd.stock_id = s.id
+                    WHERE 
+                    {time_condition};
+                    """
+
+                db_cursor.execute(query, time_parameters)
+                row = db_cursor.fetchone()
+                db_cursor.close()
+            finally:
+                self.release_symbol_table(db_conn, symbol_table)
+            return row
+
+        except Exception as e:
+            print("Error fetching stock data fingerprint: %s", e)
+            return None
+
     # get stock float for given symbols
     # symbol_list is a list of symbol strings
     # return list of tuples (symbol, stock_float)
     def get_stock_float(self, symbol_list):
         try:
-            db_conn = sqlite3.connect(self.engine_name)
-            db_cursor = db_conn.cursor()
-            query = f"""select symbol, stock_float
-            from stocks
-            where symbol in ({','.join(['?']*len(symbol_list))});"""
+            db_conn = self.connection_pool.get_connection()
+            symbol_table = self.create_symbol_table(db_conn, symbol_list)
+            try:
+                db_cursor = db_conn.cursor()
+                query = f"""select s.symbol, s.stock_float
+                from temp.{symbol_table} r
+                cross join stocks s on s.symbol = r.symbol;"""
 
-            db_cursor.execute(query, symbol_list)
-            rows = db_cursor.fetchall()
-            db_conn.close()
+                db_cursor.execute(query)
+                rows = db_cursor.fetchall()
+                db_cursor.close()
+            finally:
+                self.release_symbol_table(db_conn, symbol_table)
             return rows
         except Exception as e:
             print("Error fetching stock float: %s", e)
             return []
 
-    
\ No newline at end of file
+    
+
+    # get the daily summary of the symbols for the days from start_day to end_day ('YYYY-MM-DD', inclusive)
+    # and the opening window of window_minutes
+    # return {symbol: DAILY_SUMMARY_RECORD array ordered by day}, symbols without days are left out,
+    # or None if the database has no summary of that window
+    def get_daily_summary(self, start_day, end_day, symbol_list, window_minutes):
+        try:
+            db_conn = self.connection_pool.get_connection()
+            if db_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.daily_summary_table_name,)).fetchone() is None:
+                return None
+            if db_conn.execute(f"SELECT 1 FROM {self.daily_summary_table_name} WHERE window_minutes = ? LIMIT 1", (window_minutes,)).fetchone() is None:
+                return None
+
+            symbol_table = self.create_symbol_table(db_conn, symbol_list)
+            try:
+                db_cursor = db_conn.cursor()
+                query = f"""
+                    SELECT 
+                    s.symbol, 
+                    ds.day, 
+                    ds.open, 
+                    ds.high, 
+                    ds.low, 
+                    ds.close, 
+                    ds.bar_count, 
+                    ds.window_volume, 
+                    ds.window_high, 
+                    ds.window_low
+                    FROM 
+                    temp.{symbol_table} r
+                    CROSS JOIN 
+                    {self.stocks_table_name} s
+                    ON 
+                    s.symbol = r.symbol
+                    CROSS JOIN 
+                    {self.daily_summary_table_name} ds
+                    ON 
+                    ds.stock_id = s.id
+                    WHERE 
+                    ds.day BETWEEN ? AND ? AND ds.window_minutes = ?
+                    ORDER BY 
+                    r.symbol, 
+                    ds.day;
+                    """
+
+                db_cursor.execute(query, [str(start_day), str(end_day), window_minutes])
+                rows = db_cursor.fetchall()
+                db_cursor.close()
+            finally:
+                self.release_symbol_table(db_conn, symbol_table)
+
+            summary = {}
+            if rows:
+                row_array = np.array(rows, dtype=[('symbol', object)] + DAILY_SUMMARY_RECORD.descr)
+                symbols = row_array['symbol']
+                starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]])
+                for start, end in zip(starts, np.r_[starts[1:], len(rows)]):
+                    summary[str(symbols[start])] = row_array[start:end][list(DAILY_SUMMARY_RECORD.names)].astype(DAILY_SUMMARY_RECORD)
+            return summary
+
+        except Exception as e:
+            print("Error fetching daily summary: %s", e)
+            return None
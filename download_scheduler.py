@@ -0,0 +1,322 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# IB's hard pacing limits of historical data requests for bars of 30 seconds or less: at most 60 requests
+# in any 10 minutes and no identical request within 15 seconds. Larger bars are only soft throttled by IB.
+IB_PACING_REQUESTS = 60
+IB_PACING_PERIOD = 600
+IB_IDENTICAL_REQUEST_INTERVAL = 15
+IB_PACED_BAR_SIZE = 30
+# IB rejects more than 50 simultaneous historical data requests
+IB_MAX_IN_FLIGHT = 50
+
+# status of a symbol in the job state file
+PENDING = "pending"
+DONE = "done"
+BLACKLISTED = "blacklisted"
+FAILED = "failed"
+
+# outcome of an error of a request
+PACING = "pacing"
+TRANSIENT = "transient"
+
+# 322: error processing request (also too many simultaneous requests), 504: not connected,
+# 10182: failed to request live updates (disconnected)
+TRANSIENT_ERROR_CODES = [322, 504, 10182]
+# 420: invalid real-time query (pacing violation)
+PACING_ERROR_CODES = [420]
+# 162: historical market data service error (no data), 200: no security definition found
+BLACKLIST_ERROR_CODES = [162, 200]
+
+BAR_SIZE_UNITS = {'sec': 1, 'secs': 1, 'min': 60, 'mins': 60, 'hour': 3600, 'hours': 3600, 'day': 86400, 'days': 86400,
+                  'week': 604800, 'weeks': 604800, 'month': 2592000, 'months': 2592000}
+
+
+def get_bar_size_seconds(bar_size):
+    # '5 mins' -> 300
+    value, unit = bar_size.split()
+    return int(value) * BAR_SIZE_UNITS[unit]
+
+
+def get_pacing_limit(bar_size):
+    # (requests, period in seconds) of IB's hard pacing limit for the bar size, None if IB only soft throttles it
+    if get_bar_size_seconds(bar_size) <= IB_PACED_BAR_SIZE:
+        return IB_PACING_REQUESTS, IB_PACING_PERIOD
+    return None
+
+
+def classify_error(code, msg):
+    """
+    Outcome of an error of a historical data request: PACING and TRANSIENT errors are retried with backoff,
+    BLACKLISTED symbols have no data (the stock does not exist anymore), all other errors mark the symbol FAILED.
+    Error 162 is used by the historical market data service for pacing violations, cancelled queries and
+    missing data alike, so its message decides.
+    """
+    text = msg.lower()
+    if code in PACING_ERROR_CODES or (code == 162 and 'pacing violation' in text):
+        return PACING
+    if code in TRANSIENT_ERROR_CODES or (code == 162 and ('cancelled' in text or 'connection' in text)):
+        return TRANSIENT
+    if code in BLACKLIST_ERROR_CODES:
+        return BLACKLISTED
+    return FAILED
+
+
+class TokenBucket:
+    """
+    Rate limit of the requests: the bucket holds at most capacity tokens, is refilled with rate tokens per
+    second and every request takes one. After pause() no tokens are handed out and refilling only starts
+    again once the pause is over.
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @classmethod
+    def for_limit(cls, requests, period, burst=1):
+        # a full bucket allows burst requests at once and burst + rate * period in any period, so at most requests
+        burst = max(1, min(burst, requests))
+        return cls(max(requests - burst, 1) / period, burst)
+
+    def refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_acquire(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.refill(now)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def pause(self, seconds, now=None):
+        now = time.monotonic() if now is None else now
+        self.refill(now)
+        self.tokens = 0
+        self.updated = max(self.updated, now + seconds)
+
+
+class DownloadJob:
+    """
+    Status of every symbol of a download, saved as JSON to state_file, so a run that is killed continues with
+    the symbols that are not finished yet when it is started again with the same parameters. A state file of
+    other parameters (end date, duration, bar size, database) is replaced by a new job.
+    """
+    def __init__(self, state_file, parameters):
+        self.state_file = state_file
+        self.parameters = parameters
+        self.symbols = {}
+        self.lock = threading.Lock()
+        self.changed = False
+
+    def load(self):
+        # returns True if the state of an earlier run of the same parameters was loaded
+        if not self.state_file or not os.path.exists(self.state_file):
+            return False
+        try:
+            with open(self.state_file) as state:
+                saved = json.load(state)
+        except (OSError, ValueError) as e:
+            logging.warning("Could not read the job state file %s, starting a new job: %s", self.state_file, e)
+            return False
+
+        if saved.get('parameters') != self.parameters:
+            logging.warning("Job state file %s belongs to other parameters %s, starting a new job", self.state_file, saved.get('parameters'))
+            return False
+
+        self.symbols = {int(stock_id): entry for stock_id, entry in saved.get('symbols', {}).items()}
+        return True
+
+    def add_symbols(self, symbols):
+        with self.lock:
+            for stock_id, symbol in symbols:
+                if stock_id not in self.symbols:
+                    self.symbols[stock_id] = {'symbol': symbol, 'status': PENDING, 'attempts': 0, 'error': None}
+                    self.changed = True
+
+    def get_status(self, stock_id):
+        entry = self.symbols.get(stock_id)
+        return entry['status'] if entry is not None else None
+
+    def get_stock_ids(self, status):
+        with self.lock:
+            return [stock_id for stock_id, entry in self.symbols.items() if entry['status'] == status]
+
+    def get_errors(self, status):
+        with self.lock:
+            return [(stock_id, entry['error']) for stock_id, entry in self.symbols.items() if entry['status'] == status]
+
+    def count_attempt(self, stock_id):
+        with self.lock:
+            self.symbols[stock_id]['attempts'] += 1
+            self.changed = True
+
+    def set_status(self, stock_id, status, error=None):
+        with self.lock:
+            self.symbols[stock_id]['status'] = status
+            self.symbols[stock_id]['error'] = error
+            self.changed = True
+
+    def save(self):
+        if not self.state_file:
+            return
+        with self.lock:
+            if not self.changed:
+                return
+            content = json.dumps({'parameters': self.parameters, 'symbols': self.symbols})
+            self.changed = False
+
+        # written next to the state file and renamed, so a killed run never leaves half a file behind
+        temp_file = f"{self.state_file}.tmp"
+        with open(temp_file, 'w') as state:
+            state.write(content)
+        os.replace(temp_file, self.state_file)
+
+
+class DownloadScheduler:
+    """
+    Sends the historical data requests of the pending symbols of a DownloadJob through send_request(req_id, stock_id)
+    and keeps at most max_in_flight of them open, taking a token of token_bucket for every request.
+
+    The IB client reports the outcome of every request with finish_request() and request_error() from its
+    message thread. Pacing violations and transient errors are requested again after an exponential backoff from
+    backoff_base up to backoff_max seconds, never earlier than IB allows an identical request, a pacing violation
+    also pauses all requests for the backoff. Requests without an answer after request_timeout seconds are cancelled
+    through cancel_request(req_id) and retried the same way. After max_attempts a symbol is marked FAILED.
+
+    Every request gets a new req_id, so late answers of cancelled requests are not mistaken for the answers of
+    their retries. The job state is saved every save_interval seconds and when the run ends.
+    """
+    def __init__(self, job, send_request, cancel_request, token_bucket, max_in_flight=10, max_attempts=5,
+                 backoff_base=IB_IDENTICAL_REQUEST_INTERVAL, backoff_max=600, request_timeout=600, save_interval=1, poll_interval=0.1):
+        self.job = job
+        self.send_request = send_request
+        self.cancel_request = cancel_request
+        self.token_bucket = token_bucket
+        self.max_in_flight = min(max_in_flight, IB_MAX_IN_FLIGHT)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.request_timeout = request_timeout
+        self.save_interval = save_interval
+        self.poll_interval = poll_interval
+        # reentrant, EClient reports some errors (not connected) from within reqHistoricalData
+        self.lock = threading.RLock()
+        self.queue = deque()
+        self.waiting = {}  # stock_id: monotonic time of the retry
+        self.in_flight = {}  # req_id: (stock_id, monotonic time of the request)
+        self.attempts = {}  # stock_id: requests of this run
+        self.last_request_time = {}  # stock_id: monotonic time of the last request
+        self.next_req_id = 1
+        self.requests_sent = 0
+        self.retries = 0
+        self.pacing_violations = 0
+
+    def get_stock_id(self, req_id):
+        # stock id of an open request, None if the request is not (or no longer) in flight
+        with self.lock:
+            request = self.in_flight.get(req_id)
+            return request[0] if request is not None else None
+
+    def finish_request(self, req_id, error=None):
+        # called by the IB client once the data of the request is stored, with error if storing it failed
+        with self.lock:
+            request = self.in_flight.pop(req_id, None)
+            if request is None:
+                return
+            self.job.set_status(request[0], FAILED if error else DONE, error)
+
+    def request_error(self, req_id, code, msg):
+        """
+        Handles an error message of an open request and returns its outcome (see classify_error),
+        None if req_id is not an open request of the job.
+        """
+        outcome = classify_error(code, msg)
+        with self.lock:
+            request = self.in_flight.pop(req_id, None)
+            if request is None:
+                return None
+            stock_id = request[0]
+            if outcome in (PACING, TRANSIENT):
+                outcome = self.schedule_retry(stock_id, f"{code}: {msg}", outcome, time.monotonic())
+            else:
+                self.job.set_status(stock_id, outcome, f"{code}: {msg}")
+        return outcome
+
+    def schedule_retry(self, stock_id, error, outcome, now):
+        # returns outcome, or FAILED once the symbol ran out of attempts
+        attempts = self.attempts.get(stock_id, 0)
+        if attempts >= self.max_attempts:
+            logging.error("Stock %s failed after %s attempts: %s", stock_id, attempts, error)
+            self.job.set_status(stock_id, FAILED, error)
+            return FAILED
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)) * random.uniform(1, 1.25)
+        if outcome == PACING:
+            self.pacing_violations += 1
+            self.token_bucket.pause(delay, now)
+        retry_time = max(now + delay, self.last_request_time.get(stock_id, now) + IB_IDENTICAL_REQUEST_INTERVAL)
+        self.waiting[stock_id] = retry_time
+        self.retries += 1
+        logging.warning("Retrying stock %s in %.0f seconds (attempt %s of %s): %s", stock_id, retry_time - now, attempts + 1, self.max_attempts, error)
+        return outcome
+
+    def expire_requests(self, now):
+        expired = [req_id for req_id, (_, request_time) in self.in_flight.items() if now - request_time > self.request_timeout]
+        for req_id in expired:
+            stock_id, _ = self.in_flight.pop(req_id)
+            self.cancel_request(req_id)
+            self.schedule_retry(stock_id, f"no answer within {self.request_timeout} seconds", TRANSIENT, now)
+
+    def send_requests(self, now):
+        for stock_id in [stock_id for stock_id, retry_time in self.waiting.items() if retry_time <= now]:
+            del self.waiting[stock_id]
+            self.queue.append(stock_id)
+
+        while self.queue and len(self.in_flight) < self.max_in_flight and self.token_bucket.try_acquire(now):
+            stock_id = self.queue.popleft()
+            req_id = self.next_req_id
+            self.next_req_id += 1
+            self.in_flight[req_id] = (stock_id, now)
+            self.attempts[stock_id] = self.attempts.get(stock_id, 0) + 1
+            self.last_request_time[stock_id] = now
+            self.requests_sent += 1
+            self.job.count_attempt(stock_id)
+            self.send_request(req_id, stock_id)
+
+    def run(self, stock_ids, is_connected=None):
+        """
+        Requests the historical data of stock_ids and returns once every one of them is finished, or early
+        if is_connected() turns False. Symbols that are not finished stay PENDING in the job state file.
+        """
+        self.queue.extend(stock_ids)
+        last_save = time.monotonic()
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    self.expire_requests(now)
+                    self.send_requests(now)
+                    if not self.queue and not self.waiting and not self.in_flight:
+                        break
+
+                if is_connected is not None and not is_connected():
+                    logging.error("Lost the connection to IB, %s stocks are left for the next run", len(self.queue) + len(self.waiting) + len(self.in_flight))
+                    break
+
+                if now - last_save >= self.save_interval:
+                    self.job.save()
+                    last_save = now
+                time.sleep(self.poll_interval)
+        finally:
+            self.job.save()
+            logging.info("Sent %s requests, %s retries, %s pacing violations", self.requests_sent, self.retries, self.pacing_violations)
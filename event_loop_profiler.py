@@ -0,0 +1,127 @@
+import json
+import logging
+import os
+import time
+
+from events.enums.event_type import EventType
+
+
+class EventLoopProfiler:
+    """
+    Collects wall time and call counts per event type and per loop stage, the depth of the
+    events queue and the bar throughput of the event loop, and writes them as a JSON report.
+
+    Stages are timed by wrapping the methods of the loop's components, events by the loop itself,
+    so the cost is two perf_counter() calls and a few dict updates per call.
+    """
+    def __init__(self):
+        # indexed by the EventType code of the event
+        self.event_counts = [0] * len(EventType)
+        self.event_times = [0.] * len(EventType)
+        self.stage_counts = {}
+        self.stage_times = {}
+
+        self.bar_steps = 0
+        self.symbol_bars = 0
+        self.bar_max_queue_depth = 0
+        self.queue_depth_counts = {}
+        self.queue_depth_timeline = []  # [bar_step, depth] whenever the max depth of a bar differs from the bar before
+
+        self.start_time = time.perf_counter()
+        self.end_time = None
+
+    def instrument(self, component, method_name):
+        """
+        Replaces the method of the component instance by one that adds its duration to the stage of the same name.
+        """
+        method = getattr(component, method_name)
+        self.stage_counts[method_name] = 0
+        self.stage_times[method_name] = 0.
+
+        def timed_method(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.stage_times[method_name] += time.perf_counter() - started
+                self.stage_counts[method_name] += 1
+
+        setattr(component, method_name, timed_method)
+
+    def record_bar(self, symbol_count, queue_depth):
+        """
+        Called once per step of the loop after the new bars were pushed, with the queued MARKET events.
+        """
+        if self.bar_steps > 0:
+            self._finish_bar()
+        self.bar_steps += 1
+        self.symbol_bars += symbol_count
+        self.bar_max_queue_depth = queue_depth
+
+    def record_event(self, event_type, duration, queue_depth):
+        self.event_counts[event_type] += 1
+        self.event_times[event_type] += duration
+        if queue_depth > self.bar_max_queue_depth:
+            self.bar_max_queue_depth = queue_depth
+
+    def _finish_bar(self):
+        depth = self.bar_max_queue_depth
+        self.queue_depth_counts[depth] = self.queue_depth_counts.get(depth, 0) + 1
+        if not self.queue_depth_timeline or self.queue_depth_timeline[-1][1] != depth:
+            self.queue_depth_timeline.append([self.bar_steps, depth])
+
+    def stop(self):
+        if self.end_time is None:
+            if self.bar_steps > 0:
+                self._finish_bar()
+            self.end_time = time.perf_counter()
+
+    def get_report(self):
+        self.stop()
+        wall_time = self.end_time - self.start_time
+        bars_with_depth = sum(self.queue_depth_counts.values())
+
+        return {
+            'wall_time_sec': wall_time,
+            'bar_steps': self.bar_steps,
+            'symbol_bars': self.symbol_bars,
+            'bar_steps_per_sec': self.bar_steps / wall_time if wall_time > 0 else 0,
+            'symbol_bars_per_sec': self.symbol_bars / wall_time if wall_time > 0 else 0,
+            'events': {
+                event_type.name: {
+                    'count': self.event_counts[event_type],
+                    'total_sec': self.event_times[event_type],
+                    'mean_us': self.event_times[event_type] / self.event_counts[event_type] * 1e6 if self.event_counts[event_type] > 0 else 0,
+                }
+                for event_type in EventType
+            },
+            'stages': {
+                stage: {
+                    'count': count,
+                    'total_sec': self.stage_times[stage],
+                    'mean_us': self.stage_times[stage] / count * 1e6 if count > 0 else 0,
+                    'share_of_wall_time': self.stage_times[stage] / wall_time if wall_time > 0 else 0,
+                }
+                for stage, count in self.stage_counts.items()
+            },
+            'queue_depth': {
+                'max': max(self.queue_depth_counts, default=0),
+                'mean': sum(depth * count for depth, count in self.queue_depth_counts.items()) / bars_with_depth if bars_with_depth > 0 else 0,
+                'bars_per_max_depth': {str(depth): count for depth, count in sorted(self.queue_depth_counts.items())},
+                'timeline': self.queue_depth_timeline,
+            },
+        }
+
+    def write_report(self, filename):
+        report = self.get_report()
+
+        dir = "performance"
+        if not os.path.exists(dir):
+            os.makedirs(dir)
+
+        report_path = os.path.join(dir, filename + '_event_loop.json')
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        logging.info(f"Event loop: {report['bar_steps']} bar steps in {report['wall_time_sec']:.2f}s, "
+                     f"{report['symbol_bars_per_sec']:.0f} symbol bars/sec, report written to {report_path}")
@@ -0,0 +1,8 @@
+from enum import IntEnum
+
+class EventType(IntEnum):
+    # values are consecutive so they can index the handler table of the EventDispatcher
+    MARKET = 0
+    SIGNAL = 1
+    ORDER = 2
+    FILL = 3
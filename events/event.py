@@ -3,5 +3,10 @@ class Event:
         Event is base class providing an interface for all subsequent
         (inherited) events, that will trigger further events in the
         trading infrastructure.
+
+        Events are created for every signal, order and fill, so they
+        keep their fields in __slots__ instead of an instance dict. The
+        type code is a class attribute holding an EventType.
         """
-    pass
\ No newline at end of file
+    __slots__ = ()
+    type = None
\ No newline at end of file
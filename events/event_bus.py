@@ -0,0 +1,77 @@
+from abc import ABC, abstractmethod
+from collections import deque
+import queue
+
+
+class EventBus(ABC):
+    """
+        Queue the events of the trading loop are put on and taken from.
+        Strategies, portfolio, data and execution handlers only call
+        put(), the loop takes the events in FIFO order with get(), which
+        returns None once the bus is empty.
+        """
+    @abstractmethod
+    def put(self, event):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def empty(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def qsize(self):
+        raise NotImplementedError
+
+
+class DequeEventBus(EventBus):
+    """
+        Event bus for backtests, where everything runs on one thread.
+        A plain deque without locks or queue.Empty exceptions.
+        """
+    def __init__(self):
+        self.events = deque()
+
+    def put(self, event):
+        self.events.append(event)
+
+    def get(self):
+        events = self.events
+        return events.popleft() if events else None
+
+    def empty(self):
+        return not self.events
+
+    def qsize(self):
+        return len(self.events)
+
+
+class ThreadSafeEventBus(EventBus):
+    """
+        Event bus for live trading, where the IB client threads put
+        fills and bars while the trading loop takes the events.
+        """
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def put(self, event):
+        self.events.put(event)
+
+    def get(self):
+        try:
+            return self.events.get(block=False)
+        except queue.Empty:
+            return None
+
+    def empty(self):
+        return self.events.empty()
+
+    def qsize(self):
+        return self.events.qsize()
+
+
+def create_event_bus(is_backtest):
+    return DequeEventBus() if is_backtest else ThreadSafeEventBus()
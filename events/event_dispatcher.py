@@ -0,0 +1,18 @@
+from events.enums.event_type import EventType
+
+
+class EventDispatcher:
+    """
+        Table of the handlers of each event type, indexed by the
+        EventType code of the event. The handlers of a type are called
+        in the order they were registered.
+        """
+    def __init__(self):
+        self.handlers = [[] for _ in EventType]
+
+    def register(self, event_type, handler):
+        self.handlers[event_type].append(handler)
+
+    def dispatch(self, event):
+        for handler in self.handlers[event.type]:
+            handler(event)
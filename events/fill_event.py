@@ -1,3 +1,4 @@
+from events.enums.event_type import EventType
 from events.event import Event
 
 
@@ -8,6 +9,9 @@ class FillEvent(Event):
         actually filled and at what price. In addition, stores
         the commission of the trade from the brokerage.
         """
+    __slots__ = ('timeindex', 'symbol', 'exchange', 'quantity', 'direction', 'fill_cost', 'commission')
+    type = EventType.FILL
+
     def __init__(self, timeindex, symbol, exchange, quantity, direction, fill_cost, commission=None):
         """
                Initialises the FillEvent object. Sets the symbol, exchange,
@@ -27,7 +31,6 @@ class FillEvent(Event):
                fill_cost - The holdings value in dollars.
                commission - An optional commission sent from IB.
                """
-        self.type = 'FILL'
         self.timeindex = timeindex
         self.symbol = symbol
         self.exchange = exchange
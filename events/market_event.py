@@ -1,12 +1,21 @@
+from events.enums.event_type import EventType
 from events.event import Event
 
 class MarketEvent(Event):
     """
         Handles the event of receiving a new market update with
         corresponding bars.
+
+        bars is the MarketBatch holding the new bars of all symbols
+        when the data handler can batch them. Without a batch the
+        event carries no data, use the shared MARKET_EVENT instead of
+        creating a new one for every bar.
         """
-    def __init__(self):
-        """
-                Initialises the MarketEvent.
-                """
-        self.type = 'MARKET'
\ No newline at end of file
+    __slots__ = ('bars',)
+    type = EventType.MARKET
+
+    def __init__(self, bars=None):
+        self.bars = bars
+
+
+MARKET_EVENT = MarketEvent()
\ No newline at end of file
@@ -1,3 +1,4 @@
+from events.enums.event_type import EventType
 from events.event import Event
 
 
@@ -7,6 +8,9 @@ class OrderEvent(Event):
         The order contains a symbol (e.g. GOOG), a type (market or limit),
         quantity and a direction.
         """
+    __slots__ = ('symbol', 'order_type', 'quantity', 'direction', 'price')
+    type = EventType.ORDER
+
     def __init__(self, symbol, order_type, quantity, direction, price=0):
         """
                 Initialises the order type, setting whether it is
@@ -20,7 +24,6 @@ class OrderEvent(Event):
                 quantity - Non-negative integer for quantity.
                 direction - 'BUY' or 'SELL' for long or short.
                 """
-        self.type = 'ORDER'
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = quantity
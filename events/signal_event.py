@@ -1,3 +1,4 @@
+from events.enums.event_type import EventType
 from events.event import Event
 
 
@@ -6,6 +7,9 @@ class SignalEvent(Event):
         Handles the event of sending a Signal from a Strategy object.
         This is received by a Portfolio object and acted upon.
         """
+    __slots__ = ('symbol', 'datetime', 'signal_type', 'quantity', 'price')
+    type = EventType.SIGNAL
+
     def __init__(self, symbol, datetime, signal_type, quantity, price=0):
         """
                 Initialises the SignalEvent.
@@ -15,7 +19,6 @@ class SignalEvent(Event):
                 datetime - The timestamp at which the signal was generated.
                 signal_type - 'LONG' or 'SHORT'.
                 """
-        self.type = 'SIGNAL'
         self.symbol = symbol
         self.datetime = datetime
         self.signal_type = signal_type
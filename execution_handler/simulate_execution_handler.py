@@ -1,3 +1,4 @@
+from events.enums.event_type import EventType
 from events.fill_event import FillEvent
 from execution_handler.execution_handler import ExecutionHandler
 from datetime import datetime
@@ -16,7 +17,7 @@ class SimulateExecutionHandler(ExecutionHandler):
             callback(symbol, direction, fill_price)
 
     def execute_order(self, event):
-        if event.type == 'ORDER':
+        if event.type == EventType.ORDER:
             if self.verbose: print("Order Executed:", "Symbol:", event.symbol, "Qty:", event.quantity, event.direction)
             fill_event = FillEvent(datetime.utcnow(), event.symbol, 'ARCA', event.quantity, event.direction, event.price)
             #self.notify_fill_listeners(event.symbol, event.direction, event.price)
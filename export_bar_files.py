@@ -0,0 +1,28 @@
+import logging
+import sys
+
+import config
+from data_handlers.bar_file_store import BarFileStore
+from database_repository import DatabaseRepository
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def export_bar_files(engine_name, directory, symbols=None):
+    """
+    Builds a bar file store in directory from the 5 minute bars in the database,
+    for all non-blacklisted stocks unless symbols are given.
+    """
+    database_repository = DatabaseRepository(engine_name)
+    if not symbols:
+        symbols = database_repository.get_stocks()
+
+    bar_file_store = BarFileStore(directory)
+    bar_file_store.export_from_database(database_repository, symbols)
+    logging.info(f"Exported {len(symbols)} stocks to {directory}")
+
+
+if __name__ == "__main__":
+    # usage: python export_bar_files.py [directory] [symbol ...]
+    directory = sys.argv[1] if len(sys.argv) > 1 else (config.bar_file_dir or 'bar_files')
+    export_bar_files(config.engine_name, directory, sys.argv[2:])
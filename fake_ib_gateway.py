@@ -0,0 +1,261 @@
+import argparse
+import logging
+import random
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from download_scheduler import IB_IDENTICAL_REQUEST_INTERVAL, IB_MAX_IN_FLIGHT, IB_PACING_PERIOD, IB_PACING_REQUESTS, get_bar_size_seconds
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Server version announced to the API client. Old enough for the simple message layouts below
+# (no version field in historical data messages, no advanced order reject field in errors)
+SERVER_VERSION = 152
+
+# message ids of the IB API socket protocol
+IN_REQ_HISTORICAL_DATA = 20
+IN_CANCEL_HISTORICAL_DATA = 25
+IN_START_API = 71
+OUT_ERR_MSG = 4
+OUT_NEXT_VALID_ID = 9
+OUT_MANAGED_ACCTS = 15
+OUT_HISTORICAL_DATA = 17
+
+PACING_VIOLATION = (162, "Historical Market Data Service error message:Historical data request pacing violation")
+TOO_MANY_REQUESTS = (322, "Error processing request:-'bW' : cause - Only {} simultaneous API historical data requests allowed.")
+NO_DEFINITION = (200, "No security definition has been found for the request")
+NO_DATA = (162, "Historical Market Data Service error message:HMDS query returned no data: {}@SMART Trades")
+QUERY_CANCELLED = (162, "Historical Market Data Service error message:API historical data query cancelled: {}")
+
+
+def make_message(fields):
+    text = "".join(f"{field}\0" for field in fields).encode()
+    return struct.pack("!I", len(text)) + text
+
+
+class FakeHistoricalDataFarm:
+    """
+    Answers historical data requests with synthetic bars of the regular trading hours, after latency seconds,
+    and enforces the pacing rules of IB: at most pacing_requests in any pacing_period seconds, no identical
+    request within identical_interval seconds and at most max_simultaneous open requests.
+    Symbols of unknown_symbols have no contract definition, those of no_data_symbols no data, error_rate
+    of the requests are cancelled by the farm and drop_rate of them are never answered.
+    """
+    def __init__(self, latency=0.2, pacing_requests=IB_PACING_REQUESTS, pacing_period=IB_PACING_PERIOD,
+                 identical_interval=IB_IDENTICAL_REQUEST_INTERVAL, max_simultaneous=IB_MAX_IN_FLIGHT, unknown_symbols=(),
+                 no_data_symbols=(), error_rate=0.0, drop_rate=0.0, session_open='15:30', session_close='22:00', seed=None):
+        self.latency = latency
+        self.pacing_requests = pacing_requests
+        self.pacing_period = pacing_period
+        self.identical_interval = identical_interval
+        self.max_simultaneous = max_simultaneous
+        self.unknown_symbols = set(unknown_symbols)
+        self.no_data_symbols = set(no_data_symbols)
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.session_open = datetime.strptime(session_open, '%H:%M')
+        self.session_close = datetime.strptime(session_close, '%H:%M')
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_times = deque()
+        self.identical_request_times = {}
+        self.open_requests = set()
+        self.statistics = {'requests': 0, 'answered': 0, 'pacing_violations': 0, 'rejected': 0, 'errors': 0, 'dropped': 0, 'cancelled': 0}
+
+    def check_request(self, key, request):
+        # error of a request that is rejected right away, None if it is accepted
+        now = time.monotonic()
+        with self.lock:
+            self.statistics['requests'] += 1
+            while self.request_times and now - self.request_times[0] >= self.pacing_period:
+                self.request_times.popleft()
+            identical_time = self.identical_request_times.get(request)
+            # rejected requests count towards the pacing limit as well
+            self.request_times.append(now)
+            self.identical_request_times[request] = now
+
+            if len(self.request_times) > self.pacing_requests or (identical_time is not None and now - identical_time < self.identical_interval):
+                self.statistics['pacing_violations'] += 1
+                return PACING_VIOLATION
+            if len(self.open_requests) >= self.max_simultaneous:
+                self.statistics['rejected'] += 1
+                return TOO_MANY_REQUESTS[0], TOO_MANY_REQUESTS[1].format(self.max_simultaneous)
+            self.open_requests.add(key)
+        return None
+
+    def close_request(self, key, outcome):
+        with self.lock:
+            if key in self.open_requests:
+                self.open_requests.discard(key)
+                self.statistics[outcome] += 1
+                return True
+            return False
+
+    def generate_bars(self, symbol, end_date_time, duration, bar_size):
+        # bars of the weekdays of the duration before end_date_time, in the format of formatDate 1 with a time zone
+        end = datetime.strptime(end_date_time.split(' ')[0], '%Y%m%d')
+        value, unit = duration.split()
+        days = int(value) * {'D': 1, 'W': 5}.get(unit, 1)
+        bar_seconds = get_bar_size_seconds(bar_size)
+        price_random = random.Random(symbol)
+        price = price_random.uniform(2, 50)
+
+        session_days = []
+        day = end
+        while len(session_days) < days:
+            if day.weekday() < 5:
+                session_days.append(day)
+            day -= timedelta(days=1)
+
+        bars = []
+        for day in reversed(session_days):
+            bar_time = day.replace(hour=self.session_open.hour, minute=self.session_open.minute)
+            close_time = day.replace(hour=self.session_close.hour, minute=self.session_close.minute)
+            while bar_time < close_time:
+                open_price = price
+                close_price = max(0.5, open_price * (1 + price_random.gauss(0, 0.004)))
+                high = max(open_price, close_price) * (1 + abs(price_random.gauss(0, 0.002)))
+                low = min(open_price, close_price) * (1 - abs(price_random.gauss(0, 0.002)))
+                volume = price_random.randint(100, 50000)
+                bars.append((bar_time.strftime('%Y%m%d %H:%M:%S') + ' Europe/Berlin', round(open_price, 4), round(high, 4),
+                             round(low, 4), round(close_price, 4), volume, round((high + low + close_price) / 3, 4), price_random.randint(1, 200)))
+                price = close_price
+                bar_time += timedelta(seconds=bar_seconds)
+        return bars
+
+    def answer(self, key, req_id, symbol, end_date_time, duration, bar_size):
+        # message of the answer of an accepted request, None if the request is dropped or was cancelled
+        if symbol in self.unknown_symbols:
+            outcome, fields = 'errors', [OUT_ERR_MSG, 2, req_id, *NO_DEFINITION]
+        elif symbol in self.no_data_symbols:
+            outcome, fields = 'errors', [OUT_ERR_MSG, 2, req_id, NO_DATA[0], NO_DATA[1].format(symbol)]
+        elif self.random.random() < self.error_rate:
+            outcome, fields = 'errors', [OUT_ERR_MSG, 2, req_id, QUERY_CANCELLED[0], QUERY_CANCELLED[1].format(req_id)]
+        elif self.random.random() < self.drop_rate:
+            outcome, fields = 'dropped', None
+        else:
+            bars = self.generate_bars(symbol, end_date_time, duration, bar_size)
+            start = bars[0][0] if bars else end_date_time
+            end = bars[-1][0] if bars else end_date_time
+            outcome, fields = 'answered', [OUT_HISTORICAL_DATA, req_id, start, end, len(bars)] + [field for bar in bars for field in bar]
+
+        if not self.close_request(key, outcome) or fields is None:
+            return None
+        return make_message(fields)
+
+
+class FakeGatewayHandler(socketserver.BaseRequestHandler):
+    """
+    One API client connection: the handshake of EClient.connect, then reqHistoricalData and
+    cancelHistoricalData, all other requests are ignored.
+    """
+    def setup(self):
+        self.farm = self.server.farm
+        self.send_lock = threading.Lock()
+        self.buffer = b""
+
+    def send(self, message):
+        with self.send_lock:
+            try:
+                self.request.sendall(message)
+            except OSError:
+                pass
+
+    def read_exact(self, size):
+        while len(self.buffer) < size:
+            data = self.request.recv(65536)
+            if not data:
+                raise ConnectionError("client disconnected")
+            self.buffer += data
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def read_message(self):
+        size = struct.unpack("!I", self.read_exact(4))[0]
+        return self.read_exact(size).decode().split("\0")
+
+    def handle(self):
+        client = self.client_address
+        try:
+            if self.read_exact(4) != b"API\0":
+                logging.error("%s did not start with the API prefix", client)
+                return
+            logging.info("%s connected with client versions %s", client, self.read_message()[0])
+            self.send(make_message([SERVER_VERSION, datetime.now().strftime('%Y%m%d %H:%M:%S CET')]))
+
+            while True:
+                fields = self.read_message()
+                message_id = int(fields[0])
+                if message_id == IN_START_API:
+                    self.send(make_message([OUT_NEXT_VALID_ID, 1, 1]))
+                    self.send(make_message([OUT_MANAGED_ACCTS, 1, 'DU0000000']))
+                elif message_id == IN_REQ_HISTORICAL_DATA:
+                    self.request_historical_data(fields)
+                elif message_id == IN_CANCEL_HISTORICAL_DATA:
+                    if self.farm.close_request((client, int(fields[2])), 'cancelled'):
+                        logging.info("%s cancelled request %s", client, fields[2])
+        except (ConnectionError, OSError):
+            pass
+        logging.info("%s disconnected. %s", client, self.farm.statistics)
+
+    def request_historical_data(self, fields):
+        # fields of EClient.reqHistoricalData for server versions from MIN_SERVER_VER_SYNT_REALTIME_BARS on
+        req_id = int(fields[1])
+        symbol = fields[3]
+        end_date_time, bar_size, duration = fields[15], fields[16], fields[17]
+        key = (self.client_address, req_id)
+
+        error = self.farm.check_request(key, (symbol, end_date_time, duration, bar_size))
+        if error is not None:
+            logging.info("Request %s for %s rejected: %s", req_id, symbol, error[1])
+            self.send(make_message([OUT_ERR_MSG, 2, req_id, *error]))
+            return
+
+        def answer():
+            message = self.farm.answer(key, req_id, symbol, end_date_time, duration, bar_size)
+            if message is not None:
+                self.send(message)
+
+        threading.Timer(self.farm.latency * self.farm.random.uniform(0.5, 1.5), answer).start()
+
+
+class FakeGateway(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, farm):
+        super().__init__(address, FakeGatewayHandler)
+        self.farm = farm
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for TWS / IB Gateway that answers historical data requests "
+                                                 "with synthetic bars and enforces IB's pacing limits, for trying database_population_ohlcv.py.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7497)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds until a request is answered (randomized by +-50%%)')
+    parser.add_argument('--pacing-requests', type=int, default=IB_PACING_REQUESTS, help='requests allowed in any pacing period')
+    parser.add_argument('--pacing-period', type=float, default=IB_PACING_PERIOD, help='pacing period in seconds')
+    parser.add_argument('--identical-interval', type=float, default=IB_IDENTICAL_REQUEST_INTERVAL, help='seconds before an identical request is allowed')
+    parser.add_argument('--max-simultaneous', type=int, default=IB_MAX_IN_FLIGHT, help='open requests allowed at once')
+    parser.add_argument('--unknown', nargs='*', default=[], help='symbols without a contract definition (error 200)')
+    parser.add_argument('--no-data', nargs='*', default=[], help='symbols without data (error 162)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests cancelled by the farm (transient error 162)')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='share of requests that are never answered')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    farm = FakeHistoricalDataFarm(latency=args.latency, pacing_requests=args.pacing_requests, pacing_period=args.pacing_period,
+                                  identical_interval=args.identical_interval, max_simultaneous=args.max_simultaneous,
+                                  unknown_symbols=args.unknown, no_data_symbols=args.no_data, error_rate=args.error_rate,
+                                  drop_rate=args.drop_rate, seed=args.seed)
+    with FakeGateway((args.host, args.port), farm) as server:
+        logging.info("Fake gateway listening on %s:%s", args.host, args.port)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info("Stopped. %s", farm.statistics)
@@ -2,6 +2,10 @@ import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta
 
+from database_repository import get_stock_data_time_column, to_epoch_seconds
+from daily_summary import refresh_daily_summary
+from rollup_tables import refresh_rollups
+
 
 # ----------------------------------------
 # CONFIGURATION
@@ -51,7 +55,7 @@ def fill_missing_bars(df, expected_ts, stock_id):
 
             synthetic_rows.append({
                 "stock_id": stock_id,
-                "timestamp": ts.strftime(DATE_FORMAT),
+                "timestamp": ts,
                 "open": prev["close"],
                 "high": prev["close"],
                 "low": prev["close"],
@@ -67,17 +71,19 @@ def insert_synthetic_rows(conn, df_synth):
     if df_synth.empty:
         return
 
+    # bar times are epoch seconds in databases migrated by migrate_stock_data.py, text dates otherwise
+    time_column = get_stock_data_time_column(conn)
     rows = df_synth.to_dict("records")
-    query = """
-        INSERT INTO stock_prices
-        (stock_id, timestamp, open, high, low, close, volume, is_synthetic)
+    query = f"""
+        INSERT INTO stock_data_5m
+        (stock_id, {time_column}, open, high, low, close, volume, is_synthetic)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
     """
 
     data = [
         (
             r["stock_id"],
-            r["timestamp"],
+            to_epoch_seconds(r["timestamp"]) if time_column == 'ts' else r["timestamp"].strftime(DATE_FORMAT),
             r["open"],
             r["high"],
             r["low"],
@@ -89,6 +95,12 @@ def insert_synthetic_rows(conn, df_synth):
     ]
 
     conn.executemany(query, data)
+    if time_column == 'ts':
+        # aggregate the synthetic bars into the rollup tables and the daily summary of the build scripts, if any
+        for stock_id in {row[0] for row in data}:
+            bar_times = [row[1] for row in data if row[0] == stock_id]
+            refresh_rollups(conn, stock_id, min(bar_times), max(bar_times))
+            refresh_daily_summary(conn, stock_id, min(bar_times), max(bar_times))
     conn.commit()
 
 
@@ -107,21 +119,25 @@ def fill_missing_bars_for_symbol(conn, symbol, start_date, end_date):
         return
 
     # Fetch real bars
-    query = """
-        SELECT stock_id, date, open, high, low, close, volume, is_synthetic
+    time_column = get_stock_data_time_column(conn)
+    query = f"""
+        SELECT stock_id, {time_column}, open, high, low, close, volume, is_synthetic
         FROM stock_data_5m
-        WHERE stock_id = ? AND date BETWEEN ? AND ?
-        ORDER BY date
+        WHERE stock_id = ? AND {time_column} BETWEEN ? AND ?
+        ORDER BY {time_column}
     """
 
-    df = pd.read_sql_query(query, conn, params=[stock_id, start_date, end_date])
+    if time_column == 'ts':
+        df = pd.read_sql_query(query, conn, params=[stock_id, to_epoch_seconds(start_date), to_epoch_seconds(end_date)])
+    else:
+        df = pd.read_sql_query(query, conn, params=[stock_id, start_date, end_date])
 
     if df.empty:
         print(f"No data for {symbol} in this date range.")
         return
 
     # Convert timestamps to datetime
-    df["timestamp"] = pd.to_datetime(df["date"])
+    df["timestamp"] = pd.to_datetime(df[time_column], unit='s') if time_column == 'ts' else pd.to_datetime(df["date"])
 
     start_ts = df["timestamp"].min()
     end_ts = df["timestamp"].max()
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 import logging
 import os
 from statistics import mean
+import numpy as np
 import pandas as pd
 import helper
 from enum import Enum
@@ -25,7 +26,12 @@ class StockFilter:
         self.daily_performance_criteria = DailyPerformanceCriteria[config.filter_daily_performance_criteria]
         self.gap_up_percentage = config.filter_gap_up_percentage
         self.is_backtest = helper.IS_BACKTEST
-
+        # tickers passing all filters per day, keyed by the index of the first bar of the day, see precompute_daily_universe
+        self.daily_universe = None
+        self.daily_universe_tickers = set()
+        # DAILY_SUMMARY_RECORD arrays of the tickers over daily_summary_days, see load_daily_summary
+        self.daily_summary = None
+        self.daily_summary_days = None
 
     
     def float_filter(self):
@@ -55,7 +61,12 @@ class StockFilter:
         filtered_tickers = {}
         for ticker, values in tickers.items():
             data = self.data_handler.get_latest_data_aggregated(ticker, 0)
-            passed_filter, latest_volume, avg_volume_scaled = self.relative_volume_filter(data)
+            if self.daily_summary is not None:
+                # the first bar of the day against the opening window volumes of the days before
+                passed_filter, latest_volume, avg_volume_scaled = self.relative_volume_of_volumes(
+                    data[-1].volume, self.daily_summary[ticker]["window_volume"].tolist())
+            else:
+                passed_filter, latest_volume, avg_volume_scaled = self.relative_volume_filter(data)
             if passed_filter:
                 filtered_tickers[ticker] = values
                 filtered_tickers[ticker]["latest_volume"] = latest_volume
@@ -73,12 +84,15 @@ class StockFilter:
         latest = data[-1]
         data = data[:-1]
         filtered_data = [item for item in data if item.datetime.time() == latest.datetime.time()]
-        filtered_data = filtered_data[-1 * self.volume_days:]
-        if filtered_data:
-            avg_volume = mean(item.volume for item in filtered_data)
+        return self.relative_volume_of_volumes(latest.volume, [item.volume for item in filtered_data])
+
+    def relative_volume_of_volumes(self, latest_volume, previous_volumes):
+        # latest_volume against the mean of the last volume_days of the volumes of the days before
+        previous_volumes = previous_volumes[-1 * self.volume_days:]
+        if previous_volumes:
+            avg_volume = mean(previous_volumes)
         else:
             avg_volume = 0
-        latest_volume = latest.volume
         avg_volume_scaled = avg_volume * self.volume_multiple
         if latest_volume >= avg_volume_scaled:
             return True, latest_volume, avg_volume
@@ -104,8 +118,12 @@ class StockFilter:
     # Last daily closing price is higher than 20 day SMA and 50 day SMA
         filtered_tickers = {}
         for ticker in tickers:
-            data = self.data_handler.get_latest_data_aggregated(ticker, 0)
-            passed_filter, last_daily_close, last_daily_close_sma_short, last_daily_close_sma_long = self.daily_performance_filter(data)
+            if self.daily_summary is not None:
+                passed_filter, last_daily_close, last_daily_close_sma_short, last_daily_close_sma_long = self.daily_performance_of_closes(
+                    pd.DataFrame({"close": self.daily_summary[ticker]["close"]}))
+            else:
+                data = self.data_handler.get_latest_data_aggregated(ticker, 0)
+                passed_filter, last_daily_close, last_daily_close_sma_short, last_daily_close_sma_long = self.daily_performance_filter(data)
             if passed_filter:
                 filtered_tickers[ticker] = {
                     "last_daily_close": last_daily_close,
@@ -121,6 +139,10 @@ class StockFilter:
         df = pd.DataFrame(filtered_data, columns=["symbol", "date", "open", "high", "low", "close", "volume"])
         df.drop(["symbol", "open", "high", "low", "volume"], axis=1)
         df.set_index('date', inplace=True, drop=False)
+        return self.daily_performance_of_closes(df)
+
+    def daily_performance_of_closes(self, df):
+        # the last daily close of df against the SMAs of its close column
         df = helper.calculate_sma(df, 'close', 'sma_short', self.sma_short_period)
         df = helper.calculate_sma(df, 'close', 'sma_long', self.sma_long_period)
         last_daily_closing_bar = df.iloc[-1]
@@ -164,11 +186,212 @@ class StockFilter:
             
         return filtered_tickers
 
-    def filter_stocks_for_backtesting(self, all_tickers):
-        filtered_tickers = self.daily_performance_filter_for_backtesting(all_tickers)
-        filtered_tickers = self.relative_volume_filter_for_backtesting(filtered_tickers)
+    def precompute_daily_universe(self, tickers):
+        """
+        Evaluates the daily performance, relative volume and gap up filters of every day of the backtest
+        for all tickers at once, as filter_stocks_for_backtesting would on the first bar of the day.
+
+        Needs the bar arrays of a historic data handler with the same bar times for all tickers. The daily
+        closes and the volumes of the time of day of the first bars are taken out of them once, and the SMAs
+        and volume averages of all days come from rolling means and cumulative sums over those rows.
+        Days without a closing bar before them are left out and filtered bar by bar.
+        After load_daily_summary the filter values come from the daily summary instead, see evaluate_daily_summary.
+        """
+        self.daily_universe = {}
+        self.daily_universe_tickers = set()
+        if len(tickers) == 0 or not hasattr(self.data_handler, 'get_bar_arrays'):
+            return
+
+        bar_arrays = self.data_handler.get_bar_arrays()
+        datetimes = bar_arrays[tickers[0]].datetime
+        if any(not np.array_equal(bar_arrays[ticker].datetime, datetimes) for ticker in tickers):
+            logging.info("Bar times of the tickers differ, the stock filter runs bar by bar.")
+            return
+
+        def stack(field, rows):
+            # (row, ticker) matrix of a field
+            return np.stack([getattr(bar_arrays[ticker], field)[rows] for ticker in tickers], axis=1)
+
+        seconds_of_day = helper.get_seconds_of_day(datetimes)
+        first_bars = np.flatnonzero(helper.get_new_day_mask(datetimes))
+
+        if self.daily_summary is not None:
+            if any(ticker not in self.daily_summary for ticker in tickers):
+                logging.warning("Tickers without a daily summary, the stock filter runs bar by bar.")
+                return
+            first_bars, passed, values = self.evaluate_daily_summary(tickers, datetimes, first_bars)
+            self.set_daily_universe(tickers, first_bars, passed, values)
+            return
+
+        # daily performance: SMAs of the closes of the last bar before market close
+        closing_time = datetime.strptime(helper.MKT_CLOSE_TIME, '%H:%M:%S') - timedelta(minutes=self.bar_granularity/60)
+        closing_bars = np.flatnonzero(seconds_of_day == closing_time.hour * 3600 + closing_time.minute * 60 + closing_time.second)
+        daily_closes = pd.DataFrame(stack('close', closing_bars))
+        sma_short = daily_closes.rolling(self.sma_short_period, min_periods=self.sma_short_period).mean().to_numpy() * self.sma_close_multiplier
+        sma_long = daily_closes.rolling(self.sma_long_period, min_periods=self.sma_long_period).mean().to_numpy() * self.sma_close_multiplier
+        daily_closes = daily_closes.to_numpy()
+
+        # the last closing bar up to the first bar of each day
+        last_closing_bar = np.searchsorted(closing_bars, first_bars, side='right') - 1
+        is_evaluable = (last_closing_bar >= 0) & (first_bars > 0)
+        first_bars, last_closing_bar = first_bars[is_evaluable], last_closing_bar[is_evaluable]
+
+        last_daily_close = daily_closes[last_closing_bar]
+        if self.daily_performance_criteria == DailyPerformanceCriteria.Strong:
+            passed = (last_daily_close > sma_short[last_closing_bar]) & (last_daily_close > sma_long[last_closing_bar])
+        else:
+            passed = (last_daily_close < sma_short[last_closing_bar]) & (last_daily_close < sma_long[last_closing_bar])
+
+        # relative volume: first bar volume against the mean volume of the bars at the same time on the days before
+        latest_volume = stack('volume', first_bars)
+        avg_volume = np.zeros(latest_volume.shape)
+        for time_of_day in np.unique(seconds_of_day[first_bars]):
+            same_time_bars = np.flatnonzero(seconds_of_day == time_of_day)
+            cumulative_volume = np.vstack([np.zeros((1, len(tickers))), np.cumsum(stack('volume', same_time_bars), axis=0, dtype=float)])
+
+            days = np.flatnonzero(seconds_of_day[first_bars] == time_of_day)
+            bars_before = np.searchsorted(same_time_bars, first_bars[days])
+            count = np.minimum(bars_before, self.volume_days)
+            volume_sum = cumulative_volume[bars_before] - cumulative_volume[bars_before - count]
+            # integer volumes make the sums exact, so the mean matches statistics.mean
+            avg_volume[days] = np.divide(volume_sum, count[:, None], out=np.zeros(volume_sum.shape), where=count[:, None] > 0)
+        passed &= latest_volume >= avg_volume * self.volume_multiple
+
+        # the filter values the bar by bar filters log for the tickers passing them
+        values = {
+            "last_daily_close": last_daily_close, "close_sma_short": sma_short[last_closing_bar], "close_sma_long": sma_long[last_closing_bar],
+            "latest_volume": latest_volume, "avg_volume_scaled": avg_volume
+        }
+        if config.enable_gap_up_filter:
+            open_price = stack('open', first_bars)
+            gap_up_threshold = stack('close', first_bars - 1) * (1 + self.gap_up_percentage / 100)
+            passed &= open_price > gap_up_threshold
+            values.update(open_price=open_price, gap_up_threshold=gap_up_threshold)
+
+        self.set_daily_universe(tickers, first_bars, passed, values)
+
+    def set_daily_universe(self, tickers, first_bars, passed, values):
+        # passed and the filter values are (day, ticker) matrices of the days starting at first_bars
+        self.daily_universe_tickers = set(tickers)
+        for day, (first_bar, day_passed) in enumerate(zip(first_bars.tolist(), passed)):
+            self.daily_universe[first_bar] = {
+                tickers[i]: {name: column[day, i].item() for name, column in values.items()} for i in np.flatnonzero(day_passed)
+            }
+
+    def get_first_bar_window_minutes(self):
+        # minutes of the market hours in the first bar of the day, the first bar starts at the bar time before market open
+        market_open = helper.time_string_to_seconds(helper.MKT_OPEN_TIME, '%H:%M:%S')
+        return (self.bar_granularity - market_open % self.bar_granularity) // 60
+
+    def load_daily_summary(self, database_repository, start_time, end_time, tickers):
+        """
+        Reads the daily summary of the tickers over the full trading days from start_time up to end_time, the days a
+        historic data handler fetches for that range, so the filters take the daily closes, first bar volumes and
+        opens of those days from it instead of from the intraday bars.
+
+        Returns the tickers that have every 5 minute bar of the market hours on each of the days, the tickers the
+        data handlers would keep, or None if the database has no summary of the opening window of the first bar.
+        """
+        days = np.array(helper.get_full_trading_days(start_time, end_time), dtype='datetime64[D]')
+        if len(days) == 0:
+            return None
+        summary = database_repository.get_daily_summary(str(days[0]), str(days[-1]), tickers, self.get_first_bar_window_minutes())
+        if summary is None:
+            return None
+
+        expected_bars_per_day = helper.get_expected_number_of_bars_per_day(bar_granularity_in_seconds=300)
+        self.daily_summary = {}
+        self.daily_summary_days = days
+        for ticker in tickers:
+            records = summary.get(ticker)
+            if records is not None:
+                records = records[np.isin(records['day'], days)]
+            if records is None or len(records) != len(days) or not np.all(records['bar_count'] == expected_bars_per_day):
+                logging.info("Missing data for symbol: %s for time period %s and %s", ticker, start_time.strftime("%Y-%m-%d"), end_time.strftime("%Y-%m-%d"))
+                continue
+            self.daily_summary[ticker] = records
+
+        logging.info(f"Daily summary of {len(days)} days loaded for {len(self.daily_summary)} of {len(tickers)} stocks.")
+        return [ticker for ticker in tickers if ticker in self.daily_summary]
+
+    def evaluate_daily_summary(self, tickers, datetimes, first_bars):
+        """
+        The filters of precompute_daily_universe on the days starting at first_bars from the daily summary: the same
+        rolling SMAs and cumulative volume sums over the daily closes and opening window volumes of all summary days.
+        Returns the first bars of the days with a summary day before them, the (day, ticker) matrix of the tickers passing
+        and the (day, ticker) matrices of the filter values.
+        """
+        def stack(field):
+            # (day, ticker) matrix of a field
+            return np.stack([self.daily_summary[ticker][field] for ticker in tickers], axis=1)
+
+        # daily performance: SMAs of the session closes
+        daily_closes = pd.DataFrame(stack('close'))
+        sma_short = daily_closes.rolling(self.sma_short_period, min_periods=self.sma_short_period).mean().to_numpy() * self.sma_close_multiplier
+        sma_long = daily_closes.rolling(self.sma_long_period, min_periods=self.sma_long_period).mean().to_numpy() * self.sma_close_multiplier
+        daily_closes = daily_closes.to_numpy()
+
+        # the summary day of each first bar, its days before give the last daily close and the volume average
+        days = self.daily_summary_days
+        first_bar_days = datetimes[first_bars].astype('datetime64[D]')
+        day_rows = np.searchsorted(days, first_bar_days)
+        is_evaluable = (day_rows > 0) & (day_rows < len(days))
+        is_evaluable[is_evaluable] = days[day_rows[is_evaluable]] == first_bar_days[is_evaluable]
+        first_bars, day_rows = first_bars[is_evaluable], day_rows[is_evaluable]
+        last_closing_day = day_rows - 1
+
+        last_daily_close = daily_closes[last_closing_day]
+        if self.daily_performance_criteria == DailyPerformanceCriteria.Strong:
+            passed = (last_daily_close > sma_short[last_closing_day]) & (last_daily_close > sma_long[last_closing_day])
+        else:
+            passed = (last_daily_close < sma_short[last_closing_day]) & (last_daily_close < sma_long[last_closing_day])
+
+        # relative volume: first bar volume against the mean opening window volume of the days before
+        window_volumes = stack('window_volume')
+        cumulative_volume = np.vstack([np.zeros((1, len(tickers))), np.cumsum(window_volumes, axis=0, dtype=float)])
+        count = np.minimum(day_rows, self.volume_days)
+        volume_sum = cumulative_volume[day_rows] - cumulative_volume[day_rows - count]
+        avg_volume = np.divide(volume_sum, count[:, None], out=np.zeros(volume_sum.shape), where=count[:, None] > 0)
+        latest_volume = window_volumes[day_rows]
+        passed &= latest_volume >= avg_volume * self.volume_multiple
+
+        values = {
+            "last_daily_close": last_daily_close, "close_sma_short": sma_short[last_closing_day], "close_sma_long": sma_long[last_closing_day],
+            "latest_volume": latest_volume, "avg_volume_scaled": avg_volume
+        }
         if config.enable_gap_up_filter:
-            filtered_tickers = self.gap_up_filter_for_backtesting(filtered_tickers)
+            open_price = stack('open')[day_rows]
+            gap_up_threshold = daily_closes[last_closing_day] * (1 + self.gap_up_percentage / 100)
+            passed &= open_price > gap_up_threshold
+            values.update(open_price=open_price, gap_up_threshold=gap_up_threshold)
+
+        return first_bars, passed, values
+
+    def get_daily_universe(self, all_tickers):
+        """
+        Returns {ticker: filter values} of the tickers of all_tickers passing the filters on the current day from the
+        precomputed daily universe, in the order of all_tickers, or None if the day or a ticker was not precomputed.
+        """
+        if self.daily_universe is None:
+            self.precompute_daily_universe(list(all_tickers))
+
+        if not self.daily_universe or not self.daily_universe_tickers.issuperset(all_tickers):
+            return None
+
+        passed_tickers = self.daily_universe.get(self.data_handler.get_current_bar_index() - 1)
+        if passed_tickers is None:
+            return None
+        return {ticker: passed_tickers[ticker] for ticker in all_tickers if ticker in passed_tickers}
+
+    def filter_stocks_for_backtesting(self, all_tickers):
+        daily_universe = self.get_daily_universe(all_tickers)
+        if daily_universe is not None:
+            filtered_tickers = daily_universe
+        else:
+            filtered_tickers = self.daily_performance_filter_for_backtesting(all_tickers)
+            filtered_tickers = self.relative_volume_filter_for_backtesting(filtered_tickers)
+            if config.enable_gap_up_filter:
+                filtered_tickers = self.gap_up_filter_for_backtesting(filtered_tickers)
 
         logging.info("New Day: %s. Trading on %s stocks: %s", self.data_handler.get_latest_data(all_tickers[0])[0].datetime, len(filtered_tickers.keys()), list(filtered_tickers.keys()))
         for ticker, values in filtered_tickers.items():
@@ -2,6 +2,7 @@ from datetime import timedelta, datetime
 from ibapi.contract import Contract
 from ta import trend
 import pandas_market_calendars as mcal
+import numpy as np
 import pandas as pd
 import config
 
@@ -20,6 +21,21 @@ def is_trading_cutoff_time(curr_time):
     return curr_time.time() >= datetime.strptime(DAILY_TRADING_END_TIME, '%H:%M').time()
 
 
+def time_string_to_seconds(time_string, time_format):
+    time = datetime.strptime(time_string, time_format)
+    return time.hour * 3600 + time.minute * 60 + time.second
+
+def get_seconds_of_day(datetimes):
+    # seconds since midnight for an array of datetime64 values
+    return (datetimes - datetimes.astype('datetime64[D]')).astype('timedelta64[s]').astype(np.int64)
+
+def get_new_day_mask(datetimes):
+    # True for every bar that starts a new day, mirrors is_new_day for a whole array of bars
+    days = datetimes.astype('datetime64[D]')
+    new_day = np.ones(len(days), dtype=bool)
+    new_day[1:] = days[1:] != days[:-1]
+    return new_day
+
 def string_to_datetime(datetime_string):
     date_time = datetime_string.rsplit(' ', 1)[0]
     return datetime.strptime(date_time, '%Y%m%d %H:%M:%S')
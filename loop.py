@@ -1,9 +1,16 @@
-import queue
+import itertools
+import multiprocessing
+import os
+import time
 from dataclasses import dataclass
-from queue import Queue
 from typing import List
+import pandas as pd
 import helper
 from data_handlers.data_handler import DataHandler
+from event_loop_profiler import EventLoopProfiler
+from events.enums.event_type import EventType
+from events.event_bus import EventBus
+from events.event_dispatcher import EventDispatcher
 from execution_handler.execution_handler import ExecutionHandler
 
 from filters import StockFilter
@@ -13,7 +20,7 @@ import config
 
 @dataclass
 class BacktestDependencies:
-    events: Queue
+    events: EventBus
     data: DataHandler
     portfolio: Portfolio
     strategy: Strategy
@@ -22,6 +29,7 @@ class BacktestDependencies:
     tickers: List[str]
     bar_size_in_sec: int
     is_backtest: bool
+    generate_reports: bool = True  # performance files and charts at the end of the backtest
 
 
 def backtest(configuration: BacktestDependencies):
@@ -34,6 +42,177 @@ def backtest(configuration: BacktestDependencies):
     tickers = configuration.tickers
     bar_size_in_sec = configuration.bar_size_in_sec
 
+    profiler = None
+    if config.enable_event_loop_profiling:
+        profiler = EventLoopProfiler()
+        profiler.instrument(data, 'update_latest_data')
+        profiler.instrument(strategy, 'calculate_signals')
+        profiler.instrument(portfolio, 'update_timeindex')
+        profiler.instrument(broker, 'execute_order')
+        if stock_filter is not None:
+            profiler.instrument(stock_filter, 'filter_stocks_for_backtesting')
+    dispatcher = create_event_dispatcher(strategy, portfolio, broker)
+
+    while True:
+        data.update_latest_data()
+        if data.continue_backtest == False:
+            break
+
+        if profiler is not None:
+            profiler.record_bar(len(data.symbol_list), events.qsize())
+
+        if helper.is_new_day(data):
+            process_start_of_new_day(data, strategy, stock_filter, tickers)
+
+        process_events(events, dispatcher, profiler)
+
+    if profiler is not None:
+        profiler.stop()
+
+    if configuration.generate_reports:
+        process_end_of_backtest(portfolio, strategy, bar_size_in_sec)
+        if profiler is not None:
+            profiler.write_report(portfolio.filename)
+
+
+def vectorized_backtest(configuration: BacktestDependencies):
+    """
+    Runs the same backtest as backtest() without pushing every bar through the event queue.
+    The strategy evaluates each symbol over all sessions at once through calculate_signals_vectorized,
+    only the resulting signals go through the portfolio and execution handler, and the positions
+    and holdings records are built from the fills afterwards.
+    """
+    events = configuration.events
+    data = configuration.data
+    portfolio = configuration.portfolio
+    strategy = configuration.strategy
+    broker = configuration.execution_handler
+    stock_filter = configuration.stock_filter
+    tickers = configuration.tickers
+    bar_size_in_sec = configuration.bar_size_in_sec
+
+    bar_arrays = data.get_bar_arrays()
+    datetimes = bar_arrays[data.symbol_list[0]].datetime
+    start = data.get_current_bar_index()
+    end = len(datetimes)
+
+    dispatcher = create_event_dispatcher(strategy, portfolio, broker)
+
+    sessions = split_into_sessions(datetimes, start, end)
+    active_symbols = get_active_symbols_per_session(data, sessions, stock_filter, tickers)
+
+    signals = []
+    for symbol_position, symbol in enumerate(data.symbol_list):
+        active = [symbol in session_symbols for session_symbols in active_symbols]
+        for signal in strategy.calculate_signals_vectorized(symbol, bar_arrays[symbol], sessions, active):
+            signals.append((signal.index, symbol_position, symbol, signal))
+    # same order as calculate_signals raises them: by bar, then by position in the symbol list
+    signals.sort(key=lambda item: (item[0], item[1]))
+
+    snapshots = [(-1, portfolio.current_positions.copy(), portfolio.current_holdings.copy())]
+    for index, bar_signals in itertools.groupby(signals, key=lambda item: item[0]):
+        date = pd.Timestamp(datetimes[index])
+        for _, _, symbol, signal in bar_signals:
+            if signal.direction == 'BUY':
+                events.put(strategy.buy(symbol, date, signal.price, signal.quantity, signal.reason))
+            else:
+                events.put(strategy.sell(symbol, date, signal.price, signal.quantity, signal.reason))
+
+        process_events(events, dispatcher)
+        snapshots.append((index - start, portfolio.current_positions.copy(), portfolio.current_holdings.copy()))
+
+    closes = {symbol: bar_arrays[symbol].close[start:end] for symbol in data.symbol_list}
+    portfolio.update_timeindex_vectorized(datetimes[start:end], closes, snapshots)
+    data.set_current_bar_index(end)
+
+    if configuration.generate_reports:
+        process_end_of_backtest(portfolio, strategy, bar_size_in_sec)
+
+
+# The backtest being sharded, inherited by the forked shard workers.
+_sharded_configuration = None
+
+
+def sharded_backtest(configuration: BacktestDependencies):
+    """
+    Runs the event backtest split by symbol across worker processes. Strategies decide each symbol
+    independently and trade fixed quantities, so every worker runs a forked copy of the data handler,
+    strategy and portfolio on its own symbols. The fills of all workers are then replayed in the order
+    a single process would have applied them to build one portfolio equity curve, and their closed
+    trades and plotting data are merged into the strategy.
+    """
+    global _sharded_configuration
+
+    data = configuration.data
+    portfolio = configuration.portfolio
+    strategy = configuration.strategy
+    bar_size_in_sec = configuration.bar_size_in_sec
+
+    bar_arrays = data.get_bar_arrays()
+    datetimes = bar_arrays[data.symbol_list[0]].datetime
+    start = data.get_current_bar_index()
+    end = len(datetimes)
+
+    processes = min(config.backtest_processes or os.cpu_count(), len(data.symbol_list))
+    shards = [data.symbol_list[i::processes] for i in range(processes)]
+
+    stock_filter = configuration.stock_filter
+    if stock_filter is not None and helper.IS_BACKTEST and stock_filter.daily_universe is None:
+        # built once here instead of in every worker
+        stock_filter.precompute_daily_universe(configuration.tickers)
+
+    # workers are forked so they start from the current state of the backtest, one fresh worker per shard
+    _sharded_configuration = configuration
+    with multiprocessing.get_context('fork').Pool(processes, maxtasksperchild=1) as pool:
+        results = pool.map(run_backtest_shard, shards, chunksize=1)
+    _sharded_configuration = None
+
+    symbol_positions = {symbol: position for position, symbol in enumerate(data.symbol_list)}
+    fills = [fill for shard_fills, _, _ in results for fill in shard_fills]
+    # same order as a single process applies them: by bar, then by position in the symbol list
+    fills.sort(key=lambda item: (item[0], symbol_positions[item[1].symbol]))
+
+    snapshots = [(-1, portfolio.current_positions.copy(), portfolio.current_holdings.copy())]
+    for index, bar_fills in itertools.groupby(fills, key=lambda item: item[0]):
+        for _, fill in bar_fills:
+            portfolio.update_fill(fill)
+        snapshots.append((index - start, portfolio.current_positions.copy(), portfolio.current_holdings.copy()))
+
+    closes = {symbol: bar_arrays[symbol].close[start:end] for symbol in data.symbol_list}
+    portfolio.update_timeindex_vectorized(datetimes[start:end], closes, snapshots)
+    data.set_current_bar_index(end)
+
+    strategy.trades = sorted(
+        (trade for _, shard_trades, _ in results for trade in shard_trades),
+        key=lambda trade: (trade.end_time, symbol_positions[trade.symbol])
+    )
+    for _, _, shard_annotations in results:
+        strategy.plot_annotations.update(shard_annotations)
+
+    if configuration.generate_reports:
+        process_end_of_backtest(portfolio, strategy, bar_size_in_sec)
+
+
+def run_backtest_shard(shard):
+    """
+    Runs the event loop of the forked backtest on the symbols of one shard.
+    Returns the fills with the index of the bar they happened on, the closed trades and the plotting data of the shard.
+    """
+    configuration = _sharded_configuration
+    events = configuration.events
+    data = configuration.data
+    portfolio = configuration.portfolio
+    strategy = configuration.strategy
+    broker = configuration.execution_handler
+    stock_filter = configuration.stock_filter
+    tickers = [symbol for symbol in configuration.tickers if symbol in shard]
+
+    data.symbol_list = shard
+    data.symbol_list_active = [symbol for symbol in data.symbol_list_active if symbol in shard]
+    dispatcher = create_event_dispatcher(strategy, portfolio, broker)
+    portfolio.fill_history = []
+
+    fills = []
     while True:
         data.update_latest_data()
         if data.continue_backtest == False:
@@ -42,24 +221,44 @@ def backtest(configuration: BacktestDependencies):
         if helper.is_new_day(data):
             process_start_of_new_day(data, strategy, stock_filter, tickers)
 
-        while True:
-            try:
-                event = events.get(block=False)
-            except queue.Empty:
-                break
+        fill_count = len(portfolio.fill_history)
+        process_events(events, dispatcher)
+
+        index = data.get_current_bar_index() - 1
+        fills.extend((index, fill) for fill in portfolio.fill_history[fill_count:])
+
+    return fills, strategy.trades, strategy.plot_annotations.get_symbol_columns(shard)
+
+
+def create_event_dispatcher(strategy, portfolio, broker):
+    # handlers of the same event type run in the order they are registered
+    dispatcher = EventDispatcher()
+    dispatcher.register(EventType.MARKET, strategy.calculate_signals)
+    dispatcher.register(EventType.MARKET, portfolio.update_timeindex)
+    dispatcher.register(EventType.SIGNAL, portfolio.update_signal)
+    dispatcher.register(EventType.ORDER, broker.execute_order)
+    dispatcher.register(EventType.FILL, portfolio.update_fill)
+    return dispatcher
+
+
+def process_events(events, dispatcher, profiler=None):
+    handlers = dispatcher.handlers
+    while True:
+        event = events.get()
+        if event is None:
+            break
+
+        if profiler is not None:
+            started = time.perf_counter()
 
+        for handler in handlers[event.type]:
+            handler(event)
 
-            if event is not None:
-                if event.type == 'MARKET':
-                    strategy.calculate_signals(event)
-                    portfolio.update_timeindex(event)
-                elif event.type == 'SIGNAL':
-                    portfolio.update_signal(event)
-                elif event.type == 'ORDER':
-                    broker.execute_order(event)
-                elif event.type == 'FILL':
-                    portfolio.update_fill(event)
+        if profiler is not None:
+            profiler.record_event(event.type, time.perf_counter() - started, events.qsize())
 
+
+def process_end_of_backtest(portfolio, strategy, bar_size_in_sec):
     portfolio.summary_stats(bar_size_in_sec)
     strategy.strategy_performance()
     strategy.plot()
@@ -78,3 +277,26 @@ def process_start_of_new_day(data, strategy, stock_filter, tickers):
 
 def run_daily_stock_filtering_for_backtesting(data, stock_filter: StockFilter, tickers):
     data.symbol_list_active = stock_filter.filter_stocks_for_backtesting(tickers)
+
+
+def split_into_sessions(datetimes, start, end):
+    """
+    Splits the bars in [start, end) into one (start, end, is_new_day) range per trading day.
+    is_new_day is False for a first session continuing the day of the bars before start.
+    """
+    new_day = helper.get_new_day_mask(datetimes)
+    session_starts = [start] + [index for index in range(start + 1, end) if new_day[index]]
+    session_ends = session_starts[1:] + [end]
+    return [(session_start, session_end, bool(new_day[session_start])) for session_start, session_end in zip(session_starts, session_ends)]
+
+
+def get_active_symbols_per_session(data, sessions, stock_filter, tickers):
+    active_symbols = []
+    for session_start, _, is_new_day in sessions:
+        if is_new_day and stock_filter is not None and helper.IS_BACKTEST:
+            # the filter runs once the first bar of the day is known, as in process_start_of_new_day
+            data.set_current_bar_index(session_start + 1)
+            run_daily_stock_filtering_for_backtesting(data, stock_filter, tickers)
+        active_symbols.append(set(data.symbol_list_active))
+    return active_symbols
+
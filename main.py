@@ -1,5 +1,4 @@
 import logging
-import queue
 import signal
 import sys
 import time
@@ -10,12 +9,15 @@ import config
 
 import pytz
 
+from data_handlers.bar_file_store import BarFileStore
 from data_handlers.enums.data_format import DataFormat
 from data_handlers.enums.data_source import DataSource
+from data_handlers.historic_bar_file_data_handler import HistoricBarFileDataHandler
 from data_handlers.historic_csv_data_handler import HistoricCSVDataHandler
 from data_handlers.historic_db_data_handler import HistoricDBDataHandler
 from data_handlers.ib_data_handler import IBDataHandler
 from data_handlers.live_data_handler import LiveDataHandler
+from events.event_bus import create_event_bus
 from database_repository import DatabaseRepository
 
 import helper
@@ -23,7 +25,7 @@ from execution_handler.ib_execution_handler import IBExecutionHandler
 from execution_handler.simulate_execution_handler import SimulateExecutionHandler
 
 from filters import StockFilter
-from loop import backtest, BacktestDependencies
+from loop import backtest, sharded_backtest, vectorized_backtest, BacktestDependencies
 from portfolio import NaivePortfolio
 from strategies.orb_strategy import OpeningRangeBreakoutStrategy
 
@@ -91,6 +93,8 @@ def initialize_data_handler(data_source, database_repository, events, tickers, b
             data = HistoricCSVDataHandler(events, 'csv', ['testsymbol4short'], DataFormat.NASDAQ)
         case DataSource.DB:
             data = HistoricDBDataHandler(events, tickers, database_repository, bar_granularity)
+        case DataSource.BAR_FILES:
+            data = HistoricBarFileDataHandler(events, tickers, database_repository, BarFileStore(config.bar_file_dir), bar_granularity)
     return data
 
 
@@ -108,6 +112,20 @@ def consume_data_needed_for_filter(data_handler, events, last_timestamp_before_b
         while not events.empty():
             events.get()
 
+def load_daily_summary_for_filter(data_handler, stock_filter: StockFilter, database_repository, hist_data_start, hist_data_end):
+    """
+    Lets the stock filter take the filter history from the daily summary instead of the intraday bars and keeps
+    the tickers with complete days in it. Returns False if the database has no daily summary the filter can use.
+    """
+    tickers = stock_filter.load_daily_summary(database_repository, hist_data_start, hist_data_end, data_handler.symbol_list)
+    if tickers is None:
+        logging.warning("No daily summary of the opening window of the first bar, the filters use the intraday bars.")
+        return False
+
+    data_handler.symbol_list = tickers
+    data_handler.symbol_list_active = tickers
+    return True
+
 def wait_until_market_open(bar_granularity, is_filter_enabled):
     """
     Waits until the market opens, with an optional delay to account for the first complete bar of the day.
@@ -168,6 +186,22 @@ def filter_out_stocks_without_day_open_bar(data_handler: LiveDataHandler, filter
             del filtered_stocks[symbol]
 
 
+def run_backtest(backtest_dependencies, data_source):
+    match config.backtest_engine:
+        case 'event':
+            backtest(backtest_dependencies)
+        case 'vectorized':
+            if not backtest_dependencies.is_backtest or data_source not in (DataSource.DB, DataSource.BAR_FILES):
+                raise Exception("Vectorized backtest engine is only available for backtests on DB or bar file data.")
+            vectorized_backtest(backtest_dependencies)
+        case 'sharded':
+            if not backtest_dependencies.is_backtest or data_source not in (DataSource.DB, DataSource.BAR_FILES):
+                raise Exception("Sharded backtest engine is only available for backtests on DB or bar file data.")
+            sharded_backtest(backtest_dependencies)
+        case _:
+            raise Exception(f"Unknown backtest engine: {config.backtest_engine}")
+
+
 def main():
     
     
@@ -232,8 +266,10 @@ def main():
     ############ DATA HANDLER ###################
 
     data_source = DataSource.DB if is_backtest else DataSource.IB_LIVE
+    if is_backtest and config.bar_file_dir:
+        data_source = DataSource.BAR_FILES
 
-    events = queue.Queue()
+    events = create_event_bus(is_backtest)
     data_handler = initialize_data_handler(data_source, database_repository, events, tickers, bar_granularity)
 
     try:
@@ -272,18 +308,24 @@ def main():
             data_handler.fetch_historical_data(0, backtest_end_date_str, f'{duration_for_hist_data} D', '5 mins')
             time.sleep(1)
         
-        elif type(data_handler) == HistoricDBDataHandler:
+        elif isinstance(data_handler, HistoricDBDataHandler):
             hist_data_end = backtest_end_date
             hist_data_start = helper.get_weekday_before(backtest_end_date, duration_for_hist_data)
+            if is_filter_enabled and config.use_daily_summary and load_daily_summary_for_filter(
+                    data_handler, stock_filter, database_repository, hist_data_start, hist_data_end):
+                # the filter history comes from the daily summary, the bars start on the day before the backtest
+                hist_data_start = helper.get_weekday_before(backtest_start_date, 1)
             data_handler.fetch_historical_ohlcv_data(hist_data_start, hist_data_end)
             strategy.post_data_fetch_setup()
             time.sleep(1)
 
         elif type(data_handler) == LiveDataHandler:
             data_handler.ib_client.set_dependencies(data_handler, execution_handler)
+            data_handler.add_all_data_listener(strategy.plot_annotations.invalidate)
             hist_data_end = backtest_end_date
             hist_data_start = helper.get_weekday_before(backtest_end_date, duration_for_hist_data)
-            if is_filter_enabled:
+            if is_filter_enabled and not (config.use_daily_summary and load_daily_summary_for_filter(
+                    data_handler, stock_filter, database_repository, hist_data_start, hist_data_end)):
                 data_handler.fetch_historical_ohlcv_data(hist_data_start, hist_data_end)
             tickers = data_handler.symbol_list
             # data_handler.fetch_live_data(req_id=0)
@@ -341,7 +383,7 @@ def main():
 
 
         if len(backtest_dependencies.tickers) > 0:
-            backtest(backtest_dependencies)
+            run_backtest(backtest_dependencies, data_source)
         else:
             logging.info("No stocks available after filtering. Exiting.")
 
@@ -0,0 +1,68 @@
+import argparse
+import logging
+import sqlite3
+
+import config
+from database_repository import STOCK_DATA_SCHEMA, get_stock_data_time_column
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def migrate_stock_data(engine_name, table_name="stock_data_5m", keep_old_table=False, vacuum=True):
+    """
+    Converts the stock data table from text dates to the integer epoch layout of STOCK_DATA_SCHEMA,
+    a WITHOUT ROWID table keyed and clustered by (stock_id, ts).
+
+    The rows are copied in key order inside one transaction, so an interrupted migration leaves the
+    old table untouched. With keep_old_table the old table is kept as <table_name>_text.
+    """
+    db_conn = sqlite3.connect(engine_name)
+    try:
+        if get_stock_data_time_column(db_conn, table_name) == 'ts':
+            logging.info(f"{table_name} in {engine_name} already uses the integer epoch layout")
+            return
+
+        new_table_name = f"{table_name}_migrated"
+        db_conn.execute("BEGIN")
+        db_conn.execute(f"DROP TABLE IF EXISTS {new_table_name}")
+        db_conn.execute(STOCK_DATA_SCHEMA.format(table_name=new_table_name))
+        # strftime('%s') reads the text date as UTC, the same as to_epoch_seconds
+        db_conn.execute(f"""
+            INSERT OR IGNORE INTO {new_table_name} (stock_id, ts, open, high, low, close, volume, is_synthetic)
+            SELECT stock_id, CAST(strftime('%s', date) AS INTEGER), open, high, low, close, volume, COALESCE(is_synthetic, 0)
+            FROM {table_name}
+            WHERE date IS NOT NULL
+            ORDER BY stock_id, date
+            """)
+        migrated_rows = db_conn.execute(f"SELECT COUNT(*) FROM {new_table_name}").fetchone()[0]
+        old_rows = db_conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+        if keep_old_table:
+            db_conn.execute(f"ALTER TABLE {table_name} RENAME TO {table_name}_text")
+        else:
+            db_conn.execute(f"DROP TABLE {table_name}")
+        db_conn.execute(f"ALTER TABLE {new_table_name} RENAME TO {table_name}")
+        db_conn.commit()
+        logging.info(f"Migrated {migrated_rows} of {old_rows} rows of {table_name} in {engine_name} to the integer epoch layout")
+
+        if vacuum:
+            db_conn.execute("VACUUM")
+
+    except Exception as e:
+        db_conn.rollback()
+        logging.error("Error migrating stock data: %s", e)
+        raise
+
+    finally:
+        db_conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stock_data_5m to integer epoch bar times clustered by (stock_id, ts).")
+    parser.add_argument('database', nargs='?', default=None, help='defaults to DB_MANAGEMENT_ENGINE_NAME, then SQLITE_ENGINE_NAME')
+    parser.add_argument('--keep-old-table', action='store_true', help='keep the text date table as stock_data_5m_text')
+    parser.add_argument('--no-vacuum', action='store_true', help='skip reclaiming the space of the old table')
+    args = parser.parse_args()
+
+    migrate_stock_data(args.database or config.db_management_engine_name or config.engine_name,
+                       keep_old_table=args.keep_old_table, vacuum=not args.no_vacuum)
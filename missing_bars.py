@@ -1,5 +1,6 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
 import config
@@ -7,23 +8,18 @@ from database_repository import DatabaseRepository
 import helper
 
 
-def adjust_for_dst(date, dst_date_change_start, dst_date_change_end):
-    if date.date() <= dst_date_change_end.date() and date.date() >= dst_date_change_start.date():
-        date = date + timedelta(hours=1)
-    return date
-
 def check_for_missing_bars(db_repository, symbol_list, start_time, end_time, dst_date_change_start, dst_date_change_end):
     symbol_records = {}
-    rows = db_repository.get_stock_data(start_time, end_time, symbol_list)
-    for row in rows:
-        bar = list(row)
-        date = datetime.strptime(bar[1], "%Y-%m-%d %H:%M:%S")
-        date = adjust_for_dst(date, dst_date_change_start, dst_date_change_end)
-        bar[1] = date
-        stock_symbol = bar[0]
-        if stock_symbol not in symbol_records:
-            symbol_records[stock_symbol] = []
-        symbol_records[stock_symbol].append(bar[1:])
+    dst_date_change_start = np.datetime64(dst_date_change_start.date())
+    dst_date_change_end = np.datetime64(dst_date_change_end.date())
+    for symbol, records in db_repository.iter_stock_data_records(start_time, end_time, symbol_list):
+        datetimes = records['datetime'].astype('datetime64[s]')
+        days = datetimes.astype('datetime64[D]')
+        is_dst = (days >= dst_date_change_start) & (days <= dst_date_change_end)
+        symbol_records[symbol] = pd.DataFrame({
+            'timestamp': datetimes + is_dst * np.timedelta64(1, 'h'), 'open': records['open'], 'high': records['high'],
+            'low': records['low'], 'close': records['close'], 'volume': records['volume']
+        })
 
     missing_bars_data = filter_out_stocks_with_missing_records(symbol_records, start_time, end_time)
     return missing_bars_data
@@ -45,14 +41,13 @@ def filter_out_stocks_with_missing_records(symbol_records, start_time, end_time)
     missing_bars_data = {}
 
     for symbol, records in symbol_records.items():
-        if not records:
+        if records.empty:
             symbols_to_delete.append(symbol)
             continue
 
         missing_bars_data[symbol] = {}
 
-        df = pd.DataFrame(records, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        df = records.copy()
         df['date'] = df['timestamp'].dt.date
         df['time'] = df['timestamp'].dt.time
 
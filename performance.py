@@ -18,3 +18,100 @@ def calculate_drawdowns(equity_curve):
         duration[i] = 0 if drawdown[i] == 0 else duration[i-1] + 1
 
     return drawdown.max(), duration.max()
+
+
+class PerformanceTracker:
+    """
+    Performance statistics of the equity curve, updated bar by bar while the backtest
+    (or live session) runs, so the current values can be read at any time and the stats
+    at the end of a run cost O(1).
+
+    Returns are the bar to bar changes of the portfolio total and the equity curve their
+    compounded growth, as in NaivePortfolio.create_equity_curve_dataframe. The Sharpe
+    ratio and the drawdowns agree with calculate_sharpe_ratio and calculate_drawdowns,
+    mean and variance of the returns are kept with Welford's algorithm.
+    """
+    def __init__(self):
+        self.bars = 0
+        self.last_total = None
+        self.total_sum = 0.
+
+        # returns of every bar after the first
+        self.return_count = 0
+        self.return_mean = 0.
+        self.return_m2 = 0.
+        self.downside_sum_of_squares = 0.
+
+        # equity curve and drawdowns
+        self.equity = np.nan
+        self.high_water_mark = 0.
+        self.drawdown = np.nan
+        self.drawdown_duration = np.nan
+        self.max_drawdown = np.nan
+        self.max_drawdown_duration = np.nan
+
+        self.exposure_sum = 0.
+        self.traded_value = 0.
+
+    def update(self, total, gross_exposure=0.):
+        """
+        Adds the bar with the portfolio total and the summed absolute market value of its positions.
+        """
+        self.bars += 1
+        self.total_sum += total
+        if total != 0:
+            self.exposure_sum += gross_exposure / total
+
+        last_total = self.last_total
+        self.last_total = total
+        if last_total is None:
+            return
+
+        bar_return = total / last_total - 1
+        self.return_count += 1
+        delta = bar_return - self.return_mean
+        self.return_mean += delta / self.return_count
+        self.return_m2 += delta * (bar_return - self.return_mean)
+        if bar_return < 0:
+            self.downside_sum_of_squares += bar_return * bar_return
+
+        self.equity = 1.0 + bar_return if self.return_count == 1 else self.equity * (1.0 + bar_return)
+        self.high_water_mark = max(self.high_water_mark, self.equity)
+        self.drawdown = self.high_water_mark - self.equity
+        if self.drawdown == 0:
+            self.drawdown_duration = 0.
+        else:
+            self.drawdown_duration += 1
+
+        self.max_drawdown = np.fmax(self.max_drawdown, self.drawdown)
+        self.max_drawdown_duration = np.fmax(self.max_drawdown_duration, self.drawdown_duration)
+
+    def record_trade(self, value):
+        """
+        Adds the absolute value traded by a fill to the turnover.
+        """
+        self.traded_value += abs(value)
+
+    def get_annualization_factor(self, bar_size_in_sec):
+        periods = 252 * 6.5 * (3600 / bar_size_in_sec)
+        return np.sqrt(periods)
+
+    def get_sharpe_ratio(self, bar_size_in_sec):
+        if self.return_count == 0:
+            return np.nan
+        std = np.sqrt(np.float64(self.return_m2) / self.return_count)
+        return (self.get_annualization_factor(bar_size_in_sec) * self.return_mean) / std
+
+    def get_sortino_ratio(self, bar_size_in_sec):
+        if self.return_count == 0:
+            return np.nan
+        downside_deviation = np.sqrt(np.float64(self.downside_sum_of_squares) / self.return_count)
+        return (self.get_annualization_factor(bar_size_in_sec) * self.return_mean) / downside_deviation
+
+    def get_exposure(self):
+        # average share of the portfolio total held in positions
+        return self.exposure_sum / self.bars if self.bars > 0 else np.nan
+
+    def get_turnover(self):
+        # value traded relative to the average portfolio total
+        return self.traded_value / (self.total_sum / self.bars) if self.bars > 0 and self.total_sum != 0 else np.nan
@@ -1,13 +1,17 @@
+import bisect
 import csv
 import os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import config
 from abc import ABCMeta, abstractmethod
 from matplotlib import style
+from events.enums.event_type import EventType
 from events.order_event import OrderEvent
-from performance import calculate_sharpe_ratio, calculate_drawdowns
+from performance import PerformanceTracker
+from portfolio_history import PortfolioHistory
 
 class Portfolio(metaclass=ABCMeta):
     """
@@ -65,18 +69,24 @@ class NaivePortfolio(Portfolio):
         self.filename = filename
 
 
-        #all_positions stores a list of all previous positions recorded at the timestamp of a market data event.
-        # Position is simply the quantity of the asset
-        #online self.all_positions = self.construct_all_positions()
-        self.all_positions = []
         #current_positions stores a dictionary containing the current positions for the last market bar update
+        # Position is simply the quantity of the asset
         self.current_positions = {symbol: 0.0 for symbol in self.data.symbol_list}
+        #history stores the positions and holdings recorded at the timestamp of every market data event
+        self.history = PortfolioHistory(self.current_positions.keys())
+        #position_vector holds current_positions in the column order of history
+        self.position_vector = np.zeros(len(self.history.symbols))
+        #held_symbols lists the symbols with an open position in the column order of history (the data handler's symbol list),
+        # the only ones that have to be marked to market
+        self.held_symbols = []
 
-       #all_holdings stores the hitorical list of all symbol holdings
-        #online self.all_holdings = self.construct_all_holdings()
-        self.all_holdings = []
         #current_holdings stores the most up to date dictionary of all symbol holdings values
         self.current_holdings = self.construct_current_holdings()
+        #performance keeps the return and drawdown statistics up to date with every market data event
+        self.performance = PerformanceTracker()
+        #fill_history stores all fills in the order they were applied once it is set to a list,
+        # which only the sharded backtest does to merge its shards
+        self.fill_history = None
 
     def construct_current_holdings(self):
         """
@@ -97,17 +107,59 @@ class NaivePortfolio(Portfolio):
 
                 Makes use of a MarketEvent from the events queue.
                 """
-        data = {symbol: self.data.get_latest_data(symbol) for symbol in self.data.symbol_list}
-        datetime = data[self.data.symbol_list[0]][0].datetime
+        if event.bars is not None:
+            datetime = event.bars.datetime
+            closes = {symbol: event.bars.close[event.bars.columns[symbol]] for symbol in self.held_symbols}
+        else:
+            datetime = self.data.get_latest_data(self.data.symbol_list[0])[0].datetime
+            closes = {symbol: self.data.get_latest_data(symbol)[0].close for symbol in self.held_symbols}
+
+        row = self.history.append(datetime, self.position_vector, self.current_holdings['cash'], self.current_holdings['commission'])
+
+        # the market value of the symbols without a position stays 0
+        total = self.current_holdings['cash']
+        gross_exposure = 0.
+        for symbol, close in closes.items():
+            market_value = self.current_positions[symbol] * close
+            self.history.holdings[row, self.history.columns[symbol]] = market_value
+            total += market_value
+            gross_exposure += abs(market_value)
+        self.history.total[row] = total
+        self.performance.update(total, gross_exposure)
+
+    def update_timeindex_vectorized(self, datetimes, closes, snapshots):
+        """
+                Builds the positions and holdings records of a whole backtest
+                at once, as update_timeindex would have appended them bar by bar.
+                Used by the vectorized backtest.
 
-        # update all positions listing
-        positions = self.current_positions.copy()
-        positions['datetime'] = datetime
-        self.all_positions.append(positions)
+                Parameters:
+                datetimes - The datetimes of the bars in the backtest.
+                closes - Dictionary of close price arrays aligned with datetimes, per symbol.
+                snapshots - List of (bar offset, current_positions, current_holdings) taken
+                    after the fills of that bar were processed. The first entry holds the
+                    state before the backtest and has an offset of -1.
+                """
+        # the record of a bar only reflects the fills of the previous bars
+        offsets = np.array([snapshot[0] for snapshot in snapshots])
+        snapshot_index = np.searchsorted(offsets, np.arange(len(datetimes)), side='left') - 1
 
-        #update all holdings listing
-        holdings = self.get_current_holdings(data)
-        self.all_holdings.append(holdings)
+        positions = np.array([[snapshot[1][symbol] for symbol in self.history.symbols] for snapshot in snapshots])[snapshot_index]
+        cash = np.array([snapshot[2]['cash'] for snapshot in snapshots])[snapshot_index]
+        commission = np.array([snapshot[2]['commission'] for snapshot in snapshots])[snapshot_index]
+
+        holdings = np.zeros(positions.shape)
+        total = cash.copy()
+        for symbol in self.data.symbol_list:
+            column = self.history.columns[symbol]
+            if not positions[:, column].any():
+                continue
+            holdings[:, column] = positions[:, column] * closes[symbol]
+            total += holdings[:, column]
+
+        self.history.extend(datetimes, positions, holdings, cash, commission, total)
+        for bar_total, gross_exposure in zip(total.tolist(), np.abs(holdings).sum(axis=1).tolist()):
+            self.performance.update(bar_total, gross_exposure)
 
     def update_positions_from_fill(self, fill):
         """
@@ -124,6 +176,13 @@ class NaivePortfolio(Portfolio):
             fill_dir = -1
 
         self.current_positions[fill.symbol] += fill_dir * fill.quantity
+        self.position_vector[self.history.columns[fill.symbol]] = self.current_positions[fill.symbol]
+
+        if self.current_positions[fill.symbol] == 0:
+            if fill.symbol in self.held_symbols:
+                self.held_symbols.remove(fill.symbol)
+        elif fill.symbol not in self.held_symbols:
+            bisect.insort(self.held_symbols, fill.symbol, key=self.history.columns.get)
 
     def update_holdings_from_fill(self, fill):
         """
@@ -154,9 +213,12 @@ class NaivePortfolio(Portfolio):
                 Updates the portfolio current positions and holdings
                 from a FillEvent.
                 """
-        if event.type == 'FILL':
+        if event.type == EventType.FILL:
             self.update_positions_from_fill(event)
             self.update_holdings_from_fill(event)
+            self.performance.record_trade(event.fill_cost * event.quantity)
+            if self.fill_history is not None:
+                self.fill_history.append(event)
 
     def generate_naive_order(self, signal):
         """
@@ -196,37 +258,38 @@ class NaivePortfolio(Portfolio):
                 Acts on a SignalEvent to generate new orders
                 based on the portfolio logic.
                 """
-        if event.type == 'SIGNAL':
+        if event.type == EventType.SIGNAL:
             order_event = self.generate_naive_order(event)
             if order_event is not None:
                 self.events.put(order_event)
 
     def create_equity_curve_dataframe(self):
         """
-                Creates a pandas DataFrame from the all_holdings
-                list of dictionaries.
+                Creates a pandas DataFrame from the holdings
+                matrices of the history.
                 """
-        curve = pd.DataFrame(self.all_holdings)
-        curve.set_index('datetime', inplace=True)
+        curve = self.history.to_dataframe()
         curve['returns'] = curve['total'].pct_change() #daily return. how much value has changed from prev day
         curve['equity_curve'] = (1.0 + curve['returns']).cumprod() #compounded growth index at that point in time from starting value. shows how an initial investment would grow over time
         self.equity_curve = curve
         self.holdings_curve = curve['total']
 
     def summary_stats(self, bar_size_in_sec):
-        self.create_equity_curve_dataframe()
-        total_return = self.equity_curve['equity_curve'][-1] #start_capital * total_return = final total value
-        returns = self.equity_curve['returns']
-        pnl = self.equity_curve['equity_curve']
+        stats = self.compute_summary_stats(bar_size_in_sec)
+        self.write_summary_stats_to_file(stats)
 
-        sharpe_ratio = calculate_sharpe_ratio(returns, bar_size_in_sec)
-        max_dd, dd_duration = calculate_drawdowns(pnl)
+    def compute_summary_stats(self, bar_size_in_sec):
+        performance = self.performance
+        total_return = performance.equity #start_capital * total_return = final total value
 
         stats = {
             "Total Return (%)": round((total_return - 1.0) * 100, 2),
-            "Sharpe Ratio": round(sharpe_ratio, 2),
-            "Max Drawdown (%)": round(max_dd * 100, 2),
-            "Drawdown Duration": dd_duration
+            "Sharpe Ratio": round(performance.get_sharpe_ratio(bar_size_in_sec), 2),
+            "Sortino Ratio": round(performance.get_sortino_ratio(bar_size_in_sec), 2),
+            "Max Drawdown (%)": round(performance.max_drawdown * 100, 2),
+            "Drawdown Duration": performance.max_drawdown_duration,
+            "Exposure (%)": round(performance.get_exposure() * 100, 2),
+            "Turnover": round(performance.get_turnover(), 2),
         }
 
         # Add current positions (non-zero only)
@@ -238,8 +301,8 @@ class NaivePortfolio(Portfolio):
         for key, value in self.get_current_holdings().items():
             if value != 0:
                 stats[f"Holding: {key}"] = value
-        
-        self.write_summary_stats_to_file(stats)
+
+        return stats
 
         
     def write_summary_stats_to_file(self, stats):
@@ -353,17 +416,14 @@ class NaivePortfolio(Portfolio):
         self.plot_holdings()
        # plt.show()
 
-    def get_current_holdings(self, last_bar=None):
-        if last_bar is None:
-            last_bar = {symbol: self.data.get_latest_data(symbol) for symbol in self.data.symbol_list}
-
+    def get_current_holdings(self):
         holdings = self.current_holdings.copy()
-        holdings['datetime'] = last_bar[self.data.symbol_list[0]][0].datetime
+        holdings['datetime'] = self.data.get_latest_data(self.data.symbol_list[0])[0].datetime
         holdings['total'] = self.current_holdings['cash']
 
-        for symbol in self.data.symbol_list:
-            market_value = self.current_positions[symbol] * last_bar[symbol][0].close
+        for symbol in self.held_symbols:
+            market_value = self.current_positions[symbol] * self.data.get_latest_data(symbol)[0].close
             holdings[symbol] = market_value
             holdings['total'] += market_value
 
-        return holdings
\ No newline at end of file
+        return holdings
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+# rows the matrices grow by when they are full
+CHUNK_SIZE = 1024
+
+
+class PortfolioHistory:
+    """
+    Positions and holdings of every bar of a backtest, one row per bar in preallocated
+    (bar, symbol) NumPy matrices that grow by CHUNK_SIZE rows when they are full.
+
+    holdings holds the market value of the position of each symbol at the close of the bar.
+    Rows start out as zeros, so only the symbols with an open position have to be written.
+    """
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.columns = {symbol: column for column, symbol in enumerate(self.symbols)}
+        self.size = 0
+
+        self.datetimes = np.empty(0, dtype='datetime64[ns]')
+        self.positions = np.zeros((0, len(self.symbols)))
+        self.holdings = np.zeros((0, len(self.symbols)))
+        self.cash = np.zeros(0)
+        self.commission = np.zeros(0)
+        self.total = np.zeros(0)
+
+    def _reserve(self, rows):
+        capacity = len(self.datetimes)
+        if self.size + rows <= capacity:
+            return
+
+        capacity += -(-(self.size + rows - capacity) // CHUNK_SIZE) * CHUNK_SIZE
+        self.datetimes = self._grow(self.datetimes, capacity)
+        self.positions = self._grow(self.positions, capacity)
+        self.holdings = self._grow(self.holdings, capacity)
+        self.cash = self._grow(self.cash, capacity)
+        self.commission = self._grow(self.commission, capacity)
+        self.total = self._grow(self.total, capacity)
+
+    def _grow(self, array, capacity):
+        grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+        grown[:self.size] = array[:self.size]
+        return grown
+
+    def append(self, datetime, positions, cash, commission):
+        """
+        Adds the row of a bar with the positions vector of the portfolio and returns its index.
+        The market values and the total of the row are set by the caller.
+        """
+        self._reserve(1)
+        row = self.size
+        self.datetimes[row] = pd.Timestamp(datetime).to_datetime64()
+        self.positions[row] = positions
+        self.cash[row] = cash
+        self.commission[row] = commission
+        self.size += 1
+        return row
+
+    def extend(self, datetimes, positions, holdings, cash, commission, total):
+        """
+        Adds the rows of several bars at once, every argument has one entry (or row) per bar.
+        """
+        rows = len(datetimes)
+        self._reserve(rows)
+        block = slice(self.size, self.size + rows)
+        self.datetimes[block] = datetimes
+        self.positions[block] = positions
+        self.holdings[block] = holdings
+        self.cash[block] = cash
+        self.commission[block] = commission
+        self.total[block] = total
+        self.size += rows
+
+    def to_dataframe(self):
+        """
+        Returns the holdings of all bars with one column per symbol plus cash, commission and total, indexed by datetime.
+        """
+        curve = pd.DataFrame(self.holdings[:self.size], columns=self.symbols,
+                             index=pd.DatetimeIndex(self.datetimes[:self.size], name='datetime'))
+        curve['cash'] = self.cash[:self.size]
+        curve['commission'] = self.commission[:self.size]
+        curve['total'] = self.total[:self.size]
+        return curve
@@ -0,0 +1,103 @@
+import logging
+
+# granularity of the bars in stock_data_5m in seconds
+BASE_GRANULARITY = 300
+
+# Rollup tables of stock_data_5m by bar granularity in seconds, each row aggregates the 5 minute bars of one
+# bucket (the stored bar times floored to the granularity) of one stock
+ROLLUP_TABLES = {
+    600: "stock_data_10m",
+    900: "stock_data_15m",
+    1800: "stock_data_30m",
+    3600: "stock_data_1h",
+    86400: "stock_data_1d",
+}
+
+# 5 minute slots of the largest bucket that has a slot mask, daily rows have none
+SLOT_MASK_BITS = 3600 // BASE_GRANULARITY
+
+# Same key and clustering as STOCK_DATA_SCHEMA. bar_count is the number of 5 minute bars of the bucket and
+# bit i of slot_mask is set if the bar at ts + i * 5 minutes exists, so the exact 5 minute bar times can be
+# restored for the completeness check of the data handlers without reading stock_data_5m.
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table_name} (
+    stock_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    open REAL,
+    high REAL,
+    low REAL,
+    close REAL,
+    volume INTEGER,
+    bar_count INTEGER NOT NULL,
+    slot_mask INTEGER,
+    PRIMARY KEY (stock_id, ts)
+    ) WITHOUT ROWID;
+    """
+
+
+def create_rollup_tables(db_conn):
+    for table_name in ROLLUP_TABLES.values():
+        db_conn.execute(ROLLUP_SCHEMA.format(table_name=table_name))
+
+
+def get_rollup_tables(db_conn):
+    # {granularity: table name} of the rollup tables of the database
+    table_names = {row[0] for row in db_conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return {granularity: table_name for granularity, table_name in ROLLUP_TABLES.items() if table_name in table_names}
+
+
+def refresh_rollups(db_conn, stock_id=None, start_ts=None, end_ts=None, source_table_name="stock_data_5m"):
+    """
+    Aggregates the 5 minute bars of the integer epoch layout into the existing rollup tables with one
+    INSERT ... SELECT per table: open of the first bar, high/low the max/min, close of the last bar and
+    the summed volume of every bucket.
+
+    Only the buckets of stock_id (all stocks if None) that overlap start_ts..end_ts (epoch seconds, all
+    times if None) are deleted and aggregated again, so the population scripts can keep the rollups up to
+    date after inserting new bars. Runs in the transaction of the caller, who commits.
+    """
+    for granularity, table_name in get_rollup_tables(db_conn).items():
+        conditions = []
+        parameters = []
+        if stock_id is not None:
+            conditions.append("stock_id = ?")
+            parameters.append(stock_id)
+        if start_ts is not None and end_ts is not None:
+            # whole buckets, also the bars of the first and last bucket outside the range
+            conditions.append("ts BETWEEN ? AND ?")
+            parameters += [start_ts // granularity * granularity, end_ts // granularity * granularity + granularity - 1]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        slot_mask = f"SUM(1 << ((ts % {granularity}) / {BASE_GRANULARITY}))" if granularity <= SLOT_MASK_BITS * BASE_GRANULARITY else "NULL"
+        db_conn.execute(f"DELETE FROM {table_name} {where}", parameters)
+        # bar times are unique per stock, so the sum of the slot bits is their bitwise or
+        db_conn.execute(f"""
+            INSERT INTO {table_name} (stock_id, ts, open, high, low, close, volume, bar_count, slot_mask)
+            SELECT
+            b.stock_id,
+            b.bucket,
+            (SELECT f.open FROM {source_table_name} f WHERE f.stock_id = b.stock_id AND f.ts = b.first_ts),
+            b.high,
+            b.low,
+            (SELECT l.close FROM {source_table_name} l WHERE l.stock_id = b.stock_id AND l.ts = b.last_ts),
+            b.volume,
+            b.bar_count,
+            b.slot_mask
+            FROM (
+                SELECT
+                stock_id,
+                ts / {granularity} * {granularity} AS bucket,
+                MIN(ts) AS first_ts,
+                MAX(ts) AS last_ts,
+                MAX(high) AS high,
+                MIN(low) AS low,
+                SUM(volume) AS volume,
+                COUNT(*) AS bar_count,
+                {slot_mask} AS slot_mask
+                FROM {source_table_name}
+                {where}
+                GROUP BY stock_id, bucket
+            ) b
+            ORDER BY b.stock_id, b.bucket
+            """, parameters)
+        logging.debug("Refreshed %s for stock %s from %s to %s", table_name, stock_id, start_ts, end_ts)
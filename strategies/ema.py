@@ -8,7 +8,9 @@ import os
 import shutil
 import mplfinance as mpf
 import config
-from strategies.strategy import Strategy
+from events.enums.event_type import EventType
+from strategies.indicators import EMA, RSI
+from strategies.strategy import Strategy, VectorizedSignal
 
 class EMAStrategy(Strategy):
 
@@ -28,17 +30,19 @@ class EMAStrategy(Strategy):
 
         self.stocks_sold_at_mkt_closing = []
         self.stocks_to_retain = []
+
+        self.indicators = self._initialize_indicators()
+        self.last_indicator_bar_time = {symbol: None for symbol in self.data_handler.symbol_list}
         
         logging.info(f"Initialized EMA Strategy with Short Period: {self.short_period}, Long Period: {self.long_period}, Take Profit Margin: {self.take_profit_percentage}%\n")
         if self.use_rsi:
             logging.info(f"RSI Indicator Enabled with Period: {self.rsi_period}, Overbought: {self.rsi_overbought}, Oversold: {self.rsi_oversold}\n")
 
     def post_data_fetch_setup(self):
-        for symbol in self.data_handler.symbol_list:
-            self.data_handler.all_data[symbol]["ema_short"] = 0
-            self.data_handler.all_data[symbol]["ema_long"] = 0
-            self.data_handler.all_data[symbol]["signal"] = None
-            self.data_handler.all_data[symbol]["take_profit"] = np.nan
+        self.plot_annotations.add_column("ema_short", 0)
+        self.plot_annotations.add_column("ema_long", 0)
+        self.plot_annotations.add_column("signal", None)
+        self.plot_annotations.add_column("take_profit", np.nan)
 
     def on_order_filled(self, symbol, direction, fill_price):
         if direction == 'BUY':
@@ -64,6 +68,82 @@ class EMAStrategy(Strategy):
         self.exit_levels[symbol]['take_profit'] = take_profit
         logging.info(f"Exit levels updated for {symbol}: Take Profit = {take_profit}")
 
+    def _initialize_indicators(self):
+        indicators = {}
+        for symbol in self.data_handler.symbol_list:
+            indicators[symbol] = {
+                'EMA_short': EMA(self.short_period),
+                'EMA_long': EMA(self.long_period),
+                'RSI': RSI(self.rsi_period),
+            }
+        return indicators
+
+    def update_indicators(self, symbol, data):
+        """
+        Feeds the bars of data the indicators of the symbol have not seen yet. That is usually only the
+        latest bar, a symbol that was not active for some time catches up on the bars it missed.
+        """
+        indicators = self.indicators[symbol]
+        last_bar_time = self.last_indicator_bar_time[symbol]
+        first_new_bar = 0 if last_bar_time is None else np.searchsorted(data.datetime, last_bar_time, side='right')
+
+        for close in data.close[first_new_bar:]:
+            indicators['EMA_short'].update(close)
+            indicators['EMA_long'].update(close)
+            if self.use_rsi:
+                indicators['RSI'].update(close)
+
+        self.last_indicator_bar_time[symbol] = data.datetime[-1]
+
+    def update_indicators_from_batch(self, symbol, bars):
+        """
+        Feeds the bar of the symbol in the batch to its indicators if they have seen all bars before it,
+        otherwise the symbol catches up on the bars it missed through update_indicators.
+        """
+        last_bar_time = self.last_indicator_bar_time[symbol]
+        is_up_to_date = bars.index == 0 if last_bar_time is None else bars.datetimes[bars.index - 1] == last_bar_time
+        if not is_up_to_date:
+            self.update_indicators(symbol, self.data_handler.get_latest_data(symbol, N=0))
+            return
+
+        indicators = self.indicators[symbol]
+        close = bars.close[bars.columns[symbol]]
+        indicators['EMA_short'].update(close)
+        indicators['EMA_long'].update(close)
+        if self.use_rsi:
+            indicators['RSI'].update(close)
+
+        self.last_indicator_bar_time[symbol] = bars.datetimes[bars.index]
+
+    def get_latest_values_from_batch(self, symbol, bars):
+        indicators = self.indicators[symbol]
+        column = bars.columns[symbol]
+        return {
+            'date': bars.datetime,
+            'open': bars.open[column],
+            'high': bars.high[column],
+            'low': bars.low[column],
+            'close': bars.close[column],
+            'volume': bars.volume[column],
+            'EMA_short': indicators['EMA_short'].value,
+            'EMA_long': indicators['EMA_long'].value,
+            'RSI': indicators['RSI'].value,
+        }
+
+    def get_latest_values(self, symbol, data):
+        indicators = self.indicators[symbol]
+        return {
+            'date': pd.Timestamp(data.datetime[-1]),
+            'open': data.open[-1],
+            'high': data.high[-1],
+            'low': data.low[-1],
+            'close': data.close[-1],
+            'volume': data.volume[-1],
+            'EMA_short': indicators['EMA_short'].value,
+            'EMA_long': indicators['EMA_long'].value,
+            'RSI': indicators['RSI'].value,
+        }
+
     def calculate_moving_averages(self, df):
         df['EMA_short'] = trend.ema_indicator(df['close'], window=self.short_period)
         df['EMA_long'] = trend.ema_indicator(df['close'], window=self.long_period)
@@ -80,32 +160,34 @@ class EMAStrategy(Strategy):
         return df
 
     def calculate_signals(self, event):
-        if event.type == 'MARKET':
+        if event.type == EventType.MARKET:
 
+            bars = event.bars
             five_sec_bar = None
+            is_new_bar = True
             for symbol in self.data_handler.symbol_list_active:
 
-                five_sec_bar, is_new_bar, data = self.fetch_latest_data(symbol)
+                if bars is not None:
+                    self.update_indicators_from_batch(symbol, bars)
+                    latest = self.get_latest_values_from_batch(symbol, bars)
+                    bar_count = bars.index + 1
+                else:
+                    five_sec_bar, is_new_bar, data = self.fetch_latest_data(symbol)
 
-                if five_sec_bar is not None:
-                    logging.info(f'5-sec-bar - Time: {five_sec_bar.datetime}, Symbol: {symbol}, Close: {five_sec_bar.close}')
-
-                if len(data) == 0:
-                    continue
+                    if five_sec_bar is not None:
+                        logging.info(f'5-sec-bar - Time: {five_sec_bar.datetime}, Symbol: {symbol}, Close: {five_sec_bar.close}')
 
-                df = self.convert_raw_date_to_dataframe(data)
-
-                df = self.calculate_moving_averages(df)
-
-                if self.use_rsi:
-                    df = self.calculate_rsi(df)
+                    if len(data) == 0:
+                        continue
 
-                latest = df.iloc[-1]
+                    self.update_indicators(symbol, data)
+                    latest = self.get_latest_values(symbol, data)
+                    bar_count = len(data)
 
                 self.add_properties_for_plotting(symbol, latest)
 
                 ## Buy Previous Day Sold Stocks
-                if helper.is_new_day(self.data_handler) and symbol in self.stocks_to_retain:
+                if symbol in self.stocks_to_retain and helper.is_new_day(self.data_handler):
                     if latest['EMA_short'] > latest['EMA_long']:
                         quantity = 2
                         buy_price = latest['close']
@@ -133,13 +215,14 @@ class EMAStrategy(Strategy):
 
                 # Check for exit strategy (take profit)
                 if self.bought[symbol]:
-                    signal = self.process_exit_strategy(symbol, self.data_handler.get_latest_data(symbol)[0])
+                    bar = bars.get_bar(symbol) if bars is not None else self.data_handler.get_latest_data(symbol)[0]
+                    signal = self.process_exit_strategy(symbol, bar)
                     if signal is not None:
                         self.events.put(signal)
                         continue
 
                 # Run EMA strategy
-                if data is not None and is_new_bar and len(data) >= self.long_period:
+                if is_new_bar and bar_count >= self.long_period:
                     exit_levels = self.exit_levels[symbol]
                     try:
                         value = (str(five_sec_bar.datetime), five_sec_bar.close)
@@ -150,7 +233,7 @@ class EMAStrategy(Strategy):
                         f"Symbol: {symbol}, 5-Sec-Bar: [{value}] | Aggregated Bar - Time: {latest['date']}, Open:{latest['open']}, High: {latest['high']}, Low: {latest['low']}, Close: {latest['close']}, Volume: {latest['volume']} "
                         f"EMA_short: {latest['EMA_short']}, EMA_long: {latest['EMA_long']}, RSI: {latest['RSI']} StopLoss: {exit_levels['stop_loss']}, TakeProfit: {exit_levels['take_profit']}")
 
-                    if self.is_buying_condition_met(symbol, df):
+                    if self.is_buying_condition_met(symbol):
                         quantity = 2
                         buy_price = latest['close']
                         signal = self.buy(symbol, latest['date'], buy_price, quantity, f"Short-term EMA {latest['EMA_short']} crossed ABOVE Long-term EMA {latest['EMA_long']}")
@@ -158,7 +241,7 @@ class EMAStrategy(Strategy):
                         if helper.IS_BACKTEST:
                             self._update_exit_levels(symbol, buy_price)
 
-                    elif self.is_selling_condition_met(symbol, df):
+                    elif self.is_selling_condition_met(symbol):
                         quantity = self.portfolio.current_positions[symbol]
                         if quantity > 0:
                             sell_price = latest['close']
@@ -166,57 +249,159 @@ class EMAStrategy(Strategy):
                             self.events.put(signal)
                             self._update_exit_levels(symbol, np.nan)
                             
-    def is_buying_condition_met(self, symbol, df):
-        return self.bought[symbol] == False and self.has_short_term_ema_crossed_above_long_term_ema(df) and (not self.use_rsi or self.is_rsi_oversold(df))
+    def calculate_signals_vectorized(self, symbol, bars, sessions, active):
+        """
+        Vectorized counterpart of calculate_signals. The indicators and the crossing conditions are
+        computed over the full history at once, then every session is walked from one entry or exit to the next.
+        """
+        signals = []
+        plotting = {"ema_short": [], "ema_long": [], "take_profit": []}
+        if self.use_rsi:
+            plotting["rsi"] = []
 
-    def is_selling_condition_met(self, symbol, df):
-        return self.bought[symbol] == True and self.has_short_term_ema_crossed_below_long_term_ema(df) and (not self.use_rsi or self.is_rsi_overbought(df))
+        df = pd.DataFrame({"close": bars.close})
+        df = self.calculate_moving_averages(df)
+        ema_short = df['EMA_short'].to_numpy()
+        ema_long = df['EMA_long'].to_numpy()
 
-    def convert_raw_date_to_dataframe(self, data):
-        df = pd.DataFrame(data, columns=["symbol", "date", "open", "high", "low", "close", "volume"])
-        df = df.drop(["symbol"], axis=1)
-        df.set_index('date', inplace=True, drop=False)
+        has_enough_data = np.arange(1, len(df) + 1) >= self.long_period
+        is_cutoff = helper.get_seconds_of_day(bars.datetime) >= helper.time_string_to_seconds(helper.DAILY_TRADING_END_TIME, "%H:%M")
 
-        return df
+        crossed_above = np.zeros(len(df), dtype=bool)
+        crossed_above[1:] = (ema_short[:-1] < ema_long[:-1]) & (ema_short[1:] > ema_long[1:])
+        crossed_below = np.zeros(len(df), dtype=bool)
+        crossed_below[1:] = (ema_short[:-1] > ema_long[:-1]) & (ema_short[1:] < ema_long[1:])
+
+        buy_condition = ~is_cutoff & has_enough_data & crossed_above
+        sell_condition = has_enough_data & crossed_below
+        if self.use_rsi:
+            rsi = self.calculate_rsi(df)['RSI'].to_numpy()
+            buy_condition &= rsi < self.rsi_oversold
+            sell_condition &= rsi > self.rsi_overbought
+
+        bought = self.bought[symbol]
+        quantity = self.portfolio.current_positions[symbol]
+        take_profit = self.exit_levels[symbol]['take_profit']
+        sold_at_mkt_closing = False
+        times_to_retain = self.stocks_to_retain.count(symbol)
+
+        for (start, end, is_new_day), is_active in zip(sessions, active):
+            if is_new_day:
+                # initialize_stocks_to_retain_from_prev_day
+                if sold_at_mkt_closing and is_active:
+                    times_to_retain += 1
+                sold_at_mkt_closing = False
+
+            if not is_active:
+                continue
+
+            indices = np.arange(start, end)
+            plotting["ema_short"].append((indices, ema_short[start:end]))
+            plotting["ema_long"].append((indices, ema_long[start:end]))
+            if self.use_rsi:
+                plotting["rsi"].append((indices, rsi[start:end]))
+
+            # take profit level as plotted, i.e. before the bar is processed
+            take_profit_levels = np.empty(end - start)
+            i = start
+
+            ## Buy Previous Day Sold Stocks
+            if is_new_day and times_to_retain > 0:
+                if ema_short[start] > ema_long[start]:
+                    take_profit_levels[0] = take_profit
+                    buy_price = bars.close[start]
+                    signals.append(VectorizedSignal(start, 'BUY', buy_price, 2, 'PREVIOUS DAY CLOSED STOCKS RETAINED AT DAY START'))
+                    take_profit = buy_price * (1 + self.take_profit_percentage / 100)
+                    bought = True
+                    quantity += 2
+                    i = start + 1
+                else:
+                    times_to_retain -= 1
+
+            while i < end:
+                if not bought:
+                    hits = np.flatnonzero(buy_condition[i:end])
+                else:
+                    hits = np.flatnonzero(is_cutoff[i:end] | (bars.high[i:end] > take_profit) | sell_condition[i:end])
+
+                if len(hits) == 0:
+                    take_profit_levels[i - start:] = take_profit
+                    break
+
+                j = i + hits[0]
+                take_profit_levels[i - start:j - start + 1] = take_profit
+
+                if not bought:
+                    buy_price = bars.close[j]
+                    signals.append(VectorizedSignal(j, 'BUY', buy_price, 2, f"Short-term EMA {ema_short[j]} crossed ABOVE Long-term EMA {ema_long[j]}"))
+                    take_profit = buy_price * (1 + self.take_profit_percentage / 100)
+                    bought = True
+                    quantity += 2
+                else:
+                    if is_cutoff[j]:
+                        signals.append(VectorizedSignal(j, 'SELL', bars.close[j], quantity, 'MKT CLOSING - CUT OFF TIME REACHED'))
+                        sold_at_mkt_closing = True
+                    elif bars.high[j] > take_profit:
+                        signals.append(VectorizedSignal(j, 'SELL', take_profit, quantity, f"High {bars.high[j]} crossed Take Profit {take_profit}"))
+                    else:
+                        signals.append(VectorizedSignal(j, 'SELL', bars.close[j], quantity, f"Short-term EMA {ema_short[j]} crossed BELOW Long-term EMA {ema_long[j]}"))
+                    take_profit = np.nan
+                    bought = False
+                    quantity = 0.0
+                i = j + 1
+
+            plotting["take_profit"].append((indices, take_profit_levels))
+
+        self.exit_levels[symbol]['take_profit'] = take_profit
+
+        for property_name, values in plotting.items():
+            if values:
+                indices, property_values = zip(*values)
+                self.add_property_for_plotting_vectorized(symbol, property_name, np.concatenate(indices), np.concatenate(property_values))
+
+        return signals
+
+    def is_buying_condition_met(self, symbol):
+        return self.bought[symbol] == False and self.has_short_term_ema_crossed_above_long_term_ema(symbol) and (not self.use_rsi or self.is_rsi_oversold(symbol))
+
+    def is_selling_condition_met(self, symbol):
+        return self.bought[symbol] == True and self.has_short_term_ema_crossed_below_long_term_ema(symbol) and (not self.use_rsi or self.is_rsi_overbought(symbol))
 
     def add_properties_for_plotting(self, symbol, latest):
-        dt = pd.Timestamp(latest['date'])
-        all_data_df = self.data_handler.all_data[symbol]
-        all_data_df.loc[all_data_df['date'] == dt, "ema_short"] = latest['EMA_short']
-        all_data_df.loc[all_data_df['date'] == dt, "ema_long"] = latest['EMA_long']
+        self.add_property_for_plotting(symbol, latest['date'], "ema_short", latest['EMA_short'])
+        self.add_property_for_plotting(symbol, latest['date'], "ema_long", latest['EMA_long'])
         if self.use_rsi:
-            all_data_df.loc[all_data_df['date'] == dt, "rsi"] = latest['RSI']
-        all_data_df.loc[all_data_df['date'] == dt, "take_profit"] = self.exit_levels[symbol]['take_profit']
-        return dt,all_data_df
+            self.add_property_for_plotting(symbol, latest['date'], "rsi", latest['RSI'])
+        self.add_property_for_plotting(symbol, latest['date'], "take_profit", self.exit_levels[symbol]['take_profit'])
     
 
-    def has_short_term_ema_crossed_above_long_term_ema(self, df):
-        prev = df.iloc[-2]
-        curr = df.iloc[-1]
+    def has_short_term_ema_crossed_above_long_term_ema(self, symbol):
+        ema_short = self.indicators[symbol]['EMA_short']
+        ema_long = self.indicators[symbol]['EMA_long']
 
-        if prev['EMA_short'] < prev['EMA_long'] and curr['EMA_short'] > curr['EMA_long']:
+        if ema_short.previous < ema_long.previous and ema_short.value > ema_long.value:
             logging.info(
-                f"EMA CROSSED ABOVE - PrevEMA_Short: {prev['EMA_short']}, PrevEMA_long: {prev['EMA_long']}, CurrEMA_short: {curr['EMA_short']}, CurrEMA_long: {curr['EMA_long']}")
+                f"EMA CROSSED ABOVE - PrevEMA_Short: {ema_short.previous}, PrevEMA_long: {ema_long.previous}, CurrEMA_short: {ema_short.value}, CurrEMA_long: {ema_long.value}")
             return True
 
         return False
 
-    def has_short_term_ema_crossed_below_long_term_ema(self, df):
-        prev = df.iloc[-2]
-        curr = df.iloc[-1]
+    def has_short_term_ema_crossed_below_long_term_ema(self, symbol):
+        ema_short = self.indicators[symbol]['EMA_short']
+        ema_long = self.indicators[symbol]['EMA_long']
 
-        if prev['EMA_short'] > prev['EMA_long'] and curr['EMA_short'] < curr['EMA_long']:
+        if ema_short.previous > ema_long.previous and ema_short.value < ema_long.value:
             logging.info(
-                f"EMA CROSSED BELOW - PrevEMA_Short: {prev['EMA_short']}, PrevEMA_long: {prev['EMA_long']}, CurrEMA_short: {curr['EMA_short']}, CurrEMA_long: {curr['EMA_long']}")
+                f"EMA CROSSED BELOW - PrevEMA_Short: {ema_short.previous}, PrevEMA_long: {ema_long.previous}, CurrEMA_short: {ema_short.value}, CurrEMA_long: {ema_long.value}")
             return True
 
         return False
 
-    def is_rsi_overbought(self, df):
-        return df.iloc[-1]['RSI'] > self.rsi_overbought
+    def is_rsi_overbought(self, symbol):
+        return self.indicators[symbol]['RSI'].value > self.rsi_overbought
 
-    def is_rsi_oversold(self, df):
-        return df.iloc[-1]['RSI'] < self.rsi_oversold
+    def is_rsi_oversold(self, symbol):
+        return self.indicators[symbol]['RSI'].value < self.rsi_oversold
 
     def process_exit_strategy(self, symbol, bar):
         quantity = self.portfolio.current_positions[symbol]
@@ -0,0 +1,242 @@
+from abc import ABC, abstractmethod
+from collections import deque
+import math
+
+
+class Indicator(ABC):
+    """
+    Streaming indicator that is fed one bar at a time and updates in O(1) per bar, so a strategy
+    keeps one object per symbol instead of recomputing the indicator over the whole bar history.
+
+    value is the indicator after the latest update (NaN while there are not enough bars yet) and
+    previous the value before it, which is what crossing conditions compare against.
+    """
+    def __init__(self):
+        self.value = math.nan
+        self.previous = math.nan
+
+    @abstractmethod
+    def update(self, *args):
+        raise NotImplementedError
+
+    def _set_value(self, value):
+        self.previous = self.value
+        self.value = value
+        return value
+
+
+class EMA(Indicator):
+    """
+    Exponential moving average, same numbers as ta.trend.ema_indicator,
+    i.e. pandas ewm(span=period, min_periods=period, adjust=False).mean().
+    """
+    def __init__(self, period, min_periods=None):
+        super().__init__()
+        self.period = period
+        self.min_periods = period if min_periods is None else min_periods
+        center_of_mass = (period - 1) / 2
+        self.alpha = 1. / (1. + center_of_mass)
+        self.old_weight_factor = 1. - self.alpha
+        self.weighted = None
+        self.old_weight = 1.
+        self.observations = 0
+
+    def update(self, value):
+        is_observation = value == value
+        self.observations += is_observation
+
+        if self.weighted is None:
+            self.weighted = value
+        elif self.weighted == self.weighted:
+            self.old_weight *= self.old_weight_factor
+            if is_observation:
+                # avoid numerical errors on constant series
+                if self.weighted != value:
+                    self.weighted = self.old_weight * self.weighted + self.alpha * value
+                    self.weighted /= (self.old_weight + self.alpha)
+                self.old_weight = 1.
+        elif is_observation:
+            self.weighted = value
+
+        return self._set_value(self.weighted if self.observations >= self.min_periods else math.nan)
+
+
+class SMA(Indicator):
+    """
+    Simple moving average over the last period values, same numbers as ta.trend.sma_indicator,
+    i.e. pandas rolling(period).mean(), which keeps a compensated running sum of the window.
+    """
+    def __init__(self, period, min_periods=None):
+        super().__init__()
+        self.period = period
+        self.min_periods = period if min_periods is None else min_periods
+        self.window = deque()
+        self._reset_sum()
+
+    def _reset_sum(self):
+        self.observations = 0
+        self.sum = 0.
+        self.negative_count = 0
+        self.compensation_add = 0.
+        self.compensation_remove = 0.
+        self.consecutive_same_values = 0
+        self.last_value = None
+
+    def _add(self, value):
+        if value != value:
+            return
+        self.observations += 1
+        y = value - self.compensation_add
+        t = self.sum + y
+        self.compensation_add = t - self.sum - y
+        self.sum = t
+        if math.copysign(1., value) < 0:
+            self.negative_count += 1
+        if value == self.last_value:
+            self.consecutive_same_values += 1
+        else:
+            self.consecutive_same_values = 1
+        self.last_value = value
+
+    def _remove(self, value):
+        if value != value:
+            return
+        self.observations -= 1
+        y = -value - self.compensation_remove
+        t = self.sum + y
+        self.compensation_remove = t - self.sum - y
+        self.sum = t
+        if math.copysign(1., value) < 0:
+            self.negative_count -= 1
+
+    def update(self, value):
+        self.window.append(value)
+        if len(self.window) > self.period:
+            removed = self.window.popleft()
+            if self.period == 1:
+                # like pandas, start over when the window does not overlap the previous one
+                self._reset_sum()
+            else:
+                self._remove(removed)
+        self._add(value)
+
+        if self.observations < self.min_periods or self.observations == 0:
+            return self._set_value(math.nan)
+
+        mean = self.sum / self.observations
+        if self.consecutive_same_values >= self.observations:
+            mean = self.last_value
+        elif self.negative_count == 0 and mean < 0:
+            mean = 0.
+        elif self.negative_count == self.observations and mean > 0:
+            mean = 0.
+        return self._set_value(mean)
+
+
+class RSI(Indicator):
+    """
+    Relative strength index from the simple moving averages of gains and losses,
+    as EMAStrategy.calculate_rsi computes it over a whole DataFrame.
+    """
+    def __init__(self, period):
+        super().__init__()
+        self.period = period
+        self.gains = SMA(period)
+        self.losses = SMA(period)
+        self.previous_close = None
+
+    def update(self, close):
+        if self.previous_close is None:
+            gain, loss = 0., -0.
+        else:
+            delta = close - self.previous_close
+            gain = delta if delta > 0 else 0.
+            loss = -delta if delta < 0 else -0.
+        self.previous_close = close
+
+        average_gain = self.gains.update(gain)
+        average_loss = self.losses.update(loss)
+
+        if average_gain != average_gain or average_loss != average_loss:
+            return self._set_value(math.nan)
+        if average_loss == 0:
+            # gain / 0 is +-inf, which makes the RSI 100
+            return self._set_value(math.nan if average_gain == 0 else 100.)
+        return self._set_value(100 - (100 / (1 + average_gain / average_loss)))
+
+
+class VWAP(Indicator):
+    """
+    Volume weighted average price of the typical price (high + low + close) / 3 since the last reset.
+    """
+    def __init__(self):
+        super().__init__()
+        self.cumulative_tp_volume = 0.
+        self.cumulative_volume = 0.
+
+    def update(self, high, low, close, volume):
+        typical_price = (high + low + close) / 3
+        self.cumulative_tp_volume += typical_price * volume
+        self.cumulative_volume += volume
+
+        if self.cumulative_volume > 0:
+            return self._set_value(self.cumulative_tp_volume / self.cumulative_volume)
+        return self._set_value(math.nan)
+
+    def reset(self):
+        self.__init__()
+
+
+class MACD(Indicator):
+    """
+    Moving average convergence divergence: value is the fast minus the slow EMA,
+    signal the EMA of value and histogram their difference.
+    """
+    def __init__(self, fast_period=12, slow_period=26, signal_period=9):
+        super().__init__()
+        self.fast = EMA(fast_period)
+        self.slow = EMA(slow_period)
+        self.signal_line = EMA(signal_period)
+        self.signal = math.nan
+        self.histogram = math.nan
+
+    def update(self, close):
+        macd = self.fast.update(close) - self.slow.update(close)
+        self.signal = self.signal_line.update(macd)
+        self.histogram = macd - self.signal
+        return self._set_value(macd)
+
+
+class RollingMax(Indicator):
+    """
+    Maximum of the last period values, kept in a monotonic queue so each update is amortized O(1).
+    """
+    def __init__(self, period, min_periods=None):
+        super().__init__()
+        self.period = period
+        self.min_periods = period if min_periods is None else min_periods
+        self.candidates = deque()  # (position, value) with decreasing values
+        self.count = 0
+
+    def _dominates(self, value, candidate):
+        return value >= candidate
+
+    def update(self, value):
+        while self.candidates and self._dominates(value, self.candidates[-1][1]):
+            self.candidates.pop()
+        self.candidates.append((self.count, value))
+        self.count += 1
+        if self.candidates[0][0] <= self.count - 1 - self.period:
+            self.candidates.popleft()
+
+        if min(self.count, self.period) < self.min_periods:
+            return self._set_value(math.nan)
+        return self._set_value(self.candidates[0][1])
+
+
+class RollingMin(RollingMax):
+    """
+    Minimum of the last period values, kept in a monotonic queue so each update is amortized O(1).
+    """
+    def _dominates(self, value, candidate):
+        return value <= candidate
@@ -0,0 +1,53 @@
+import numpy as np
+
+
+class OpeningRangeState:
+    """
+    Per-symbol state of the OpeningRangeBreakoutStrategy as one NumPy array per field,
+    indexed by the symbol id in ids (the position of the symbol in the symbol list it was created for),
+    so the bars of all symbols at one time can be evaluated with array operations.
+
+    range_high/range_low are the opening range of the day (-inf/inf until the first bar of the day),
+    cumulative_tp_volume/cumulative_volume the running sums of the VWAP of the day, and stop_loss,
+    take_profit and bought the exit levels and position flag of the symbol.
+    """
+    def __init__(self, symbols):
+        self.ids = {symbol: symbol_id for symbol_id, symbol in enumerate(symbols)}
+        size = len(self.ids)
+
+        self.range_high = np.full(size, -np.inf)
+        self.range_low = np.full(size, np.inf)
+        self.cumulative_tp_volume = np.zeros(size)
+        self.cumulative_volume = np.zeros(size)
+        self.stop_loss = np.full(size, np.nan)
+        self.take_profit = np.full(size, np.nan)
+        self.bought = np.zeros(size, dtype=bool)
+
+    def start_new_day(self):
+        # the opening range and the VWAP start over every day, exit levels and positions carry over
+        self.range_high.fill(-np.inf)
+        self.range_low.fill(np.inf)
+        self.cumulative_tp_volume.fill(0.)
+        self.cumulative_volume.fill(0.)
+
+    def update_vwap(self, symbol_ids, high, low, close, volume):
+        """
+        Adds the bars of the symbols to their VWAP and returns it, NaN while there is no volume yet.
+        VWAP = Cumulative(Typical Price * Volume) / Cumulative(Volume), Typical Price = (High + Low + Close) / 3
+        """
+        self.cumulative_tp_volume[symbol_ids] += (high + low + close) / 3 * volume
+        self.cumulative_volume[symbol_ids] += volume
+
+        cumulative_volume = self.cumulative_volume[symbol_ids]
+        vwap = np.full(len(cumulative_volume), np.nan)
+        np.divide(self.cumulative_tp_volume[symbol_ids], cumulative_volume, out=vwap, where=cumulative_volume > 0)
+        return vwap
+
+    def update_opening_range(self, symbol_ids, high, low, stop_loss_margin):
+        """
+        Widens the opening range of the symbols by their bars and moves the stop loss below the range low.
+        """
+        # fmax/fmin ignore a NaN bar like the builtin max/min comparisons did
+        self.range_high[symbol_ids] = np.fmax(self.range_high[symbol_ids], high)
+        self.range_low[symbol_ids] = np.fmin(self.range_low[symbol_ids], low)
+        self.stop_loss[symbol_ids] = self.range_low[symbol_ids] * (1 - stop_loss_margin / 100)
@@ -5,7 +5,9 @@ import numpy as np
 import pandas as pd
 import config
 import helper
-from strategies.strategy import Strategy
+from events.enums.event_type import EventType
+from strategies.opening_range_state import OpeningRangeState
+from strategies.strategy import Strategy, VectorizedSignal
 import mplfinance as mpf
 
 class OpeningRangeBreakoutStrategy(Strategy):
@@ -16,21 +18,23 @@ class OpeningRangeBreakoutStrategy(Strategy):
 
         self.opening_range_bars = config.opening_range_window_bars
         self.opening_range_minutes = self.opening_range_bars * (self.data_handler.bar_granularity // 60)  # Convert bars to minutes
-        self.opening_ranges = self._initialize_opening_ranges()
-        self.vwap_data = self._initialize_vwap_data()
+        # opening ranges, VWAP sums, exit levels and positions of all symbols, indexed by symbol id
+        self.state = OpeningRangeState(self.data_handler.symbol_list)
+        # symbol ids and batch columns of the active symbols, see _get_batch_ids
+        self.batch_ids_key = None
+        self.batch_ids = None
         self.stop_loss_margin = config.stop_loss_percentage  # in percentage
         self.risk_reward_ratio = config.reward_risk_ratio  # Take Profit is this value times Stop Loss
         self.stop_loss_price = 0
 
         
     def post_data_fetch_setup(self):
-        for symbol in self.data_handler.symbol_list:
-            self.data_handler.all_data[symbol]["opening_range_high"] = np.nan
-            self.data_handler.all_data[symbol]["opening_range_low"] = np.nan
-            self.data_handler.all_data[symbol]["signal"] = None
-            self.data_handler.all_data[symbol]["take_profit"] = np.nan
-            self.data_handler.all_data[symbol]["stop_loss"] = np.nan
-            self.data_handler.all_data[symbol]["vwap"] = np.nan
+        self.plot_annotations.add_column("opening_range_high", np.nan)
+        self.plot_annotations.add_column("opening_range_low", np.nan)
+        self.plot_annotations.add_column("signal", None)
+        self.plot_annotations.add_column("take_profit", np.nan)
+        self.plot_annotations.add_column("stop_loss", np.nan)
+        self.plot_annotations.add_column("vwap", np.nan)
 
     
     # def _update_exit_levels(self, symbol, fill_price):
@@ -55,42 +59,14 @@ class OpeningRangeBreakoutStrategy(Strategy):
         if np.isnan(fill_price):
             return
         
-        stop_loss = self.exit_levels[symbol]['stop_loss']
+        symbol_id = self.state.ids[symbol]
+        stop_loss = self.state.stop_loss[symbol_id].item()
         if np.isnan(stop_loss):
             return
         
         stop_loss_distance = fill_price - stop_loss
         take_profit_price = fill_price + (stop_loss_distance * self.risk_reward_ratio)
-        self.exit_levels[symbol]['take_profit'] = take_profit_price
-
-    def _initialize_opening_ranges(self):
-        opening_ranges = {}
-        for symbol in self.data_handler.symbol_list:
-            opening_ranges[symbol] = {'high': -np.inf, 'low': np.inf}
-        return opening_ranges
-    
-    def _initialize_vwap_data(self):
-        vwap_data = {}
-        for symbol in self.data_handler.symbol_list:
-            vwap_data[symbol] = {'cumulative_tp_volume': 0.0, 'cumulative_volume': 0.0}
-        return vwap_data
-
-    def _calculate_vwap(self, symbol, bar):
-        """
-        Calculate VWAP (Volume Weighted Average Price) for the current bar.
-        VWAP = Cumulative(Typical Price * Volume) / Cumulative(Volume)
-        Typical Price = (High + Low + Close) / 3
-        """
-        typical_price = (bar.high + bar.low + bar.close) / 3
-        self.vwap_data[symbol]['cumulative_tp_volume'] += typical_price * bar.volume
-        self.vwap_data[symbol]['cumulative_volume'] += bar.volume
-
-        if self.vwap_data[symbol]['cumulative_volume'] > 0:
-            vwap = self.vwap_data[symbol]['cumulative_tp_volume'] / self.vwap_data[symbol]['cumulative_volume']
-        else:
-            vwap = np.nan
-
-        return vwap
+        self.state.take_profit[symbol_id] = take_profit_price
 
     def _check_entry_condition(self, symbol, bar, opening_range_high, vwap):
         """
@@ -106,7 +82,7 @@ class OpeningRangeBreakoutStrategy(Strategy):
             bool: True if entry conditions are met, False otherwise
         """
         # Already in position
-        if self.bought[symbol]:
+        if self.state.bought[self.state.ids[symbol]]:
             return False
 
         # Check breakout above opening range high
@@ -119,17 +95,28 @@ class OpeningRangeBreakoutStrategy(Strategy):
 
         return True
 
+    def buy(self, symbol, date, buy_price, quantity, reason):
+        self.state.bought[self.state.ids[symbol]] = True
+        return super().buy(symbol, date, buy_price, quantity, reason)
+
+    def sell(self, symbol, date, sell_price, quantity, reason):
+        self.state.bought[self.state.ids[symbol]] = False
+        return super().sell(symbol, date, sell_price, quantity, reason)
+
     #TODO: implement for real-time trading
     def on_order_filled(self, symbol, direction, fill_price):
         pass
 
     def process_start_of_new_day(self):
-        self.opening_ranges = self._initialize_opening_ranges()
-        self.vwap_data = self._initialize_vwap_data()
+        self.state.start_new_day()
 
 
     def calculate_signals(self, event):
-        if event.type == 'MARKET':
+        if event.type == EventType.MARKET:
+            if event.bars is not None:
+                self.calculate_signals_from_batch(event.bars)
+                return
+
             for symbol in self.data_handler.symbol_list_active:
 
                 five_sec_bar, is_new_bar, bar = self.fetch_latest_data(symbol, 1)
@@ -141,75 +128,276 @@ class OpeningRangeBreakoutStrategy(Strategy):
                     continue
                 
                 bar = bar[-1]  # Get the latest bar
+                self._process_bar(symbol, bar, helper.is_trading_cutoff_time(bar.datetime), self._get_opening_range_end(bar.datetime))
+
+    def _get_opening_range_end(self, current_time):
+        mkt_open_time = datetime.strptime(config.mkt_open_time, "%H:%M:%S")
+        market_open = current_time.replace(hour=mkt_open_time.hour, minute=mkt_open_time.minute, second=0, microsecond=0)
+        return market_open + timedelta(minutes=self.opening_range_minutes)
+
+    def _process_bar(self, symbol, bar, is_cutoff_time, opening_range_end):
+        state = self.state
+        symbol_id = [state.ids[symbol]]
+
+        # Calculate and store VWAP for current bar
+        vwap = state.update_vwap(symbol_id, bar.high, bar.low, bar.close, bar.volume)[0].item()
+        self.add_property_for_plotting(symbol, bar.datetime, "vwap", vwap)
+
+        # Check for market closing time
+        # If past cutoff time, sell all positions
+        if is_cutoff_time:
+            logging.info(f"Symbol: {symbol} - Market Closing -  Time: {bar.datetime}, Latest close: {bar.close}\n")
+
+            quantity = self.portfolio.current_positions[symbol]
+            if quantity > 0:
+                sell_price = bar.close
+                signal = self.sell(symbol, bar.datetime, sell_price, quantity, 'MKT CLOSING - CUT OFF TIME REACHED')
+                self.events.put(signal)
+            return
 
-                # Calculate and store VWAP for current bar
-                vwap = self._calculate_vwap(symbol, bar)
-                self.add_property_for_plotting(symbol, bar.datetime, "vwap", vwap)
+        # Update opening range if we're still within the opening period
+        if bar.datetime < opening_range_end:
+            state.update_opening_range(symbol_id, bar.high, bar.low, self.stop_loss_margin)
+            return
 
-                # Check for market closing time
-                # If past cutoff time, sell all positions
-                if helper.is_trading_cutoff_time(bar.datetime):
-                    logging.info(f"Symbol: {symbol} - Market Closing -  Time: {bar.datetime}, Latest close: {bar.close}\n")
+        # Skip if opening range hasn't been established
+        opening_range_high = state.range_high[symbol_id[0]].item()
+        if opening_range_high == -np.inf or state.range_low[symbol_id[0]] == np.inf:
+            return
 
-                    quantity = self.portfolio.current_positions[symbol]
-                    if quantity > 0:
-                        sell_price = bar.close
-                        signal = self.sell(symbol, bar.datetime, sell_price, quantity, 'MKT CLOSING - CUT OFF TIME REACHED')
-                        self.events.put(signal)
-                    continue
+        self.add_properties_for_plotting(symbol, bar)
 
-                current_time = bar.datetime
+        # Check for breakout above opening range high
+        if self._check_entry_condition(symbol, bar, opening_range_high, vwap):
+            buy_price = bar.close
+            self._update_take_profit_level(symbol, buy_price)
+            signal = self.buy(symbol, bar.datetime, buy_price, 2, f"Opening Range Breakout - High: {bar.high} > Opening Range High: {opening_range_high}")
+            self.events.put(signal)
 
-                # Check if we're still within the opening range period
-                mkt_open_time = datetime.strptime(config.mkt_open_time, "%H:%M:%S")
-                market_open = current_time.replace(hour=mkt_open_time.hour, minute=mkt_open_time.minute, second=0, microsecond=0)
-                opening_range_end = market_open + timedelta(minutes=self.opening_range_minutes)
+        elif state.bought[symbol_id[0]]:
+            stop_loss = state.stop_loss[symbol_id[0]].item()
+            take_profit = state.take_profit[symbol_id[0]].item()
 
-                # Update opening range if we're still within the opening period
-                if current_time < opening_range_end:
-                    self.opening_ranges[symbol]['high'] = max(self.opening_ranges[symbol]['high'], bar.high)
-                    self.opening_ranges[symbol]['low'] = min(self.opening_ranges[symbol]['low'], bar.low)
+            quantity = self.portfolio.current_positions.get(symbol, 0)
 
-                    opening_range_low = self.opening_ranges[symbol]['low']
-                    self.exit_levels[symbol]['stop_loss'] = opening_range_low * (1 - self.stop_loss_margin / 100)
-                    continue
+            if bar.low <= stop_loss:
+                signal = self.sell(symbol, bar.datetime, stop_loss, quantity, "Stop loss hit")
+                self.events.put(signal)
+                state.take_profit[symbol_id[0]] = np.nan
+            elif bar.high >= take_profit:
+                signal = self.sell(symbol, bar.datetime, take_profit, quantity, "Take profit hit")
+                self.events.put(signal)
+                state.take_profit[symbol_id[0]] = np.nan
 
-                # Skip if opening range hasn't been established
-                if self.opening_ranges[symbol]['high'] == -np.inf or self.opening_ranges[symbol]['low'] == np.inf:
-                    continue
+    def _get_batch_ids(self, bars):
+        """
+        Returns the active symbols that are in the batch with their symbol ids and batch columns,
+        worked out again only when the active symbols or the symbols of the batch change.
+        """
+        active_symbols = self.data_handler.symbol_list_active
+        if self.batch_ids_key is None or self.batch_ids_key[0] is not active_symbols or self.batch_ids_key[1] is not bars.symbols:
+            symbols = [symbol for symbol in active_symbols if symbol in bars.columns]
+            self.batch_ids_key = (active_symbols, bars.symbols)
+            self.batch_ids = (
+                symbols,
+                np.array([self.state.ids[symbol] for symbol in symbols], dtype=np.intp),
+                np.array([bars.columns[symbol] for symbol in symbols], dtype=np.intp),
+            )
+        return self.batch_ids
+
+    def calculate_signals_from_batch(self, bars):
+        """
+        calculate_signals for a MarketEvent carrying the bars of all symbols. The active symbols share
+        the bar time and their signals only depend on their own state, so VWAP, opening ranges, breakouts
+        and exits are evaluated for all of them with array operations. Signals are raised in the order of
+        symbol_list_active, as calculate_signals raises them.
+        """
+        symbols, symbol_ids, columns = self._get_batch_ids(bars)
+        if len(symbols) == 0:
+            return
 
-                self.add_properties_for_plotting(symbol, bar)
-                
-                opening_range_high = self.opening_ranges[symbol]['high']
+        state = self.state
+        date = bars.datetime
+        high = bars.high[columns]
+        low = bars.low[columns]
+        close = bars.close[columns]
 
-                # Check for breakout above opening range high
-                if self._check_entry_condition(symbol, bar, opening_range_high, vwap):
-                    buy_price = bar.close
-                    self._update_take_profit_level(symbol, buy_price)
-                    signal = self.buy(symbol, bar.datetime, buy_price, 2, f"Opening Range Breakout - High: {bar.high} > Opening Range High: {opening_range_high}")
-                    self.events.put(signal)
+        vwap = state.update_vwap(symbol_ids, high, low, close, bars.volume[columns])
+        self.plot_annotations.record_row(symbols, bars.index, "vwap", vwap)
+
+        # Check for market closing time
+        # If past cutoff time, sell all positions
+        if helper.is_trading_cutoff_time(date):
+            for symbol, latest_close in zip(symbols, close.tolist()):
+                logging.info(f"Symbol: {symbol} - Market Closing -  Time: {date}, Latest close: {latest_close}\n")
 
-                elif self.bought[symbol]:
-                    stop_loss = self.exit_levels[symbol]['stop_loss']
-                    take_profit = self.exit_levels[symbol]['take_profit']
+                quantity = self.portfolio.current_positions[symbol]
+                if quantity > 0:
+                    signal = self.sell(symbol, date, latest_close, quantity, 'MKT CLOSING - CUT OFF TIME REACHED')
+                    self.events.put(signal)
+            return
 
-                    quantity = self.portfolio.current_positions.get(symbol, 0)
+        # Update opening ranges if we're still within the opening period
+        if date < self._get_opening_range_end(date):
+            state.update_opening_range(symbol_ids, high, low, self.stop_loss_margin)
+            return
 
-                    if bar.low <= stop_loss:
-                        signal = self.sell(symbol, bar.datetime, stop_loss, quantity, "Stop loss hit")
-                        self.events.put(signal)
-                        self.exit_levels[symbol]['take_profit'] = np.nan
-                    elif bar.high >= take_profit:
-                        signal = self.sell(symbol, bar.datetime, take_profit, quantity, "Take profit hit")
-                        self.events.put(signal)
-                        self.exit_levels[symbol]['take_profit'] = np.nan
+        # Skip the symbols whose opening range hasn't been established
+        established = np.flatnonzero((state.range_high[symbol_ids] != -np.inf) & (state.range_low[symbol_ids] != np.inf))
+        if len(established) < len(symbols):
+            symbols = [symbols[i] for i in established]
+            symbol_ids = symbol_ids[established]
+            high, low, close, vwap = high[established], low[established], close[established], vwap[established]
+
+        opening_range_high = state.range_high[symbol_ids]
+        stop_loss = state.stop_loss[symbol_ids]
+        take_profit = state.take_profit[symbol_ids]
+        bought = state.bought[symbol_ids]
+
+        self.plot_annotations.record_row(symbols, bars.index, "opening_range_high", opening_range_high)
+        self.plot_annotations.record_row(symbols, bars.index, "opening_range_low", state.range_low[symbol_ids])
+        self.plot_annotations.record_row(symbols, bars.index, "stop_loss", stop_loss)
+        self.plot_annotations.record_row(symbols, bars.index, "take_profit", take_profit)
+
+        # same conditions as _check_entry_condition and the exits of _process_bar, NaN levels never trigger
+        entry = ~bought & ~(high <= opening_range_high)
+        if config.enable_vwap_entry_condition:
+            entry &= ~(close <= vwap)
+        stop_loss_hit = bought & (low <= stop_loss)
+        take_profit_hit = bought & ~stop_loss_hit & (high >= take_profit)
+
+        for i in np.flatnonzero(entry | stop_loss_hit | take_profit_hit):
+            symbol = symbols[i]
+            if entry[i]:
+                buy_price = close[i].item()
+                self._update_take_profit_level(symbol, buy_price)
+                signal = self.buy(symbol, date, buy_price, 2, f"Opening Range Breakout - High: {high[i].item()} > Opening Range High: {opening_range_high[i].item()}")
+            else:
+                quantity = self.portfolio.current_positions.get(symbol, 0)
+                if stop_loss_hit[i]:
+                    signal = self.sell(symbol, date, stop_loss[i].item(), quantity, "Stop loss hit")
+                else:
+                    signal = self.sell(symbol, date, take_profit[i].item(), quantity, "Take profit hit")
+                state.take_profit[symbol_ids[i]] = np.nan
+            self.events.put(signal)
 
     
+    def calculate_signals_vectorized(self, symbol, bars, sessions, active):
+        """
+        Vectorized counterpart of calculate_signals. VWAP, opening range and entry conditions are
+        computed for a whole session at once, then the session is walked from one entry or exit to the next.
+        """
+        signals = []
+        plotting = {"vwap": [], "opening_range_high": [], "opening_range_low": [], "stop_loss": [], "take_profit": []}
+
+        seconds_of_day = helper.get_seconds_of_day(bars.datetime)
+        cutoff_seconds = helper.time_string_to_seconds(helper.DAILY_TRADING_END_TIME, "%H:%M")
+        mkt_open_time = datetime.strptime(config.mkt_open_time, "%H:%M:%S")
+        opening_range_end = mkt_open_time.hour * 3600 + mkt_open_time.minute * 60 + self.opening_range_minutes * 60
+
+        symbol_id = self.state.ids[symbol]
+        bought = bool(self.state.bought[symbol_id])
+        quantity = self.portfolio.current_positions[symbol]
+        stop_loss = self.state.stop_loss[symbol_id].item()
+        take_profit = self.state.take_profit[symbol_id].item()
+
+        for (start, end, _), is_active in zip(sessions, active):
+            if not is_active:
+                continue
+
+            high = bars.high[start:end]
+            low = bars.low[start:end]
+            close = bars.close[start:end]
+            seconds = seconds_of_day[start:end]
+
+            # opening range and vwap are reset at the start of every day
+            typical_price = (high + low + close) / 3
+            cumulative_tp_volume = np.cumsum(typical_price * bars.volume[start:end])
+            cumulative_volume = np.cumsum(bars.volume[start:end].astype(float))
+            vwap = np.full(end - start, np.nan)
+            np.divide(cumulative_tp_volume, cumulative_volume, out=vwap, where=cumulative_volume > 0)
+            plotting["vwap"].append((np.arange(start, end), vwap))
+
+            is_cutoff = seconds >= cutoff_seconds
+            in_opening_range = ~is_cutoff & (seconds < opening_range_end)
+            after_opening_range = np.flatnonzero(~is_cutoff & ~in_opening_range)
+
+            opening_range_high, opening_range_low = -np.inf, np.inf
+            if in_opening_range.any():
+                # plain floats, like the Bar values calculate_signals works with
+                opening_range_high = float(high[in_opening_range].max())
+                opening_range_low = float(low[in_opening_range].min())
+                stop_loss = opening_range_low * (1 - self.stop_loss_margin / 100)
+
+            if opening_range_high != -np.inf and opening_range_low != np.inf and len(after_opening_range) > 0:
+                entry = ~(high[after_opening_range] <= opening_range_high)
+                if config.enable_vwap_entry_condition:
+                    entry &= ~(close[after_opening_range] <= vwap[after_opening_range])
+
+                # take profit level as plotted, i.e. before the bar is processed
+                take_profit_levels = np.empty(len(after_opening_range))
+                i = 0
+                while i < len(after_opening_range):
+                    bars_left = after_opening_range[i:]
+                    if not bought:
+                        hits = np.flatnonzero(entry[i:])
+                    else:
+                        hits = np.flatnonzero((low[bars_left] <= stop_loss) | (high[bars_left] >= take_profit))
+
+                    if len(hits) == 0:
+                        take_profit_levels[i:] = take_profit
+                        break
+
+                    j = i + hits[0]
+                    take_profit_levels[i:j + 1] = take_profit
+                    bar = after_opening_range[j]
+
+                    if not bought:
+                        buy_price = float(close[bar])
+                        if not np.isnan(stop_loss):
+                            take_profit = buy_price + ((buy_price - stop_loss) * self.risk_reward_ratio)
+                        signals.append(VectorizedSignal(start + bar, 'BUY', buy_price, 2, f"Opening Range Breakout - High: {high[bar]} > Opening Range High: {opening_range_high}"))
+                        bought = True
+                        quantity += 2
+                    else:
+                        if low[bar] <= stop_loss:
+                            signals.append(VectorizedSignal(start + bar, 'SELL', stop_loss, quantity, "Stop loss hit"))
+                        else:
+                            signals.append(VectorizedSignal(start + bar, 'SELL', take_profit, quantity, "Take profit hit"))
+                        take_profit = np.nan
+                        bought = False
+                        quantity = 0.0
+                    i = j + 1
+
+                indices = start + after_opening_range
+                plotting["opening_range_high"].append((indices, np.full(len(indices), opening_range_high)))
+                plotting["opening_range_low"].append((indices, np.full(len(indices), opening_range_low)))
+                plotting["stop_loss"].append((indices, np.full(len(indices), stop_loss)))
+                plotting["take_profit"].append((indices, take_profit_levels))
+
+            cutoff_bars = np.flatnonzero(is_cutoff)
+            if len(cutoff_bars) > 0 and quantity > 0:
+                bar = cutoff_bars[0]
+                signals.append(VectorizedSignal(start + bar, 'SELL', float(close[bar]), quantity, 'MKT CLOSING - CUT OFF TIME REACHED'))
+                bought = False
+                quantity = 0.0
+
+        self.state.stop_loss[symbol_id] = stop_loss
+        self.state.take_profit[symbol_id] = take_profit
+
+        for property_name, values in plotting.items():
+            if values:
+                indices, property_values = zip(*values)
+                self.add_property_for_plotting_vectorized(symbol, property_name, np.concatenate(indices), np.concatenate(property_values))
+
+        return signals
+
     def add_properties_for_plotting(self, symbol, bar):
-        self.add_property_for_plotting(symbol, bar.datetime, "opening_range_high", self.opening_ranges[symbol]['high'])
-        self.add_property_for_plotting(symbol, bar.datetime, "opening_range_low", self.opening_ranges[symbol]['low'])
-        self.add_property_for_plotting(symbol, bar.datetime, "stop_loss", self.exit_levels[symbol]['stop_loss'])
-        self.add_property_for_plotting(symbol, bar.datetime, "take_profit", self.exit_levels[symbol]['take_profit'])
+        symbol_id = self.state.ids[symbol]
+        self.add_property_for_plotting(symbol, bar.datetime, "opening_range_high", self.state.range_high[symbol_id])
+        self.add_property_for_plotting(symbol, bar.datetime, "opening_range_low", self.state.range_low[symbol_id])
+        self.add_property_for_plotting(symbol, bar.datetime, "stop_loss", self.state.stop_loss[symbol_id])
+        self.add_property_for_plotting(symbol, bar.datetime, "take_profit", self.state.take_profit[symbol_id])
                 
     
     def plot(self):
@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+
+class PlotAnnotations:
+    """
+    Values the strategies draw on the candlestick charts (signals, exit levels, indicators),
+    kept per symbol in one preallocated array per column with a slot for every bar of all_data.
+
+    Recording a value looks the bar up by binary search instead of scanning the date column of
+    the DataFrame, and the annotated frames are only built when the charts and all_data files are written.
+    When all_data of a symbol is replaced by a frame of other bars (the live data handler appends every
+    new bar), the data handler calls invalidate, the bar times are read again on the next record and the
+    recorded values move to the slots of their bar times.
+    """
+    def __init__(self, data_handler, enabled=True):
+        self.data_handler = data_handler
+        self.enabled = enabled
+        self.defaults = {}
+        self.bar_times = {}
+        # bar times the columns of a symbol are laid out for, kept from invalidate until the next sync
+        self.replaced_bar_times = {}
+        self.columns = {}
+
+    def add_column(self, name, default):
+        """
+        Declares a column every annotated frame gets, holding default on the bars nothing was recorded for.
+        """
+        self.defaults[name] = default
+
+    def invalidate(self, symbol):
+        """
+        Called by the data handler after it replaced all_data of the symbol with a frame of other bars.
+        """
+        bar_times = self.bar_times.pop(symbol, None)
+        if bar_times is not None:
+            self.replaced_bar_times.setdefault(symbol, bar_times)
+
+    def _get_bar_times(self, symbol):
+        bar_times = self.bar_times.get(symbol)
+        if bar_times is None:
+            bar_times = self.data_handler.all_data[symbol]['date'].to_numpy(dtype='datetime64[ns]')
+            old_bar_times = self.replaced_bar_times.pop(symbol, None)
+            if old_bar_times is not None and symbol in self.columns:
+                self._move_columns(symbol, old_bar_times, bar_times)
+            self.bar_times[symbol] = bar_times
+        return bar_times
+
+    def _move_columns(self, symbol, old_bar_times, new_bar_times):
+        # values of bars that are not in the new frame anymore are dropped, new bars get the default
+        positions = new_bar_times.searchsorted(old_bar_times)
+        clipped = np.minimum(positions, len(new_bar_times) - 1)
+        found = (positions < len(new_bar_times)) & (new_bar_times[clipped] == old_bar_times) if len(new_bar_times) else np.zeros(len(old_bar_times), dtype=bool)
+        columns = self.columns[symbol]
+        for name, column in columns.items():
+            new_column = self._new_column(name, len(new_bar_times))
+            new_column[positions[found]] = column[found]
+            columns[name] = new_column
+
+    def _new_column(self, name, size):
+        default = self.defaults.get(name, np.nan)
+        if default is None:
+            return np.full(size, None, dtype=object)
+        return np.full(size, default, dtype=np.float64)
+
+    def _get_column(self, symbol, name):
+        bar_times = self._get_bar_times(symbol)
+        columns = self.columns.setdefault(symbol, {})
+        column = columns.get(name)
+        if column is None:
+            column = self._new_column(name, len(bar_times))
+            columns[name] = column
+        return column
+
+    def record(self, symbol, date, name, value):
+        """
+        Sets the column value of the bar at date, nothing happens if the symbol has no bar at that time.
+        """
+        if not self.enabled:
+            return
+
+        bar_times = self._get_bar_times(symbol)
+        column = self._get_column(symbol, name)
+        time = pd.Timestamp(date).to_datetime64()
+        index = bar_times.searchsorted(time)
+        if index < len(bar_times) and bar_times[index] == time:
+            column[index] = value
+
+    def record_at(self, symbol, name, indices, values):
+        """
+        Sets the column values of the bars at the given positions in all_data.
+        """
+        if not self.enabled:
+            return
+
+        self._get_column(symbol, name)[indices] = values
+
+    def record_row(self, symbols, index, name, values):
+        """
+        Sets the column values of the symbols at the bar at position index in all_data, values are aligned with symbols.
+        """
+        if not self.enabled:
+            return
+
+        for symbol, value in zip(symbols, values):
+            self._get_column(symbol, name)[index] = value
+
+    def get_symbol_columns(self, symbols):
+        return {symbol: self.columns[symbol] for symbol in symbols if symbol in self.columns}
+
+    def update(self, symbol_columns):
+        """
+        Takes over the columns recorded for other symbols, e.g. by the workers of the sharded backtest.
+        """
+        self.columns.update(symbol_columns)
+
+    def annotate(self, symbol, df):
+        """
+        Returns a copy of the bars of the symbol with the declared columns first and the other recorded columns after them.
+        """
+        df = df.copy()
+        if symbol in self.replaced_bar_times and symbol in self.columns:
+            self._get_bar_times(symbol)
+        columns = self.columns.get(symbol, {})
+        for name, default in self.defaults.items():
+            df[name] = columns[name] if name in columns else default
+        for name, column in columns.items():
+            if name not in self.defaults:
+                df[name] = column
+        return df
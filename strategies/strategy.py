@@ -1,13 +1,19 @@
 from abc import ABC, abstractmethod
+from collections import namedtuple
 import logging
 import os
 import shutil
 import numpy as np
 import pandas as pd
 from events.signal_event import SignalEvent
+import config
 import helper
+from strategies.plot_annotations import PlotAnnotations
 from trade import Trade
 
+# Signal produced by calculate_signals_vectorized, index is the position of the bar in the symbol's BarArrays
+VectorizedSignal = namedtuple('VectorizedSignal', ['index', 'direction', 'price', 'quantity', 'reason'])
+
 class Strategy(ABC):
     def __init__(self, data_handler, events, portfolio, cutoff_time):
         self.data_handler = data_handler
@@ -21,6 +27,7 @@ class Strategy(ABC):
         self.last_aggregated_bar = self._setup_last_aggregated_bar()
         self.trades = []
         self.active_trades = self._initialize_active_trades()
+        self.plot_annotations = PlotAnnotations(data_handler, config.enable_plot_annotations)
 
 
     @abstractmethod
@@ -39,6 +46,23 @@ class Strategy(ABC):
     def process_start_of_new_day(self):
         pass
 
+    def calculate_signals_vectorized(self, symbol, bars, sessions, active):
+        """
+        Evaluates the strategy for one symbol over the whole backtest at once, used by the
+        vectorized backtest engine. Must produce the same signals calculate_signals would
+        raise bar by bar.
+
+        Args:
+            symbol (str): The stock symbol.
+            bars (BarArrays): The full bar history of the symbol.
+            sessions (list): (start, end, is_new_day) index ranges into bars, one per trading day of the backtest.
+            active (list): Whether the symbol is in symbol_list_active during each session.
+
+        Returns:
+            list: VectorizedSignal objects in bar order.
+        """
+        raise NotImplementedError(f"{self.name} does not support the vectorized backtest engine")
+
     def fetch_latest_data(self, symbol, qty=0):
         if helper.IS_BACKTEST:
             is_new_bar = True
@@ -161,9 +185,10 @@ class Strategy(ABC):
             self.active_trades[symbol] = None
 
     def add_property_for_plotting(self, symbol, date, property_name, property_value):
-        dt = pd.Timestamp(date)
-        all_data_df = self.data_handler.all_data[symbol]
-        all_data_df.loc[all_data_df['date'] == dt, property_name] = property_value
+        self.plot_annotations.record(symbol, date, property_name, property_value)
+
+    def add_property_for_plotting_vectorized(self, symbol, property_name, indices, property_values):
+        self.plot_annotations.record_at(symbol, property_name, indices, property_values)
 
     def strategy_performance(self):
         self.save_trades_to_csv()
@@ -276,6 +301,10 @@ class Strategy(ABC):
         }
     
     def plot_candlestick(self):
+        if not self.plot_annotations.enabled:
+            logging.info("Plot annotations are disabled, skipping the all_data files and candlestick charts.")
+            return
+
         output_dir_all_data = "all_data"
         if os.path.exists(output_dir_all_data):
             shutil.rmtree(output_dir_all_data)
@@ -287,6 +316,7 @@ class Strategy(ABC):
         os.makedirs(output_dir_charts)
 
         for key, df in self.data_handler.all_data.items():
+            df = self.plot_annotations.annotate(key, df)
             file_path_all_data = os.path.join(output_dir_all_data, key + ".xlsx")
             df.to_excel(file_path_all_data, index=False)
             self.plot_daily_candlestick(df, key, output_dir_charts)
\ No newline at end of file
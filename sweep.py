@@ -0,0 +1,197 @@
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+from datetime import datetime
+
+import pandas as pd
+
+import config
+import helper
+from data_handlers.bar_file_store import BarFileStore
+from data_handlers.enums.data_source import DataSource
+from data_handlers.historic_bar_file_data_handler import HistoricBarFileDataHandler
+from data_handlers.historic_db_data_handler import HistoricDBDataHandler
+from database_repository import DatabaseRepository
+from events.event_bus import DequeEventBus
+from filters import StockFilter
+from loop import BacktestDependencies
+from main import consume_data_needed_for_filter, initialize_execution_handler, print_exception, run_backtest
+from portfolio import NaivePortfolio
+from strategies.ema import EMAStrategy
+from strategies.orb_strategy import OpeningRangeBreakoutStrategy
+
+
+STRATEGIES = {
+    'orb': OpeningRangeBreakoutStrategy,
+    'ema': EMAStrategy,
+}
+
+# These decide which bars are loaded (or are copied into helper at import time),
+# so they can not change between runs that share the same data.
+DATA_PARAMETERS = {
+    'engine_name', 'db_management_engine_name', 'bar_granularity', 'daily_cutoff_time_str',
+    'backtest_end_date_str', 'backtest_time_period', 'filter_long_sma', 'num_of_stocks',
+    'mkt_open_time', 'mkt_close_time', 'daily_trading_end_time', 'is_backtest',
+    'dst_date_change_start', 'dst_date_change_end', 'bar_file_dir',
+}
+
+# Filled in the parent before the pool is created and handed to each worker once.
+_sweep_data = {}
+
+
+def expand_parameter_grid(parameter_grid):
+    """
+    Turns {"stop_loss_percentage": [3, 5], "reward_risk_ratio": [2, 3]} into one dict per combination.
+    """
+    for name, values in parameter_grid.items():
+        if not hasattr(config, name):
+            raise Exception(f"Unknown config parameter in sweep grid: {name}")
+        if name in DATA_PARAMETERS:
+            raise Exception(f"{name} changes the loaded data and can not be swept.")
+        if not isinstance(values, list):
+            parameter_grid[name] = [values]
+
+    names = list(parameter_grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*parameter_grid.values())]
+
+
+def load_sweep_data(strategy_name):
+    """
+    Fetches float data and the aggregated bars of all stocks once, the same way main() does for a single backtest.
+    The float filter is applied per run, so bars are loaded for every stock.
+    """
+    bar_granularity = helper.convert_bar_granularity_to_seconds(config.bar_granularity)
+    daily_cutoff_time_str = config.daily_cutoff_time_str or helper.DAILY_TRADING_END_TIME
+    cutoff_time = datetime.strptime(daily_cutoff_time_str, "%H:%M")
+    duration_for_hist_data = config.backtest_time_period + config.filter_long_sma
+    backtest_end_date = datetime.strptime(config.backtest_end_date_str, "%Y-%m-%d %H:%M:%S")
+    backtest_start_date = helper.get_weekday_before(backtest_end_date, config.backtest_time_period)
+    last_timestamp_before_backtest = (helper.get_weekday_before(backtest_start_date, 1)).replace(hour=cutoff_time.hour,
+                                                                                                 minute=cutoff_time.minute)
+
+    if cutoff_time.minute * 60 % bar_granularity != 0:
+        raise Exception("Cutoff time minutes must align with bar granularity time steps.")
+
+    database_repository = DatabaseRepository(config.engine_name)
+    tickers = database_repository.get_stocks(config.num_of_stocks)
+
+    if config.bar_file_dir:
+        data_handler = HistoricBarFileDataHandler(DequeEventBus(), tickers, database_repository, BarFileStore(config.bar_file_dir), bar_granularity)
+    else:
+        data_handler = HistoricDBDataHandler(DequeEventBus(), tickers, database_repository, bar_granularity)
+    data_handler.fetch_float_data()
+    hist_data_start = helper.get_weekday_before(backtest_end_date, duration_for_hist_data)
+    data_handler.fetch_historical_ohlcv_data(hist_data_start, backtest_end_date)
+
+    return {
+        'strategy_name': strategy_name,
+        'tickers': tickers,
+        'fundamental_data': data_handler.fundamental_data,
+        'bar_arrays': data_handler.get_bar_arrays(),
+        'bar_granularity': bar_granularity,
+        'cutoff_time': cutoff_time,
+        'last_timestamp_before_backtest': last_timestamp_before_backtest,
+    }
+
+
+def init_worker(sweep_data):
+    global _sweep_data
+    _sweep_data = sweep_data
+    # per bar info logging and chart values of hundreds of runs would only slow the workers down
+    logging.getLogger().setLevel(logging.WARNING)
+    config.enable_plot_annotations = False
+
+
+def run_backtest_for_parameters(parameters):
+    """
+    Runs one backtest on the shared bars with the given config values and returns its summary stats and trade metrics.
+    """
+    for name, value in parameters.items():
+        setattr(config, name, value)
+
+    bar_granularity = _sweep_data['bar_granularity']
+    cutoff_time = _sweep_data['cutoff_time']
+
+    try:
+        events = DequeEventBus()
+        data_handler = HistoricDBDataHandler(events, _sweep_data['tickers'], None, bar_granularity)
+        data_handler.fundamental_data = _sweep_data['fundamental_data']
+
+        portfolio = NaivePortfolio(data_handler, events, 'ema', filename="sweep")
+        strategy = STRATEGIES[_sweep_data['strategy_name']](data_handler, events, portfolio, cutoff_time=60 - cutoff_time.minute)
+        portfolio.strategy_name = strategy.name
+        execution_handler = initialize_execution_handler(events, True, strategy, None)
+
+        stock_filter = None
+        tickers = data_handler.symbol_list
+        if config.is_filter_enabled:
+            stock_filter = StockFilter(
+                data_handler, cutoff_time, sma_long_period=config.filter_long_sma, sma_short_period=config.filter_short_sma, bar_granularity=bar_granularity
+            )
+            tickers = stock_filter.float_filter()
+
+        data_handler.load_bar_arrays({
+            symbol: arrays for symbol, arrays in _sweep_data['bar_arrays'].items() if symbol in tickers
+        })
+        if len(data_handler.symbol_list) == 0:
+            raise Exception("No stocks available after initial data fetch.")
+        strategy.post_data_fetch_setup()
+
+        consume_data_needed_for_filter(data_handler, events, _sweep_data['last_timestamp_before_backtest'])
+
+        backtest_dependencies = BacktestDependencies(
+            events=events,
+            data=data_handler,
+            portfolio=portfolio,
+            strategy=strategy,
+            execution_handler=execution_handler,
+            stock_filter=stock_filter,
+            tickers=data_handler.symbol_list,
+            bar_size_in_sec=bar_granularity,
+            is_backtest=True,
+            generate_reports=False
+        )
+        run_backtest(backtest_dependencies, DataSource.DB)
+
+        return {**parameters, **portfolio.compute_summary_stats(bar_granularity), **strategy.compute_trade_metrics()}
+
+    except Exception as e:
+        print_exception(e)
+        return {**parameters, "error": str(e)}
+
+
+def run_sweep(parameter_grid, strategy_name='orb', processes=None, output_file="performance/sweep_results.csv"):
+    if not helper.IS_BACKTEST:
+        raise Exception("Parameter sweeps are only available for backtests.")
+
+    combinations = expand_parameter_grid(parameter_grid)
+    processes = min(processes or os.cpu_count(), len(combinations))
+    logging.info(f"Running {len(combinations)} backtests of the {strategy_name} strategy on {processes} processes")
+
+    sweep_data = load_sweep_data(strategy_name)
+
+    with multiprocessing.Pool(processes, initializer=init_worker, initargs=(sweep_data,)) as pool:
+        results = pool.map(run_backtest_for_parameters, combinations, chunksize=1)
+
+    results = pd.DataFrame(results)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    results.to_csv(output_file, index=False)
+    logging.info(f"Sweep results written to {output_file}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run one backtest per combination of a config parameter grid.")
+    parser.add_argument('grid', help='JSON file mapping config parameter names to lists of values, see sweep_grid.sample.json')
+    parser.add_argument('--strategy', choices=STRATEGIES.keys(), default='orb')
+    parser.add_argument('--processes', type=int, default=None, help='defaults to one process per core')
+    parser.add_argument('--output', default="performance/sweep_results.csv")
+    args = parser.parse_args()
+
+    with open(args.grid) as grid_file:
+        grid = json.load(grid_file)
+
+    run_sweep(grid, args.strategy, args.processes, args.output)